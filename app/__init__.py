@@ -1,30 +1,93 @@
-from flask import Flask, jsonify, make_response
+from flask import Flask, current_app, jsonify, make_response
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as _FlaskSession
+from app.read_routing import reads_from_replica
 
-db = SQLAlchemy()
+class Session(_FlaskSession):
+    """Flask-SQLAlchemy's session, with two changes:
 
-def create_app():
+    * a `bind` given to the sessionmaker wins over the app's engine when it is a
+      connection of that engine. test_run.py binds every session to one connection
+      and rolls its outer transaction back after each test.
+    * the reads of read-only requests go to the read engine (app.read_routing)."""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.bind is not None and self.bind.engine is self._db.engine:
+            return self.bind
+        if bind is None and reads_from_replica(self, clause):
+            return current_app.extensions['read_engine']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': Session})
+
+def create_app(config=None):
+    """App factory. `config` (a dict) overrides the defaults from config.Config / the environment."""
     app = Flask(__name__)
     
-    # Database Config
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///subscriptions.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Config
+    app.config.from_object('config.Config')
+    if config:
+        app.config.update(config)
 
+    # Database
+    from app.engine import engine_options, install_sqlite_pragmas, create_read_engine
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config)
+        read_engine = create_read_engine(app.config, db.engine.url)  # SQLite paths already resolved against instance/
+
+    # Reads of read-only requests go to the read engine
+    from app import read_routing
+    read_routing.init_app(app, read_engine)
 
     # Register Blueprints
     from app.routes.subscription import bp as sub_bp 
     from app.routes.category import bp as cat_bp 
     from app.routes.analytics import bp as analytics_bp
     from app.routes.budgets import bp as budget_bp
+    from app.routes.system import bp as system_bp
 
     app.register_blueprint(sub_bp)
     app.register_blueprint(cat_bp)
     app.register_blueprint(analytics_bp)
     app.register_blueprint(budget_bp)
+    app.register_blueprint(system_bp)
 
-    with app.app_context():
-        db.create_all()
+    # Session hooks (rollup, change log, data versions, cache invalidation) and the response cache
+    from app import rollup, history, versioning, response_cache, alerts
+    response_cache.init_app(app)
+
+    # Per-client token buckets for the expensive read endpoints
+    from app import rate_limit
+    rate_limit.init_app(app)
+
+    # Budget health is re-evaluated off the request path (worker thread or `flask subs alerts-worker`)
+    alerts.init_app(app)
+
+    # orjson-backed jsonify() when available (same bytes as the default provider)
+    if app.config['FAST_JSON']:
+        from app.serialization import FastJSONProvider
+        app.json = FastJSONProvider(app)
+
+    # Opt-in per-request SQL / serialization timing (after read routing, whose engine it also times,
+    # and before the request hooks registered below, so it sees them)
+    from app import instrumentation
+    instrumentation.init_app(app)
+
+    # Resolve the acting user up front so a malformed X-User-Id fails before any work
+    from app.tenancy import current_user_id
+
+    @app.before_request
+    def resolve_user():
+        current_user_id()
+
+    from app.cli import subs_cli
+    app.cli.add_command(subs_cli)
+
+    # Schema creation is opt-in; existing databases are upgraded with `flask subs migrate`
+    if app.config['AUTO_CREATE_SCHEMA']:
+        with app.app_context():
+            db.create_all()
 
     # Errors Handlers
     @app.errorhandler(400)
@@ -40,6 +103,13 @@ def create_app():
     def internal_error(error):
         return make_response(jsonify({'error': 'Internal Server Error', 'message': str(error)}), 500)
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = make_response(jsonify({'error': 'Too Many Requests', 'message': str(error.description)}), 429)
+        if getattr(error, 'retry_after', None) is not None:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
     @app.errorhandler(409)
     def conflict(error):
         message = error.description if error.description else "Duplicate Subscription Entry"
@@ -0,0 +1,245 @@
+"""Budget alerting: a queue of users to re-evaluate, a worker that drains it, and pluggable sinks.
+
+A commit that writes a user's subscriptions or budget enqueues that user in
+budget_job, inside the same transaction. There is one row per user, so a burst
+of writes becomes one evaluation. The worker drains the queue, recomputes health
+from the spend rollup, stores it in budget_status and passes every label change
+to the sinks. GET /budgets serves the stored status while no job is pending for
+the user. Storing a status bumps the user's 'budget_status' DataVersion
+(app.versioning), so a /budgets response cached or validated before it, even one
+read between claim() and evaluate(), is not served again.
+
+Workers: ALERTS_WORKER='thread' runs one inside the app process, started by the
+first commit that queues work and then woken after each such commit (not with
+in-memory SQLite). 'none' leaves the queue to `flask subs alerts-worker` in a
+separate process. Sinks: ALERT_SINKS, a comma-separated list of 'log', 'file'
+(ALERT_FILE_PATH, JSON lines) and 'webhook' (ALERT_WEBHOOK_URL)."""
+import json
+import threading
+import time
+import urllib.request
+from datetime import date
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update, delete, exists
+from sqlalchemy.engine import make_url
+from app import db, versioning  # imported first so its before_commit hook (committed_tables) runs before ours
+from app.engine import is_memory_sqlite
+from app.fx import fx_table
+from app.history import utcnow
+from app.models import Budget, BudgetStatus, BudgetJob
+from app.money import from_cents, twelfths_to_cents
+from app.queries import active_monthly_spend
+
+WATCHED_TABLES = {'subscription', 'budget'}
+BATCH_SIZE = 500
+
+def budget_health(monthly_limit_cents, current_spend_cents):
+    """(remaining cents, usage percent, health label) of a monthly limit at the given spend, both in cents."""
+    remaining = monthly_limit_cents - current_spend_cents
+    usage_percent = current_spend_cents * 100 / monthly_limit_cents if monthly_limit_cents > 0 else 0
+
+    # thresholds compared in integers, so a spend right at 85% always gets the same label
+    label = "Good"
+    if monthly_limit_cents > 0 and current_spend_cents > monthly_limit_cents: label = "Over Budget"
+    elif monthly_limit_cents > 0 and current_spend_cents * 100 > monthly_limit_cents * 85: label = "Warning"
+    return remaining, usage_percent, label
+
+# --- Queue ---
+
+def enqueue(session, user_ids):
+    now = utcnow()
+    for user_id in sorted(user_ids):
+        stmt = update(BudgetJob.__table__).where(BudgetJob.user_id == user_id).values(requested_at=now)
+        if session.execute(stmt).rowcount == 0:
+            session.add(BudgetJob(user_id=user_id, requested_at=now))
+    session.flush()
+
+@event.listens_for(db.session, 'before_commit')
+def _enqueue_touched_users(session):
+    users = {user_id for table, user_id in session.info.get('committed_tables', ()) if table in WATCHED_TABLES}
+    if users:
+        enqueue(session, users)
+        session.info['budget_jobs_queued'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_worker(session):
+    if session.info.pop('budget_jobs_queued', False) and has_app_context():
+        worker = current_app.extensions.get('alerts_worker')
+        if worker is not None:
+            worker.notify()
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_queued(session):
+    session.info.pop('budget_jobs_queued', None)
+
+def claim(limit=BATCH_SIZE):
+    """Takes up to `limit` users off the queue and returns the ones this worker now owns."""
+    table = BudgetJob.__table__
+    jobs = db.session.execute(select(table.c.user_id, table.c.requested_at).order_by(table.c.requested_at).limit(limit)).all()
+    claimed = []
+    for user_id, requested_at in jobs:
+        # a newer write moved requested_at (the row stays queued), or another worker got here first
+        stmt = delete(table).where(table.c.user_id == user_id, table.c.requested_at == requested_at)
+        if db.session.execute(stmt).rowcount:
+            claimed.append(user_id)
+    db.session.commit()
+    return claimed
+
+def stored_status_query(user_id):
+    """The user's BudgetStatus unless an evaluation is pending; also run by the async views."""
+    pending = exists().where(BudgetJob.user_id == user_id)
+    return select(BudgetStatus).where(BudgetStatus.user_id == user_id, ~pending)
+
+def stored_status(user_id):
+    """The user's BudgetStatus, or None while an evaluation is pending (or none has run yet)."""
+    return db.session.execute(stored_status_query(user_id)).scalar()
+
+# --- Evaluation ---
+
+def evaluate(user_ids):
+    """Recomputes and stores budget health. Returns a transition dict for every label change."""
+    transitions = []
+    for user_id in user_ids:
+        budget = db.session.execute(select(Budget.monthly_limit_cents, Budget.currency).where(Budget.user_id == user_id)).first()
+        if budget is None:
+            continue
+        monthly_limit, currency = budget
+        spend = db.session.execute(active_monthly_spend(user_id)).all()
+        current_spend = twelfths_to_cents(fx_table().convert(spend, currency, date.today()))
+        _, usage_percent, label = budget_health(monthly_limit, current_spend)
+
+        status = db.session.get(BudgetStatus, user_id)
+        previous = status.health_label if status else None
+        if status is None:
+            status = BudgetStatus(user_id=user_id)
+            db.session.add(status)
+        status.monthly_limit_cents, status.currency, status.current_spend_cents = monthly_limit, currency, current_spend
+        status.health_label, status.evaluated_at = label, utcnow()
+
+        # a first evaluation only alerts when the budget is already in trouble
+        if label != (previous or "Good"):
+            transitions.append({
+                "user_id": user_id,
+                "previous": previous,
+                "current": label,
+                "monthly_limit": from_cents(monthly_limit),
+                "currency": currency,
+                "current_spend": from_cents(current_spend),
+                "usage_percent": round(usage_percent, 1),
+                "at": status.evaluated_at.isoformat(),
+            })
+    db.session.commit()
+    return transitions
+
+def drain(sinks, batch_size=BATCH_SIZE):
+    """Evaluates queued users until the queue is empty and delivers the transitions. Returns users evaluated."""
+    evaluated = 0
+    while True:
+        users = claim(batch_size)
+        if not users:
+            return evaluated
+        deliver(sinks, evaluate(users))
+        evaluated += len(users)
+
+# --- Sinks ---
+
+class LogSink:
+    def __init__(self, logger):
+        self.logger = logger
+
+    def __call__(self, transition):
+        self.logger.warning(
+            "Budget of user %s: %s -> %s (%s%% of %s %s)", transition['user_id'], transition['previous'],
+            transition['current'], transition['usage_percent'], transition['monthly_limit'], transition['currency']
+        )
+
+class FileSink:
+    """Appends each transition to a file as one JSON line."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, transition):
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(transition, sort_keys=True) + '\n')
+
+class WebhookSink:
+    """POSTs each transition as JSON. A stub: no retries, no signing."""
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, transition):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(transition).encode(), headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+def deliver(sinks, transitions):
+    for transition in transitions:
+        for sink in sinks:
+            try:
+                sink(transition)
+            except Exception:
+                current_app.logger.exception("Alert sink %r failed", sink)
+
+def sinks_from_config(app):
+    sinks = []
+    for name in filter(None, (part.strip() for part in app.config.get('ALERT_SINKS', 'log').split(','))):
+        if name == 'log':
+            sinks.append(LogSink(app.logger))
+        elif name == 'file':
+            sinks.append(FileSink(app.config['ALERT_FILE_PATH']))
+        elif name == 'webhook':
+            sinks.append(WebhookSink(app.config['ALERT_WEBHOOK_URL']))
+        else:
+            raise ValueError(f"Unknown alert sink: {name}")
+    return sinks
+
+# --- Worker ---
+
+class AlertWorker:
+    """Daemon thread that drains the queue when a commit wakes it, and every `poll` seconds for other processes' jobs."""
+    def __init__(self, app, sinks, coalesce, poll):
+        self.app, self.sinks, self.coalesce, self.poll = app, sinks, coalesce, poll
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def notify(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='budget-alerts', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stops the thread (if it was started) after its current pass."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll)
+            self._wake.clear()
+            if self._stopped:
+                return
+            time.sleep(self.coalesce)  # let the rest of a burst commit first
+            try:
+                with self.app.app_context():
+                    drain(self.sinks)
+            except Exception:
+                self.app.logger.exception("Budget alert worker failed")
+
+def init_app(app):
+    sinks = app.extensions['alert_sinks'] = sinks_from_config(app)
+    mode = app.config.get('ALERTS_WORKER', 'thread')
+    if mode not in ('thread', 'none'):
+        raise ValueError(f"Unknown ALERTS_WORKER: {mode}")
+    if mode == 'thread' and not is_memory_sqlite(make_url(app.config['SQLALCHEMY_DATABASE_URI'])):
+        app.extensions['alerts_worker'] = AlertWorker(
+            app, sinks, app.config.get('ALERTS_COALESCE_MS', 200) / 1000, app.config.get('ALERTS_POLL_SECONDS', 5)
+        )
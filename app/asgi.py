@@ -0,0 +1,405 @@
+"""ASGI entry point: async dashboard reads, everything else through the Flask app.
+
+GET /analytics, /budgets, /categories, /subscriptions and /subscriptions/<id> run
+as coroutines on an AsyncSession (SQLAlchemy asyncio with aiosqlite, asyncpg or
+aiomysql), so one process can hold many concurrent pollers. They reuse the
+statements in app.queries, the payload builders of the sync views, the ETags, the
+response cache (with its coalescing of concurrent misses) and the rate limits, and
+return the same bytes. Every other request (writes, export, errors) is handed to
+the Flask WSGI app in a worker thread. The async views do not use read routing
+(app.read_routing) or instrumentation (app.instrumentation); see the README.
+
+    uvicorn asgi:app
+
+Config: ASYNC_DATABASE_URL (default: the app's database URL with the async driver
+below). In-memory SQLite cannot be shared between the two engines."""
+import asyncio
+import io
+import re
+import sys
+from datetime import date
+from urllib.parse import parse_qsl
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags
+from app import create_app, db, fx
+from app.alerts import stored_status_query
+from app.engine import engine_options, install_sqlite_pragmas
+from app.http_cache import etag_for, cache_control
+from app.models import Budget, Category, DataVersion, Subscription, subscription_columns, subscription_row_to_json
+from app.money import twelfths_to_cents
+from app.pagination import page_args
+from app.queries import (
+    active_spend_by_category, active_subscription_breakdown, active_monthly_spend, subscription_listing
+)
+from app.rate_limit import CHARGED_ENVIRON_KEY, bucket_key
+from app.response_cache import cache_tag
+from app.routes.analytics import wants_breakdown, dashboard_payload
+from app.routes.budgets import budget_status_payload
+from app.routes.subscription import parse_fields
+from app.serialization import subscription_rows_response
+from app.tenancy import user_id_for
+from app.validation import parse_listing_args
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg', 'mysql': 'mysql+aiomysql'}
+
+def async_database_url(flask_app):
+    if flask_app.config.get('ASYNC_DATABASE_URL'):
+        return make_url(flask_app.config['ASYNC_DATABASE_URL'])
+    with flask_app.app_context():
+        url = db.engine.url  # SQLite paths already resolved against instance/
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+class _Delegate(Exception):
+    """Raised by an async view to have the Flask view answer the request instead."""
+
+class AsyncRequest:
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+        self.environ = {}  # extra WSGI environ for Flask when the request is handed over
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        url = async_database_url(flask_app)
+        options = engine_options(flask_app.config)
+        if url.get_backend_name() != 'sqlite':
+            options.pop('connect_args', None)  # statement timeouts are DBAPI-specific
+        self.engine = create_async_engine(url, **options)
+        if url.get_backend_name() == 'sqlite':
+            install_sqlite_pragmas(self.engine.sync_engine, flask_app.config)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        # path pattern -> (handler, endpoint of the equivalent Flask view)
+        self.routes = [
+            (re.compile(r'/analytics'), self.analytics, 'analytics.get_analytics_dashboard'),
+            (re.compile(r'/budgets'), self.budgets, 'budgets.get_budget_status'),
+            (re.compile(r'/categories'), self.categories, 'categories.get_categories'),
+            (re.compile(r'/subscriptions'), self.subscriptions, 'subscriptions.get_subscriptions'),
+            (re.compile(r'/subscriptions/(\d+)'), self.subscription, 'subscriptions.get_subscription'),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        environ = {}
+        if scope['method'] == 'GET':
+            for pattern, handler, endpoint in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    request = AsyncRequest(scope)
+                    response = await self._dispatch(request, handler, endpoint, *match.groups())
+                    if response is not None:
+                        return await self._send_response(send, response)
+                    environ = request.environ
+                    break
+        await self._call_flask(scope, receive, send, environ)
+
+    async def _dispatch(self, request, handler, endpoint, *args):
+        """Runs an async view. Returns None to let Flask answer instead (HTTP errors, cases left to Flask)."""
+        try:
+            with self.flask_app.app_context():
+                async with self.sessions() as session:
+                    user_id = user_id_for(request.headers, self.flask_app.config)
+                    return await handler(request, session, user_id, endpoint, *args)
+        except (_Delegate, HTTPException):
+            # the Flask view answers with its own error handlers; these GETs are safe to replay
+            return None
+        except Exception:
+            self.flask_app.logger.exception("Async view %s failed", endpoint)
+            raise
+
+    # --- Views (same responses as the Flask views they mirror) ---
+
+    async def analytics(self, request, session, user_id, endpoint):
+        await self._rate_limit(request, user_id, endpoint)
+        limit = after = None
+        if wants_breakdown(request.args):
+            limit, after = page_args(args=request.args)
+        table = await self._fx_table(session)
+        if 'currency' in request.args:
+            currency = fx.known_currency(request.args['currency'], table)
+            if currency is None:
+                raise _Delegate  # 400 with a message: let Flask write it
+        else:
+            currency = self.flask_app.config['REPORTING_CURRENCY']
+
+        async def build():
+            factors = table.factors(currency, date.today())
+            rows = (await session.execute(active_spend_by_category(user_id))).all()
+            if limit is None:
+                return dashboard_payload(rows, factors, currency)
+            page = (await session.execute(active_subscription_breakdown(user_id, limit, after))).all()
+            return dashboard_payload(rows, factors, currency, page, limit)
+        return await self._conditional(
+            request, session, user_id, ('subscription', 'category'), endpoint, build, cached=True, extra=fx.vary_for(table)
+        )
+
+    async def budgets(self, request, session, user_id, endpoint):
+        await self._rate_limit(request, user_id, endpoint)
+        table = await self._fx_table(session)
+
+        async def build():
+            # as get_budget_status: the alerts worker's stored evaluation first, then the rollup
+            status = (await session.execute(stored_status_query(user_id))).scalar()
+            if status:
+                return budget_status_payload(status, status.current_spend_cents)
+            budget = (await session.execute(select(Budget).where(Budget.user_id == user_id).limit(1))).scalar()
+            if not budget:
+                return budget_status_payload(None, 0)
+            spend = (await session.execute(active_monthly_spend(user_id))).all()
+            return budget_status_payload(budget, twelfths_to_cents(table.convert(spend, budget.currency, date.today())))
+        return await self._conditional(
+            request, session, user_id, ('budget', 'subscription', 'budget_status'), endpoint, build, cached=True, extra=fx.vary_for(table)
+        )
+
+    async def categories(self, request, session, user_id, endpoint):
+        async def build():
+            categories = (await session.execute(select(Category).where(Category.user_id == user_id))).scalars()
+            return [c.to_json() for c in categories]
+        return await self._conditional(request, session, user_id, ('category',), endpoint, build)
+
+    async def subscriptions(self, request, session, user_id, endpoint):
+        listing = parse_listing_args(request.args)
+        fields = parse_fields(request.args.get('fields'))
+        limit, after = page_args(default_limit=None, args=request.args)
+
+        async def build():
+            stmt = subscription_listing(user_id, fields, limit=limit, after=after, **listing)
+            rows = (await session.execute(stmt)).all()
+            response = subscription_rows_response(rows, fields)
+            if limit is not None and len(rows) == limit:
+                next_after = rows[-1].id
+                response.headers['X-Next-After'] = str(next_after)
+                urls = self.flask_app.url_map.bind('localhost', script_name=request.scope.get('root_path') or '/')
+                next_url = urls.build(endpoint, {**request.args.to_dict(), 'after': next_after})
+                response.headers['Link'] = f'<{next_url}>; rel="next"'
+            return response
+        return await self._conditional(request, session, user_id, ('subscription', 'category'), endpoint, build)
+
+    async def subscription(self, request, session, user_id, endpoint, sub_id):
+        async def build():
+            stmt = (
+                select(*subscription_columns())
+                .join(Category, Subscription.category_id == Category.id)
+                .where(Subscription.id == int(sub_id), Subscription.user_id == user_id)
+            )
+            row = (await session.execute(stmt)).first()
+            if row is None:
+                raise _Delegate  # 404 with a message: let Flask write it
+            return subscription_row_to_json(row)  # same dict as Subscription.to_json()
+        return await self._conditional(request, session, user_id, ('subscription', 'category'), endpoint, build)
+
+    # --- Rate limits, as app.rate_limit ---
+
+    async def _rate_limit(self, request, user_id, endpoint):
+        """Takes a token from the bucket the Flask view uses. With none left, Flask writes the 429.
+
+        A request handed to Flask after its token was taken is marked, so it is not charged twice."""
+        limiter = self.flask_app.extensions.get('rate_limiter')
+        if limiter is not None:
+            key = bucket_key(self.flask_app.config, user_id, (request.scope.get('client') or ('', 0))[0], endpoint)
+            if await asyncio.to_thread(limiter.take, key):
+                raise _Delegate
+            request.environ[CHARGED_ENVIRON_KEY] = True
+
+    # --- FX rates, conditional GET and response cache, as app.fx / app.http_cache / app.response_cache ---
+
+    async def _fx_table(self, session):
+        version = (await session.execute(fx.version_query())).scalar() or 0
+        base = self.flask_app.config['FX_BASE_CURRENCY']
+        return fx.table_cache.get(version, base) or fx.table_cache.put(
+            version, base, (await session.execute(fx.rates_query())).all()
+        )
+
+    async def _conditional(self, request, session, user_id, tables, endpoint, build, cached=False, extra=None):
+        found = dict((await session.execute(DataVersion.snapshot_query(tables, user_id))).all())
+        versions = tuple(found.get(name, 0) for name in tables)
+        etag = etag_for(user_id, request.path, request.args, tables, versions, extra)
+
+        if parse_etags(request.headers.get('If-None-Match')).contains(etag):
+            response = self.flask_app.response_class(status=304)
+        else:
+            cache = self.flask_app.extensions.get('response_cache') if cached else None
+            flight = self.flask_app.extensions.get('single_flight') if cached else None
+            key = f'{endpoint}:{etag}'
+            # the cache backends block (sqlite: a file and its lock), so they run off the event loop
+            stored = await asyncio.to_thread(cache.get, key) if cache is not None else None
+            if stored is not None:
+                response = self._stored_response(stored, 'HIT')
+            else:
+                async def render():
+                    result = await build()
+                    response = result if isinstance(result, self.flask_app.response_class) else self.flask_app.json.response(result)
+                    value = None
+                    if response.status_code == 200 and not response.is_streamed:
+                        value = (response.get_data(), response.status_code, response.mimetype)
+                        if cache is not None:
+                            await asyncio.to_thread(cache.set, key, value, {cache_tag(table, user_id) for table in tables}, None)
+                    return response, value
+
+                # concurrent misses on one key share one computation, as @cached does
+                response, shared = await flight.do_async(key, render) if flight is not None else ((await render())[0], None)
+                if shared is not None:
+                    response = self._stored_response(shared, 'COALESCED')
+                elif cache is not None:
+                    response.headers['X-Cache'] = 'MISS'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control(self.flask_app.config)
+        return response
+
+    def _stored_response(self, value, source):
+        body, status, mimetype = value
+        response = self.flask_app.response_class(body, status=status, mimetype=mimetype)
+        response.headers['X-Cache'] = source
+        return response
+
+    # --- ASGI plumbing ---
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _send_response(self, send, response):
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.to_wsgi_list()]
+        body = response.get_data()
+        if response.status_code != 304 and 'Content-Length' not in response.headers:
+            headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_flask(self, scope, receive, send, environ=None):
+        """Runs the WSGI app in a worker thread, streaming the request body in and the response body
+        back chunk by chunk."""
+        loop = asyncio.get_running_loop()
+        body = _BodyReader(loop)
+        feeder = loop.create_task(body.feed(receive))
+        queue = asyncio.Queue(maxsize=16)
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def run():
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+            try:
+                result = self.flask_app({**_wsgi_environ(scope, io.BufferedReader(body)), **(environ or {})}, start_response)
+                try:
+                    put(('start', started['status'], started['headers']))
+                    for chunk in result:
+                        if chunk:
+                            put(('body', chunk))
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+                put(('end', None))
+            except BaseException as e:
+                put(('error', e))
+
+        worker = loop.run_in_executor(None, run)
+        try:
+            while True:
+                kind, *payload = await queue.get()
+                if kind == 'start':
+                    status, headers = payload
+                    await send({
+                        'type': 'http.response.start',
+                        'status': status,
+                        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+                    })
+                elif kind == 'body':
+                    await send({'type': 'http.response.body', 'body': payload[0], 'more_body': True})
+                elif kind == 'end':
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                else:
+                    await worker
+                    raise payload[0]
+            await worker
+        finally:
+            feeder.cancel()  # the rest of a body the view did not read
+
+class _BodyReader(io.RawIOBase):
+    """wsgi.input for _call_flask: the request body, read in the worker thread while the event loop
+    receives it. Chunks pass through a bounded queue, so a large upload is never held in full."""
+    def __init__(self, loop):
+        self._loop = loop
+        self._chunks = asyncio.Queue(maxsize=16)
+        self._pending = b''
+        self._done = False
+
+    async def feed(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            if message.get('body'):
+                await self._chunks.put(message['body'])
+            if not message.get('more_body'):
+                break
+        await self._chunks.put(None)  # end of body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            chunk = asyncio.run_coroutine_threadsafe(self._chunks.get(), self._loop).result()
+            if chunk is None:
+                self._done = True
+            else:
+                self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    if 'CONTENT_LENGTH' not in environ:
+        environ['wsgi.input_terminated'] = True  # chunked: read to the end of the stream
+    return environ
+
+def create_asgi_app(config=None):
+    return AsyncApp(create_app(config))
@@ -0,0 +1,147 @@
+"""Set-based helpers for POST /subscriptions/bulk: one IN query per lookup, executemany writes.
+
+Everything is scoped to one user. Nothing here commits; the caller owns the transaction."""
+from sqlalchemy import select, insert, update, delete, func
+from app import db, rollup, history
+from app.category_cache import category_cache
+from app.models import Subscription, Category, normalize_name
+
+def resolve_categories(user_id, names):
+    """Maps lower(name) -> category id for every name, inserting the missing ones in one batch."""
+    wanted = {name.lower(): name for name in names}
+    if not wanted:
+        return {}
+
+    lookup = select(func.lower(Category.name), Category.id).where(
+        Category.user_id == user_id, func.lower(Category.name).in_(wanted)
+    )
+    found = dict(db.session.execute(lookup).all())
+
+    missing = [{'user_id': user_id, 'name': name.capitalize()} for key, name in wanted.items() if key not in found]
+    if missing:
+        db.session.execute(insert(Category), missing)
+        category_cache.invalidate(user_id)
+        found = dict(db.session.execute(lookup).all())
+    return found
+
+def existing_names(user_id, names):
+    """Maps normalized name -> subscription id for the user's names that already exist (one IN query)."""
+    normalized = {normalize_name(name) for name in names}
+    if not normalized:
+        return {}
+    stmt = select(Subscription.name_normalized, Subscription.id).where(
+        Subscription.user_id == user_id, Subscription.name_normalized.in_(normalized)
+    )
+    return dict(db.session.execute(stmt).all())
+
+def _conflict(index, name):
+    return {'index': index, 'status': 409, 'error': f"Subscription '{name}' already exists."}
+
+def _not_found(index, sub_id):
+    return {'index': index, 'status': 404, 'error': f"Subscription with ID {sub_id} not found"}
+
+def apply(user_id, creates, updates, deletes):
+    """Applies validated operations (creates, then updates, then deletes) and returns one result per item.
+
+    creates: [(index, values)]   updates: [(index, id, changes)]   deletes: [(index, id)]
+    """
+    results = []
+    names = [v['name'] for _, v in creates] + [c['name'] for _, _, c in updates if 'name' in c]
+    taken = existing_names(user_id, names)
+
+    deltas = rollup.SpendDeltas()
+    log = history.ChangeLog()
+
+    # Current state of every row we update or delete, for existence checks and rollup deltas
+    touched_ids = {sub_id for _, sub_id, _ in updates} | {sub_id for _, sub_id in deletes}
+    present = {}
+    if touched_ids:
+        stmt = select(Subscription.id, *(getattr(Subscription, attr) for attr in rollup.TRACKED)).where(
+            Subscription.user_id == user_id, Subscription.id.in_(touched_ids)
+        )
+        present = {row[0]: dict(zip(rollup.TRACKED, row[1:])) for row in db.session.execute(stmt)}
+
+    # Reject duplicates (against the table and within the batch) before resolving categories
+    accepted_creates = []
+    for index, values in creates:
+        key = normalize_name(values['name'])
+        if key in taken:
+            results.append(_conflict(index, values['name']))
+            continue
+        taken[key] = None
+        accepted_creates.append((index, values))
+
+    accepted_updates = []
+    for index, sub_id, changes in updates:
+        if sub_id not in present:
+            results.append(_not_found(index, sub_id))
+            continue
+        if 'name' in changes:
+            key = normalize_name(changes['name'])
+            if taken.get(key, sub_id) != sub_id:
+                results.append(_conflict(index, changes['name']))
+                continue
+            taken[key] = sub_id
+        accepted_updates.append((index, sub_id, changes))
+
+    category_ids = resolve_categories(
+        user_id,
+        [v['category'] for _, v in accepted_creates] + [c['category'] for _, _, c in accepted_updates if 'category' in c]
+    )
+
+    # Inserts: a single executemany, ids returned in parameter order
+    if accepted_creates:
+        rows = []
+        for _, values in accepted_creates:
+            row = {k: v for k, v in values.items() if k != 'category'}
+            row['user_id'] = user_id
+            row['category_id'] = category_ids[values['category'].lower()]
+            rows.append(row)
+            deltas.add(user_id, row)
+        new_ids = db.session.scalars(
+            insert(Subscription).returning(Subscription.id, sort_by_parameter_order=True), rows
+        ).all()
+        for (index, _), new_id, row in zip(accepted_creates, new_ids, rows):
+            results.append({'index': index, 'status': 201, 'id': new_id})
+            log.record('created', user_id, new_id, new={attr: row[attr] for attr in rollup.TRACKED})
+
+    # Updates: ORM bulk UPDATE by primary key
+    if accepted_updates:
+        rows = []
+        for _, sub_id, changes in accepted_updates:
+            row = {k: v for k, v in changes.items() if k != 'category'}
+            if 'name' in changes:
+                row['name_normalized'] = normalize_name(changes['name'])
+            if 'category' in changes:
+                row['category_id'] = category_ids[changes['category'].lower()]
+            if row:
+                rows.append({'id': sub_id, **row})
+                old = present[sub_id]
+                new = {**old, **{k: v for k, v in row.items() if k in old}}
+                deltas.remove(user_id, old)
+                deltas.add(user_id, new)
+                log.record('updated', user_id, sub_id, new=new, old=old)
+                present[sub_id] = new
+        if rows:
+            db.session.execute(update(Subscription), rows)
+        results.extend({'index': index, 'status': 200, 'id': sub_id} for index, sub_id, _ in accepted_updates)
+
+    # Deletes: one IN statement
+    delete_ids = set()
+    for index, sub_id in deletes:
+        if sub_id not in present:
+            results.append(_not_found(index, sub_id))
+            continue
+        if sub_id not in delete_ids:
+            old = present[sub_id]
+            deltas.remove(user_id, old)
+            log.record('deleted', user_id, sub_id, old=old)
+            delete_ids.add(sub_id)
+        results.append({'index': index, 'status': 200, 'id': sub_id})
+    if delete_ids:
+        db.session.execute(delete(Subscription).where(Subscription.user_id == user_id, Subscription.id.in_(delete_ids)))
+
+    # Bulk statements skip the flush hooks, so feed the rollup and the change log directly
+    rollup.apply(db.session.connection(), deltas)
+    log.write(db.session.connection())
+    return results
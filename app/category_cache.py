@@ -0,0 +1,108 @@
+"""In-process read-through cache of categories, per user (lower(name) -> id, id -> name).
+
+A user's categories are a small, rarely changing set, so each worker keeps a full
+copy for the users it has served recently (LRU) and reloads one when that user's
+'category' DataVersion counter moves on (app.versioning bumps it whenever a
+transaction writing categories commits). Each counter is read at most once per
+request."""
+import threading
+from collections import OrderedDict
+from flask import g, has_request_context
+from sqlalchemy import select, func, event
+from app import db
+
+VERSION_KEY = 'category'
+MAX_USERS = 10000
+
+class _UserCategories:
+    __slots__ = ('version', 'by_name', 'by_id')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.by_id = {cid: name for cid, name in rows}
+        self.by_name = {name.lower(): cid for cid, name in rows}
+
+class CategoryCache:
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def id_for(self, user_id, name):
+        """Id of the user's category called `name` (case-insensitive), or None."""
+        entry = self._entry(user_id)
+        key = name.lower()
+        category_id = entry.by_name.get(key)
+        if category_id is None:
+            from app.models import Category
+            row = db.session.execute(
+                select(Category.id, Category.name).where(Category.user_id == user_id, func.lower(Category.name) == key)
+            ).first()
+            if row:
+                category_id = self._remember(entry, *row)
+        return category_id
+
+    def name_for(self, user_id, category_id):
+        """Name of the user's category with this id, or None."""
+        entry = self._entry(user_id)
+        name = entry.by_id.get(category_id)
+        if name is None:
+            from app.models import Category
+            name = db.session.execute(
+                select(Category.name).where(Category.user_id == user_id, Category.id == category_id)
+            ).scalar()
+            if name is not None:
+                self._remember(entry, category_id, name)
+        return name
+
+    def invalidate(self, user_id):
+        """Call after inserting a category. Other workers notice through the version bump at commit."""
+        with self._lock:
+            self._users.pop(user_id, None)
+        if has_request_context():
+            g.get('_category_cache_checked', set()).discard(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+        if has_request_context():
+            g.pop('_category_cache_checked', None)
+
+    # --- internals ---
+    def _remember(self, entry, category_id, name):
+        with self._lock:
+            entry.by_name[name.lower()] = category_id
+            entry.by_id[category_id] = name
+        return category_id
+
+    def _entry(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+
+        checked = g.setdefault('_category_cache_checked', set()) if has_request_context() else None
+        if checked is not None:
+            if entry is not None and user_id in checked:
+                return entry
+            checked.add(user_id)
+
+        from app.models import Category, DataVersion
+        current = DataVersion.current(VERSION_KEY, user_id)
+        if entry is not None and entry.version == current:
+            return entry
+
+        rows = db.session.execute(select(Category.id, Category.name).where(Category.user_id == user_id)).all()
+        entry = _UserCategories(current, rows)
+        with self._lock:
+            self._users[user_id] = entry
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entry
+
+category_cache = CategoryCache()
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_uncommitted_categories(session):
+    # entries read inside a rolled-back transaction may point at rows that no longer exist
+    category_cache.clear()
@@ -0,0 +1,123 @@
+import os
+import time
+import csv
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+subs_cli = AppGroup('subs', help='Subscription tracker maintenance commands.')
+
+@subs_cli.command('migrate')
+def migrate_command():
+    """Upgrade an existing database file to the current schema."""
+    from app.migrations import upgrade
+    try:
+        applied = upgrade(db.engine)
+    except IntegrityError as e:
+        raise click.ClickException(f"Migration failed, fix the conflicting rows first: {e.orig}")
+    click.echo(f"Applied: {', '.join(applied)}" if applied else "Database already up to date.")
+
+@subs_cli.command('rollup-rebuild')
+def rollup_rebuild_command():
+    """Recompute the spend rollup from the subscription table."""
+    from app import rollup
+    with db.engine.begin() as conn:
+        rows = rollup.rebuild(conn)
+    click.echo(f"Spend rollup rebuilt ({rows} rows).")
+
+@subs_cli.command('rollup-check')
+def rollup_check_command():
+    """Verify the spend rollup matches the subscription table (exit code 1 on drift)."""
+    from app import rollup
+    with db.engine.connect() as conn:
+        mismatches = rollup.check(conn)
+    for line in mismatches:
+        click.echo(line)
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} rollup rows out of date; run 'flask subs rollup-rebuild'.")
+    click.echo("Spend rollup is consistent.")
+
+@subs_cli.command('history-compact')
+def history_compact_command():
+    """Fold the change log of closed months into spend snapshots (run periodically, e.g. daily)."""
+    from app import history
+    with db.engine.begin() as conn:
+        users = history.compact(conn)
+    click.echo(f"Spend history compacted for {users} users.")
+
+@subs_cli.command('alerts-worker')
+@click.option('--once', is_flag=True, help='Drain the queue once and exit.')
+@click.option('--interval', default=2.0, show_default=True, help='Seconds between polls of the queue.')
+def alerts_worker_command(once, interval):
+    """Evaluate queued budget alerts (for ALERTS_WORKER=none deployments)."""
+    from app import alerts
+    sinks = current_app.extensions['alert_sinks']
+    while True:
+        evaluated = alerts.drain(sinks)
+        if once:
+            click.echo(f"Evaluated {evaluated} budgets.")
+            return
+        time.sleep(interval)
+
+@subs_cli.command('fx-load')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def fx_load_command(path):
+    """Load FX rates from a CSV file (currency,date,rate: the value of one unit in FX_BASE_CURRENCY from that date)."""
+    from sqlalchemy import select
+    from app import alerts, fx
+    from app.models import Budget
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        try:
+            count = fx.load_rates(fx.read_rates(source))
+        except ValueError as e:
+            raise click.ClickException(f"{path}, {e}")
+    # converted budget spend moves with the rates: re-evaluate every budget
+    alerts.enqueue(db.session, db.session.execute(select(Budget.user_id)).scalars().all())
+    db.session.commit()
+    click.echo(f"Loaded {count} FX rates.")
+
+@subs_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Default: from the file extension.')
+@click.option('--user-id', type=int, help='Owner of the imported subscriptions (default: DEFAULT_USER_ID).')
+@click.option('--chunk-size', type=int, help='Rows per transaction (default: IMPORT_CHUNK_SIZE).')
+@click.option('--resume', 'resume_id', type=int, help='Continue an interrupted import job of the same file.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='Write rejected rows (line, error) to this CSV file.')
+def import_command(path, fmt, user_id, chunk_size, resume_id, errors_path):
+    """Import subscriptions from a CSV or NDJSON file in chunked, resumable transactions."""
+    from app import importer
+    from app.tenancy import acting_as
+    fmt = fmt or importer.detect_format(path)
+    if fmt is None:
+        raise click.ClickException("Cannot tell the format from the file name; pass --format csv or --format ndjson.")
+    user_id = user_id or current_app.config['DEFAULT_USER_ID']
+
+    with acting_as(user_id):
+        if resume_id:
+            job = importer.find_job(user_id, resume_id)
+            if job is None or job.finished:
+                raise click.ClickException(f"No unfinished import job {resume_id} for user {user_id}.")
+            click.echo(f"Resuming import job {job.id} after {job.rows_read} rows.")
+        else:
+            job = importer.start_job(user_id, os.path.abspath(path))
+            click.echo(f"Import job {job.id} (resume with --resume {job.id} if interrupted).")
+
+        with open(path, 'rb') as source, open(errors_path or os.devnull, 'a', newline='') as report:
+            writer = csv.writer(report)
+            if errors_path and report.tell() == 0:
+                writer.writerow(['line', 'error'])
+
+            shown = []
+            def on_error(line, message):
+                writer.writerow([line, message])
+                if not errors_path and len(shown) < 20:
+                    shown.append(line)
+                    click.echo(f"line {line}: {message}", err=True)
+
+            job = importer.run_import(
+                user_id, job, importer.read_rows(source, fmt),
+                chunk_size or current_app.config['IMPORT_CHUNK_SIZE'], on_error
+            )
+    click.echo(f"Imported {job.created} subscriptions; {job.failed} rows rejected.")
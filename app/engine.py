@@ -0,0 +1,84 @@
+"""Engine options and per-connection setup derived from the app config."""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured URI; explicit options in the config win."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    options = {}
+
+    if not is_memory_sqlite(url):  # in-memory SQLite uses a StaticPool, which takes no pool arguments
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+
+    timeout_ms = config['DB_STATEMENT_TIMEOUT_MS']
+    if backend == 'postgresql' and timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout_ms}'}
+    elif backend == 'mysql' and timeout_ms:
+        options['connect_args'] = {'init_command': f'SET SESSION MAX_EXECUTION_TIME={timeout_ms}'}
+    elif backend == 'sqlite':
+        # SQLite has no statement timeout; how long to wait for a lock is the closest knob
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+def install_sqlite_pragmas(engine, config):
+    """Sets WAL, synchronous, busy_timeout and mmap_size on every new SQLite connection."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+    if config['SQLITE_WAL'] and not is_memory_sqlite(engine.url):
+        pragmas.insert(0, 'journal_mode=WAL')
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+        cursor.close()
+
+def read_database_url(config, primary_url):
+    """URL of the read engine (app.read_routing): READ_DATABASE_URL, else the primary's own file
+    for file-backed SQLite (in-memory databases cannot be shared), else None (no routing)."""
+    if not config['READ_ROUTING']:
+        return None
+    if config.get('READ_DATABASE_URL'):
+        return make_url(config['READ_DATABASE_URL'])
+    if primary_url.get_backend_name() == 'sqlite' and not is_memory_sqlite(primary_url):
+        return primary_url
+    return None
+
+def create_read_engine(config, primary_url):
+    """The read engine, or None. Options are derived for its URL like the primary's
+    (explicit SQLALCHEMY_ENGINE_OPTIONS only apply to the primary); SQLite connections are
+    read-only and each of their transactions reads one WAL snapshot."""
+    url = read_database_url(config, primary_url)
+    if url is None:
+        return None
+    engine = create_engine(url, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_ENGINE_OPTIONS': None}))
+    install_sqlite_pragmas(engine, config)
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def _read_only(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None  # pysqlite would not BEGIN before a SELECT; _begin does
+        dbapi_connection.execute('PRAGMA query_only = ON')
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN')
+    return engine
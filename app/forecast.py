@@ -0,0 +1,169 @@
+"""Renewal calendar: exact charge dates and totals of ACTIVE subscriptions over a date window.
+
+A subscription bills on its start_date and then every week, every month (on the
+same day of the month, clamped to the month's last day) or every year (Feb 29
+falls back to Feb 28 in common years).
+
+The database first collapses a user's subscriptions into (frequency, start_date,
+currency) groups with summed prices (integer cents) and counts; each group's sum is converted into
+the reporting currency with one multiply (today's rates, app.fx). Each group belongs to an anchor (weekday for
+weekly, day of month for monthly, month and day for yearly) and joins that anchor's
+running total at its first charge inside the window. One sweep over each anchor's
+periods then yields the per-day totals, so the work grows with the number of
+distinct start dates and the window length, not with subscriptions x renewals."""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from flask import abort
+from sqlalchemy import select, func
+from app.models import Subscription, FrequencyType, StatusType
+from app.money import from_cents
+
+DEFAULT_FORECAST_MONTHS = 12
+MAX_FORECAST_DAYS = 3653  # ten years
+
+def _clamped(year, month, day):
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+def add_months(day, months):
+    """The same day `months` later, clamped to the end of the month."""
+    index = day.year * 12 + day.month - 1 + months
+    return _clamped(index // 12, index % 12 + 1, day.day)
+
+# A schedule numbers its periods and maps (period, anchor) to that period's charge
+# date; period_of(day, anchor) is the period whose charge falls on or before `day`
+# (monthly and yearly: the period containing `day`).
+
+class _Weekly:
+    @staticmethod
+    def anchor(start):
+        return start.toordinal() % 7
+
+    @staticmethod
+    def period_of(day, anchor):
+        return (day.toordinal() - anchor) // 7
+
+    @staticmethod
+    def charge(period, anchor):
+        return date.fromordinal(period * 7 + anchor)
+
+class _Monthly:
+    @staticmethod
+    def anchor(start):
+        return start.day
+
+    @staticmethod
+    def period_of(day, anchor):
+        return day.year * 12 + day.month - 1
+
+    @staticmethod
+    def charge(period, anchor):
+        return _clamped(period // 12, period % 12 + 1, anchor)
+
+class _Yearly:
+    @staticmethod
+    def anchor(start):
+        return start.month, start.day
+
+    @staticmethod
+    def period_of(day, anchor):
+        return day.year
+
+    @staticmethod
+    def charge(period, anchor):
+        return _clamped(period, *anchor)
+
+SCHEDULES = {FrequencyType.WEEKLY: _Weekly, FrequencyType.MONTHLY: _Monthly, FrequencyType.YEARLY: _Yearly}
+
+def _first_period_from(schedule, day, anchor):
+    period = schedule.period_of(day, anchor)
+    return period if schedule.charge(period, anchor) >= day else period + 1
+
+def renewal_groups(user_id, until):
+    """(frequency, start_date, currency, price total in cents, count) of ACTIVE subscriptions started by `until`."""
+    return (
+        select(Subscription.frequency, Subscription.start_date, Subscription.currency,
+               func.sum(Subscription.price_cents), func.count())
+        .where(
+            Subscription.user_id == user_id,
+            Subscription.status == StatusType.ACTIVE,
+            Subscription.start_date <= until,
+        )
+        .group_by(Subscription.frequency, Subscription.start_date, Subscription.currency)
+    )
+
+def daily_charges(groups, start, end, factors):
+    """{date: [total cents, count]} for every day in [start, end] with at least one charge.
+
+    factors: {currency: multiplier into the reporting currency} (FxTable.factors)."""
+    # (schedule, anchor) -> {first period in the window: [total, count]}
+    joins = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    for frequency, started, currency, total, count in groups:
+        schedule = SCHEDULES[frequency]
+        anchor = schedule.anchor(started)
+        period = max(schedule.period_of(started, anchor), _first_period_from(schedule, start, anchor))
+        entry = joins[schedule, anchor][period]
+        entry[0] += total * factors[currency]
+        entry[1] += count
+
+    days = defaultdict(lambda: [0.0, 0])
+    for (schedule, anchor), starts in joins.items():
+        running_total, running_count = 0.0, 0
+        first = min(starts)
+        for period in range(first, schedule.period_of(end, anchor) + 1):
+            if period in starts:
+                running_total += starts[period][0]
+                running_count += starts[period][1]
+            charged = schedule.charge(period, anchor)
+            if running_count and start <= charged <= end:
+                day = days[charged]
+                day[0] += running_total
+                day[1] += running_count
+    return days
+
+def forecast_window(args, today=None):
+    """Reads ?from= and ?to= (YYYY-MM-DD, inclusive). Defaults to the next 12 months from today."""
+    try:
+        start = datetime.strptime(args['from'], '%Y-%m-%d').date() if 'from' in args else today or date.today()
+        end = (
+            datetime.strptime(args['to'], '%Y-%m-%d').date() if 'to' in args
+            else add_months(start, DEFAULT_FORECAST_MONTHS) - timedelta(days=1)
+        )
+    except ValueError:
+        abort(400, description="from and to must be dates in YYYY-MM-DD format")
+
+    if end < start:
+        abort(400, description="to must not be before from")
+    if (end - start).days >= MAX_FORECAST_DAYS:
+        abort(400, description=f"The forecast window is limited to {MAX_FORECAST_DAYS} days")
+    return start, end
+
+def forecast_payload(groups, start, end, factors, currency):
+    """Forecast JSON in `currency`: window totals, every month in the window, and the days with charges."""
+    days = daily_charges(groups, start, end, factors)
+
+    months = {}
+    cursor = start.replace(day=1)
+    while cursor <= end:
+        months[cursor.strftime('%Y-%m')] = [0.0, 0]
+        cursor = add_months(cursor, 1)
+    for day, (total, count) in days.items():
+        month = months[day.strftime('%Y-%m')]
+        month[0] += total
+        month[1] += count
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "currency": currency,
+        "total": from_cents(sum(total for total, _ in days.values())),
+        "charge_count": sum(count for _, count in days.values()),
+        "months": [
+            {"month": month, "total": from_cents(total), "charge_count": count}
+            for month, (total, count) in months.items()
+        ],
+        "days": [
+            {"date": day.isoformat(), "total": from_cents(total), "charge_count": count}
+            for day, (total, count) in sorted(days.items())
+        ],
+    }
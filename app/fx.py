@@ -0,0 +1,180 @@
+"""Currency conversion from the locally loaded fx_rate table.
+
+fx_rate holds the value of one unit of each currency in FX_BASE_CURRENCY, per day
+the rate took effect (`flask subs fx-load rates.csv`). Every worker keeps the whole
+table in memory as an FxTable: per currency, the effective days (as ordinals) and
+the rates in two sorted, flat arrays. A conversion uses the latest rate on or before
+the day asked for, or the earliest one for days before it.
+
+Readers never convert row by row. They sum in SQL per currency, then call
+factors(target, day) for one multiplier per currency, memoized per (target, day).
+The table is reloaded when the global 'fx_rate' DataVersion counter moves on. That
+counter is read at most once per app context (once per request)."""
+import csv
+import math
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from flask import abort, current_app, g, has_app_context
+from sqlalchemy import event, select, insert, update
+from app import db
+from app.models import DataVersion, FxRate, base_currency
+
+VERSION_KEY = 'fx_rate'
+GLOBAL_SCOPE = 0  # DataVersion owner for data shared by all users
+MAX_MEMOIZED_FACTORS = 4096
+
+def normalize_currency(code):
+    """Upper-cased 3-letter code, or None when `code` does not look like one."""
+    if not isinstance(code, str) or len(code.strip()) != 3 or not code.strip().isalpha():
+        return None
+    return code.strip().upper()
+
+class FxTable:
+    """Immutable snapshot of fx_rate at one DataVersion."""
+    def __init__(self, version, base, rows):
+        """rows: (currency, day, rate), ordered by currency and day."""
+        self.version = version
+        self.base = base
+        self._days, self._rates = {}, {}
+        for currency, group in groupby(rows, key=itemgetter(0)):
+            days, rates = array('l'), array('d')
+            for _, day, rate in group:
+                days.append(day.toordinal())
+                rates.append(rate)
+            self._days[currency], self._rates[currency] = days, rates
+        # the base currency is worth exactly one of itself, whatever was loaded for it
+        self._days[base], self._rates[base] = array('l', [1]), array('d', [1.0])
+        self._factors = {}
+
+    @property
+    def currencies(self):
+        return self._days.keys()
+
+    def rate(self, currency, day):
+        """Value of one unit of `currency` in the base currency on `day`. KeyError for unknown currencies."""
+        days = self._days[currency]
+        return self._rates[currency][max(bisect_right(days, day.toordinal()) - 1, 0)]
+
+    def factors(self, target, day):
+        """{currency: multiplier into `target`} for every known currency, on `day`."""
+        key = (target, day)
+        factors = self._factors.get(key)
+        if factors is None:
+            unit = self.rate(target, day)
+            factors = {currency: self.rate(currency, day) / unit for currency in self._days}
+            if len(self._factors) >= MAX_MEMOIZED_FACTORS:
+                self._factors.clear()
+            self._factors[key] = factors
+        return factors
+
+    def convert(self, totals, target, day):
+        """Sum of (currency, amount) pairs in `target`: one multiply per pair, summed exactly (fsum),
+        so the result does not depend on the order of the pairs. Amounts in the target currency stay exact."""
+        factors = self.factors(target, day)
+        return math.fsum(amount * factors[currency] for currency, amount in totals)
+
+# --- Per-worker cache ---
+
+def version_query():
+    """The current fx_rate version; also run by the async views."""
+    return select(DataVersion.version).where(DataVersion.user_id == GLOBAL_SCOPE, DataVersion.name == VERSION_KEY)
+
+def rates_query():
+    return select(FxRate.currency, FxRate.day, FxRate.rate).order_by(FxRate.currency, FxRate.day)
+
+class _TableCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+
+    def get(self, version, base):
+        table = self._table
+        return table if table is not None and table.version == version and table.base == base else None
+
+    def put(self, version, base, rows):
+        table = FxTable(version, base, rows)
+        with self._lock:
+            self._table = table
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._table = None
+
+table_cache = _TableCache()
+
+def fx_table():
+    """The FxTable for the current fx_rate version (needs an app context)."""
+    if 'fx_table' in g:
+        return g.fx_table
+    version = db.session.execute(version_query()).scalar() or 0
+    base = base_currency()
+    table = table_cache.get(version, base) or table_cache.put(version, base, db.session.execute(rates_query()).all())
+    g.fx_table = table
+    return table
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_uncommitted_rates(session):
+    # a table read inside a rolled-back transaction may hold a version that never committed
+    table_cache.clear()
+    if has_app_context():
+        g.pop('fx_table', None)
+
+# --- Request helpers ---
+
+def known_currency(code, table=None):
+    """The normalized code when rates exist for it, else None."""
+    code = normalize_currency(code)
+    return code if code is not None and code in (table or fx_table()).currencies else None
+
+def parse_currency(code, field='currency'):
+    """Validates a currency from a payload or query string, or aborts with 400."""
+    currency = known_currency(code)
+    if currency is None:
+        allowed = ', '.join(sorted(fx_table().currencies))
+        abort(400, description=f"Invalid {field} {code!r}. Allowed (currencies with FX rates): {allowed}")
+    return currency
+
+def reporting_currency(args):
+    """?currency= (validated) or REPORTING_CURRENCY."""
+    return parse_currency(args['currency']) if 'currency' in args else current_app.config['REPORTING_CURRENCY']
+
+def vary_for(table):
+    """ETag input of converted views: converted amounts change with the rates and the day."""
+    return f"{table.version}:{date.today().isoformat()}"
+
+def fx_vary():
+    return vary_for(fx_table())
+
+# --- Loading ---
+
+def read_rates(lines):
+    """(currency, day, rate) per data row of CSV text lines with a currency,date,rate header. ValueError names the bad line."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            currency = normalize_currency(row.get('currency'))
+            day = datetime.strptime((row.get('date') or '').strip(), '%Y-%m-%d').date()
+            rate = float(row.get('rate'))
+            if currency is None or not (math.isfinite(rate) and rate > 0):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f"line {reader.line_num}: expected currency (3 letters), date (YYYY-MM-DD) and a positive, finite rate")
+        yield currency, day, rate
+
+def load_rates(rows):
+    """Upserts (currency, day, rate) rows and bumps the 'fx_rate' version. Returns the number of rows. Does not commit."""
+    table = FxRate.__table__
+    count = 0
+    for currency, day, rate in rows:
+        where = (table.c.currency == currency) & (table.c.day == day)
+        if db.session.execute(update(table).where(where).values(rate=rate)).rowcount == 0:
+            db.session.execute(insert(table).values(currency=currency, day=day, rate=rate))
+        count += 1
+    if count:
+        DataVersion.bump(VERSION_KEY, GLOBAL_SCOPE)
+    return count
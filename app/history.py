@@ -0,0 +1,250 @@
+"""Spend history: an append-only change log plus compacted monthly snapshots.
+
+Every subscription write that changes price, frequency, status or category
+appends a subscription_event row in the same transaction. The flush hook below
+covers ORM writes; app.bulk logs its bulk statements itself. compact() runs
+periodically via `flask subs history-compact`. It folds the events of closed
+months into spend_snapshot rows and moves the user's checkpoint. Reads then
+start from the snapshots and replay only the events after the checkpoint,
+normally just the current month's.
+
+Totals are kept per (category, currency), in twelfths of a cent (app.money), and
+converted when a period is reported, at the FX rates of that period's last day (app.fx).
+
+Months are UTC calendar months. An event committed after its month has been
+compacted (a transaction spanning the run) is left out of the history."""
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from itertools import groupby
+from flask import abort
+from sqlalchemy import event, select, insert, update, or_
+from app import db
+from app.forecast import add_months
+from app.models import Subscription, SubscriptionEvent, SpendSnapshot, HistoryCheckpoint, StatusType, monthly_cost_of
+from app.money import from_cents, from_twelfths, twelfths_to_cents
+from app.rollup import TRACKED, current_values, previous_values
+
+GRANULARITIES = {'month': ('%Y-%m', 1, 12), 'year': ('%Y', 12, 5)}  # period format, months per period, default count
+MAX_HISTORY_MONTHS = 240
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def month_of(moment):
+    return date(moment.year, moment.month, 1)
+
+# --- Change log ---
+
+class ChangeLog:
+    """Collects subscription_event rows for one flush or bulk request."""
+    def __init__(self):
+        self.rows = []
+
+    def record(self, kind, user_id, subscription_id, new=None, old=None):
+        """new / old: {attr: value} for the TRACKED attributes after / before the write."""
+        if new == old:
+            return  # e.g. a rename
+        row = {'kind': kind, 'user_id': user_id, 'subscription_id': subscription_id, 'occurred_at': utcnow()}
+        for attr in TRACKED:
+            row[attr] = new[attr] if new is not None else None
+            row[f'previous_{attr}'] = old[attr] if old is not None else None
+        self.rows.append(row)
+
+    def write(self, conn):
+        if self.rows:
+            conn.execute(insert(SubscriptionEvent.__table__), self.rows)
+
+@event.listens_for(db.session, 'after_flush')
+def _log_subscription_writes(session, flush_context):
+    log = ChangeLog()
+    for sub in session.new:
+        if isinstance(sub, Subscription):
+            log.record('created', sub.user_id, sub.id, new=current_values(sub))
+    for sub in session.dirty:
+        if isinstance(sub, Subscription) and session.is_modified(sub):
+            log.record('updated', sub.user_id, sub.id, new=current_values(sub), old=previous_values(sub))
+    for sub in session.deleted:
+        if isinstance(sub, Subscription):
+            log.record('deleted', sub.user_id, sub.id, old=previous_values(sub))
+    log.write(session.connection())
+
+# --- Replay ---
+
+def _apply_event(state, row):
+    """Applies one event to {(category_id, currency): [active monthly total, active count]}. Returns the keys it moved."""
+    touched = []
+    if row.previous_status == StatusType.ACTIVE:
+        key = (row.previous_category_id, row.previous_currency)
+        entry = state[key]
+        entry[0] -= monthly_cost_of(row.previous_price_cents, row.previous_frequency)
+        entry[1] -= 1
+        touched.append(key)
+    if row.status == StatusType.ACTIVE:
+        key = (row.category_id, row.currency)
+        entry = state[key]
+        entry[0] += monthly_cost_of(row.price_cents, row.frequency)
+        entry[1] += 1
+        touched.append(key)
+    return touched
+
+def _checkpoint(conn, user_id):
+    return conn.execute(select(HistoryCheckpoint.compacted_until).where(HistoryCheckpoint.user_id == user_id)).scalar()
+
+def _events_by_month(conn, user_id, since=None, until=None):
+    """(month, [event rows]) in order, for events in [since, until) (months, either bound optional)."""
+    stmt = select(SubscriptionEvent).where(SubscriptionEvent.user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(SubscriptionEvent.occurred_at >= datetime.combine(since, time()))
+    if until is not None:
+        stmt = stmt.where(SubscriptionEvent.occurred_at < datetime.combine(until, time()))
+    rows = conn.execute(stmt.order_by(SubscriptionEvent.occurred_at, SubscriptionEvent.id))
+    for month, events in groupby(rows, key=lambda row: month_of(row.occurred_at)):
+        yield month, list(events)
+
+def _snapshots_by_month(conn, user_id, until):
+    stmt = (
+        select(SpendSnapshot.month, SpendSnapshot.category_id, SpendSnapshot.currency,
+               SpendSnapshot.monthly_total_twelfths, SpendSnapshot.subscription_count)
+        .where(SpendSnapshot.user_id == user_id, SpendSnapshot.month < until)
+        .order_by(SpendSnapshot.month)
+    )
+    return {month: list(rows) for month, rows in groupby(conn.execute(stmt), key=lambda row: row.month)}
+
+def compact(conn, today=None):
+    """Folds events of closed months into spend_snapshot and advances checkpoints. Returns the users compacted."""
+    current = month_of(today or utcnow())
+    pending = (
+        select(SubscriptionEvent.user_id).distinct()
+        .outerjoin(HistoryCheckpoint, HistoryCheckpoint.user_id == SubscriptionEvent.user_id)
+        .where(
+            SubscriptionEvent.occurred_at < datetime.combine(current, time()),
+            or_(HistoryCheckpoint.compacted_until.is_(None),
+                SubscriptionEvent.occurred_at >= HistoryCheckpoint.compacted_until),
+        )
+    )
+    users = conn.execute(pending).scalars().all()
+    for user_id in users:
+        checkpoint = _checkpoint(conn, user_id)
+        state = defaultdict(lambda: [0, 0])
+        for rows in _snapshots_by_month(conn, user_id, current).values():
+            for row in rows:
+                state[row.category_id, row.currency] = [row.monthly_total_twelfths, row.subscription_count]
+
+        snapshots = []
+        for month, events in _events_by_month(conn, user_id, checkpoint, current):
+            touched = set()
+            for row in events:
+                touched.update(_apply_event(state, row))
+            snapshots.extend(
+                {'user_id': user_id, 'month': month, 'category_id': category_id, 'currency': currency,
+                 'monthly_total_twelfths': state[category_id, currency][0], 'subscription_count': state[category_id, currency][1]}
+                for category_id, currency in sorted(touched)
+            )
+        if snapshots:
+            conn.execute(insert(SpendSnapshot.__table__), snapshots)
+
+        table = HistoryCheckpoint.__table__
+        if conn.execute(update(table).where(table.c.user_id == user_id).values(compacted_until=current)).rowcount == 0:
+            conn.execute(insert(table).values(user_id=user_id, compacted_until=current))
+    return len(users)
+
+def monthly_states(conn, user_id, first, last):
+    """{month: {(category_id, currency): (active monthly total, count)}} at the end of every month from `first` to `last`."""
+    checkpoint = _checkpoint(conn, user_id)
+    until = add_months(last, 1)
+    # snapshots cover the months before the checkpoint, events the ones from it on
+    changes = defaultdict(list)
+    for month, rows in _snapshots_by_month(conn, user_id, min(checkpoint or until, until)).items():
+        changes[month].append(('snapshot', rows))
+    for month, events in _events_by_month(conn, user_id, checkpoint, until):
+        changes[month].append(('events', events))
+
+    state = defaultdict(lambda: [0, 0])
+
+    def advance(month):
+        for kind, rows in changes.get(month, ()):
+            for row in rows:
+                if kind == 'snapshot':
+                    state[row.category_id, row.currency] = [row.monthly_total_twelfths, row.subscription_count]
+                else:
+                    _apply_event(state, row)
+
+    for month in sorted(m for m in changes if m < first):
+        advance(month)
+    states = {}
+    month = first
+    while month <= last:
+        advance(month)
+        states[month] = {key: tuple(entry) for key, entry in state.items() if entry[1]}
+        month = add_months(month, 1)
+    return states
+
+# --- GET /analytics/history ---
+
+def history_window(args, today=None):
+    """Reads ?granularity= (month | year), ?from= and ?to= (YYYY-MM or YYYY). Returns (granularity, first, last).
+
+    first and last are the first months of the first and last periods; the default is the
+    last 12 months or 5 years, ending with the current one."""
+    granularity = args.get('granularity', 'month').lower()
+    if granularity not in GRANULARITIES:
+        abort(400, description=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    period_format, step, default_count = GRANULARITIES[granularity]
+
+    current = month_of(today or utcnow())
+    if granularity == 'year':
+        current = current.replace(month=1)
+    try:
+        last = datetime.strptime(args['to'], period_format).date() if 'to' in args else current
+        first = (
+            datetime.strptime(args['from'], period_format).date() if 'from' in args
+            else add_months(last, -step * (default_count - 1))
+        )
+    except ValueError:
+        abort(400, description=f"from and to must look like {datetime(2024, 1, 1).strftime(period_format)}")
+
+    if last > current:
+        abort(400, description="to must not be in the future")
+    if first > last:
+        abort(400, description="from must not be after to")
+    if (last.year - first.year) * 12 + last.month - first.month + step > MAX_HISTORY_MONTHS:
+        abort(400, description=f"History is limited to {MAX_HISTORY_MONTHS} months")
+    return granularity, first, last
+
+def history_payload(conn, user_id, granularity, first, last, category_name, fx, currency, today=None):
+    """Active monthly spend at the end of each period (the current one: so far), with the change from the period before.
+
+    Amounts are in `currency`, converted by the FxTable `fx` at each period's last day (the current one: today)."""
+    period_format, step, _ = GRANULARITIES[granularity]
+    today = today or utcnow().date()
+    current = month_of(today)
+    # a period's value is its last month's; the period before `first` feeds the first change
+    ends = []
+    period = add_months(first, -step)
+    while period <= last:
+        ends.append((period, min(add_months(period, step - 1), current)))
+        period = add_months(period, step)
+    states = monthly_states(conn, user_id, ends[0][1], ends[-1][1])
+
+    periods = []
+    previous_total = None
+    for period, end in ends:
+        factors = fx.factors(currency, min(add_months(end, 1) - timedelta(days=1), today))
+        by_category = defaultdict(list)
+        count = 0
+        for (category_id, from_currency), (total, subscriptions) in sorted(states[end].items()):
+            by_category[category_id].append(total * factors[from_currency])
+            count += subscriptions
+        category_totals = {category_id: math.fsum(amounts) for category_id, amounts in by_category.items()}
+        total = math.fsum(category_totals.values())
+        if previous_total is not None:
+            periods.append({
+                "period": period.strftime(period_format),
+                "total_monthly_cost": from_twelfths(total),
+                "active_subscription_count": count,
+                "change": from_cents(twelfths_to_cents(total) - twelfths_to_cents(previous_total)),
+                "category_totals": {category_name(cid): from_twelfths(value) for cid, value in category_totals.items()},
+            })
+        previous_total = total
+    return {"granularity": granularity, "currency": currency, "periods": periods}
@@ -0,0 +1,141 @@
+"""Streaming CSV / NDJSON import of subscriptions, in chunked transactions.
+
+Rows are parsed lazily from a byte stream, validated by parse_new_subscription
+(the rules of POST /subscriptions) and written through app.bulk, which resolves
+categories and rejects duplicate names once per chunk. Each chunk commits
+together with its ImportJob progress, so an interrupted import resumes after the
+last committed chunk. A row the database rejects is reported like an invalid one. Memory use is bounded by the chunk size, not the file size.
+
+CSV files need a header row with the payload keys (name, price, frequency,
+category, optionally currency, status and start_date, any case); empty cells count as absent."""
+import csv
+import io
+import json
+from werkzeug.exceptions import HTTPException
+from app import db, bulk
+from app.models import ImportJob
+from app.validation import parse_new_subscription
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 5000
+
+def detect_format(filename=None, mimetype=None):
+    """'csv' or 'ndjson' from a file name or content type, or None."""
+    name = (filename or '').lower()
+    if name.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+def _text(stream):
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream)
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+def csv_rows(stream):
+    """(line number, payload dict) per data row of a CSV byte stream."""
+    reader = csv.DictReader(_text(stream))
+    for row in reader:
+        yield reader.line_num, {
+            key.strip().lower(): value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        }
+
+def ndjson_rows(stream):
+    """(line number, payload or error message) per non-blank line of an NDJSON byte stream."""
+    for line_number, line in enumerate(_text(stream), 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, "Invalid JSON"
+
+def read_rows(stream, fmt):
+    return csv_rows(stream) if fmt == 'csv' else ndjson_rows(stream)
+
+def find_job(user_id, job_id):
+    """The user's ImportJob with this id, or None."""
+    job = db.session.get(ImportJob, job_id)
+    return job if job is not None and job.user_id == user_id else None
+
+def start_job(user_id, source):
+    job = ImportJob(user_id=user_id, source=source[:255])
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def _without_failing_rows(user_id, creates, errors):
+    """The creates that can be written on their own; the others are added to `errors`.
+
+    Only used when writing the whole chunk failed (e.g. a value the database rejects):
+    each row is tried alone and rolled back, so one bad row cannot fail its chunk on every resume."""
+    accepted = []
+    for line, values in creates:
+        try:
+            bulk.apply(user_id, [(line, values)], [], [])
+            accepted.append((line, values))
+        except Exception as e:
+            errors.append((line, f"Could not be saved: {getattr(e, 'orig', None) or e}"))  # the driver's error, not the SQL
+        finally:
+            db.session.rollback()
+    return accepted
+
+def _import_chunk(user_id, job, chunk, on_error):
+    errors, creates = [], []
+    for line, item in chunk:
+        if isinstance(item, str):
+            errors.append((line, item))
+            continue
+        try:
+            creates.append((line, parse_new_subscription(item)))
+        except HTTPException as e:
+            errors.append((line, e.description))
+
+    try:
+        results = bulk.apply(user_id, creates, [], [])
+    except Exception:
+        db.session.rollback()
+        creates = _without_failing_rows(user_id, creates, errors)
+        results = bulk.apply(user_id, creates, [], [])
+
+    created = 0
+    for result in results:
+        if result['status'] >= 400:
+            errors.append((result['index'], result['error']))
+        else:
+            created += 1
+
+    job.rows_read += len(chunk)
+    job.created += created
+    job.failed += len(errors)
+    db.session.commit()
+    # reported once the chunk is durable, so a resumed import does not repeat them
+    for line, message in sorted(errors):
+        on_error(line, message)
+
+def run_import(user_id, job, rows, chunk_size=DEFAULT_CHUNK_SIZE, on_error=lambda line, message: None):
+    """Imports `rows` ((line, payload) pairs) for `user_id`, skipping the ones `job` already consumed.
+
+    on_error(line, message) is called for every rejected row. Returns the finished job."""
+    skip = job.rows_read
+    chunk = []
+    try:
+        for row in rows:
+            if skip:
+                skip -= 1
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                _import_chunk(user_id, job, chunk, on_error)
+                chunk = []
+        if chunk:
+            _import_chunk(user_id, job, chunk, on_error)
+    except Exception:
+        db.session.rollback()
+        raise
+    job.finished = True
+    db.session.commit()
+    return job
@@ -0,0 +1,198 @@
+"""Opt-in per-request instrumentation (INSTRUMENTATION=true).
+
+For every request it records the number of SQL statements, the total and slowest
+statement time, and the time spent encoding JSON. Each response reports these in
+a Server-Timing header. GET /metrics exposes per-route histograms of the same
+values in the Prometheus text format; the counters are per worker process.
+
+Config: INSTRUMENTATION, INSTRUMENTATION_SLOW_QUERY_MS (log statements slower
+than this; 0 disables)."""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app, g, request, has_app_context, has_request_context
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+from app import db
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'db_time', 'slowest', 'slowest_sql', 'serialize_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+        self.serialize_time = 0.0
+
+def _current_stats():
+    return g.get('_request_stats') if has_request_context() else None
+
+# --- Metrics registry ---
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name, self.help, self.buckets = name, help, buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        series = self._series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1  # cumulated when rendered
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            base = _labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-1]}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self._values = {}
+
+    def inc(self, labels):
+        self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{{{_labels(labels)}}} {value}' for labels, value in sorted(self._values.items()))
+        return lines
+
+def _labels(pairs):
+    return ','.join(f'{key}="{value}"' for key, value in pairs)
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter('subtrack_http_requests_total', 'Requests by route, method and status.')
+        self.duration = Histogram('subtrack_http_request_duration_seconds', 'Request handling time.', DURATION_BUCKETS)
+        self.statements = Histogram('subtrack_db_statements_per_request', 'SQL statements per request.', STATEMENT_BUCKETS)
+        self.db_time = Histogram('subtrack_db_time_seconds', 'Total SQL time per request.', DURATION_BUCKETS)
+        self.serialize = Histogram('subtrack_serialize_time_seconds', 'JSON encoding time per request.', DURATION_BUCKETS)
+
+    def record(self, route, method, status, stats, elapsed):
+        labels = (('method', method), ('route', route))
+        with self._lock:
+            self.requests.inc(labels + (('status', str(status)),))
+            self.duration.observe(labels, elapsed)
+            self.statements.observe(labels, stats.statements)
+            self.db_time.observe(labels, stats.db_time)
+            self.serialize.observe(labels, stats.serialize_time)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.statements, self.db_time, self.serialize):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+def get_metrics():
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+# --- Hooks ---
+
+@contextmanager
+def serialize_timer():
+    """Adds the time spent in the block to the request's serialization time (no-op when disabled)."""
+    stats = _current_stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += time.perf_counter() - started
+
+class TimedJSONProvider(JSONProvider):
+    """Wraps the app's JSON provider and adds its encoding time to the request stats."""
+    def __init__(self, app, inner):
+        super().__init__(app)
+        self.inner = inner
+
+    def _timed(self, fn, *args, **kwargs):
+        with serialize_timer():
+            return fn(*args, **kwargs)
+
+    def dumps(self, obj, **kwargs):
+        return self._timed(self.inner.dumps, obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.inner.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        return self._timed(self.inner.response, *args, **kwargs)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+    if context is not None:
+        context._query_timed = True  # for _handle_error
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+    stats = _current_stats()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_time += elapsed
+    if elapsed > stats.slowest:
+        stats.slowest, stats.slowest_sql = elapsed, statement
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute; drop its start time so the next one pairs up
+    if getattr(context.execution_context, '_query_timed', False):
+        context.connection.info['_query_started'].pop()
+
+def _start_request():
+    g._request_stats = RequestStats()
+
+def _finish_request(response):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    response.headers['Server-Timing'] = ', '.join((
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.statements} statements"',
+        f'db-slowest;dur={stats.slowest * 1000:.2f}',
+        f'serialize;dur={stats.serialize_time * 1000:.2f}',
+        f'total;dur={elapsed * 1000:.2f}',
+    ))
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    current_app.extensions['metrics'].record(route, request.method, response.status_code, stats, elapsed)
+
+    slow_ms = current_app.config.get('INSTRUMENTATION_SLOW_QUERY_MS', 0)
+    if slow_ms and stats.slowest * 1000 >= slow_ms:
+        current_app.logger.warning(
+            "Slow statement (%.1f ms) in %s %s: %s", stats.slowest * 1000, request.method, route, stats.slowest_sql
+        )
+    return response
+
+def init_app(app):
+    if not app.config.get('INSTRUMENTATION'):
+        return
+    app.extensions['metrics'] = Metrics()
+    with app.app_context():
+        for engine in filter(None, (db.engine, app.extensions.get('read_engine'))):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+    app.json = TimedJSONProvider(app, app.json)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,188 @@
+"""In-place upgrades for existing database files (create_all never alters tables that already exist).
+
+Each step is idempotent; `flask subs migrate` runs them all in order."""
+from sqlalchemy import inspect, text, select, update, MetaData
+from app import db
+
+def _columns(conn, table):
+    return {c['name'] for c in inspect(conn).get_columns(table)}
+
+def _index_names(conn, table):
+    if conn.dialect.name == 'sqlite':
+        # the inspector skips expression indexes on SQLite, sqlite_master lists them all
+        rows = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t"), {'t': table})
+        return {name for (name,) in rows}
+    return {ix['name'] for ix in inspect(conn).get_indexes(table)}
+
+def add_subscription_name_normalized(conn):
+    if 'name_normalized' in _columns(conn, 'subscription'):
+        return False
+    from app.models import Subscription, normalize_name
+    conn.execute(text('ALTER TABLE subscription ADD COLUMN name_normalized VARCHAR(80)'))
+    rows = conn.execute(select(Subscription.id, Subscription.name)).all()
+    if rows:
+        conn.execute(
+            update(Subscription.__table__).where(Subscription.__table__.c.id == db.bindparam('sub_id')),
+            [{'sub_id': sub_id, 'name_normalized': normalize_name(name)} for sub_id, name in rows]
+        )
+    return True
+
+# Columns that replaced a float one: the old column and the SQL converting it (app.money)
+CONVERTED_COLUMNS = {
+    'price_cents': ('price', 'CAST(ROUND(price * 100) AS INTEGER)'),
+    'previous_price_cents': ('previous_price', 'CAST(ROUND(previous_price * 100) AS INTEGER)'),
+    'monthly_limit_cents': ('monthly_limit', 'CAST(ROUND(monthly_limit * 100) AS INTEGER)'),
+    'monthly_total_twelfths': ('monthly_total', 'CAST(ROUND(monthly_total * 1200) AS INTEGER)'),
+}
+
+def _rebuild_table(conn, table, fill):
+    """Recreates `table` from the current model definition and copies the rows over.
+
+    Columns missing from the old table are converted from the column they replaced
+    (CONVERTED_COLUMNS) or take their value from `fill`. Generated columns are left to
+    the database. Indexes are left to create_missing_indexes."""
+    scratch = MetaData()
+    for t in db.metadata.sorted_tables:
+        t.to_metadata(scratch)
+    new = table.to_metadata(scratch, name=f'{table.name}__new')
+    new.indexes.clear()
+    new.create(conn)
+
+    old_columns = _columns(conn, table.name)
+    converted = {c: sql for c, (old, sql) in CONVERTED_COLUMNS.items() if c not in old_columns and old in old_columns}
+    names = [c.name for c in table.columns
+             if c.computed is None and (c.name in old_columns or c.name in converted or c.name in fill)]
+    source = ', '.join(c if c in old_columns else converted.get(c, f':{c}') for c in names)
+    conn.execute(
+        text(f'INSERT INTO {new.name} ({", ".join(names)}) SELECT {source} FROM {table.name}'),
+        {c: v for c, v in fill.items() if c in names and c not in old_columns},
+    )
+    conn.execute(text(f'DROP TABLE {table.name}'))
+    conn.execute(text(f'ALTER TABLE {new.name} RENAME TO {table.name}'))
+
+def add_user_scope(conn):
+    """Moves single-user data to DEFAULT_USER_ID and swaps global unique names for per-user ones."""
+    from app.models import Category, Budget, Subscription, DataVersion, SpendRollup, base_currency
+    from app.tenancy import DEFAULT_USER_ID
+    changed = False
+    fill = {'user_id': DEFAULT_USER_ID, 'currency': base_currency()}
+    # parents first, so the rebuilt subscription table references the rebuilt category table
+    for model in (Category, Budget, Subscription, DataVersion):
+        if 'user_id' not in _columns(conn, model.__tablename__):
+            _rebuild_table(conn, model.__table__, fill)
+            changed = True
+    if 'user_id' not in _columns(conn, SpendRollup.__tablename__):
+        # derived data: rebuilt from the subscriptions by populate_spend_rollup
+        SpendRollup.__table__.drop(conn)
+        SpendRollup.__table__.create(conn)
+        changed = True
+    return changed
+
+def add_currency(conn):
+    """Prices, budgets and the change log so far are in FX_BASE_CURRENCY; per-currency derived tables start over."""
+    from app.models import SpendRollup, SpendSnapshot, BudgetStatus, base_currency
+    changed = False
+    currency = base_currency()
+    if not currency.isalpha() or len(currency) != 3:
+        raise ValueError(f"FX_BASE_CURRENCY must be a 3-letter code, not {currency!r}")
+    for table in ('subscription', 'budget'):
+        if 'currency' not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT '{currency}'"))
+            changed = True
+    if 'currency' not in _columns(conn, 'subscription_event'):
+        conn.execute(text('ALTER TABLE subscription_event ADD COLUMN currency VARCHAR(3)'))
+        conn.execute(text('ALTER TABLE subscription_event ADD COLUMN previous_currency VARCHAR(3)'))
+        conn.execute(text('UPDATE subscription_event SET currency = :c WHERE price IS NOT NULL'), {'c': currency})
+        conn.execute(text('UPDATE subscription_event SET previous_currency = :c WHERE previous_price IS NOT NULL'), {'c': currency})
+        changed = True
+    if 'currency' not in _columns(conn, SpendSnapshot.__tablename__):
+        _rebuild_table(conn, SpendSnapshot.__table__, {'currency': currency})
+        changed = True
+    # derived data: the rollup is rebuilt by populate_spend_rollup, budget statuses by the alerts worker
+    for model in (SpendRollup, BudgetStatus):
+        if 'currency' not in _columns(conn, model.__tablename__):
+            model.__table__.drop(conn)
+            model.__table__.create(conn)
+            changed = True
+    return changed
+
+def store_money_in_cents(conn):
+    """Float amounts become integer cents, monthly totals twelfths of a cent (app.money).
+
+    SQLite changes neither a column's type nor adds a generated column (monthly_cost_twelfths)
+    in place, so these tables are rebuilt; the derived rollup and budget statuses start over."""
+    from app.models import Subscription, Budget, SubscriptionEvent, SpendSnapshot, SpendRollup, BudgetStatus
+    changed = False
+    for model, column in ((Subscription, 'monthly_cost_twelfths'), (Budget, 'monthly_limit_cents'),
+                          (SubscriptionEvent, 'price_cents'), (SpendSnapshot, 'monthly_total_twelfths')):
+        if column not in _columns(conn, model.__tablename__):
+            _rebuild_table(conn, model.__table__, {})
+            changed = True
+    # derived data: the rollup is rebuilt by populate_spend_rollup, budget statuses by the alerts worker
+    for model, column in ((SpendRollup, 'monthly_total_twelfths'), (BudgetStatus, 'current_spend_cents')):
+        if column not in _columns(conn, model.__tablename__):
+            model.__table__.drop(conn)
+            model.__table__.create(conn)
+            changed = True
+    return changed
+
+def create_missing_indexes(conn):
+    created = False
+    for table in db.metadata.sorted_tables:
+        existing = _index_names(conn, table.name)
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                created = True
+    return created
+
+def populate_spend_rollup(conn):
+    from app import rollup
+    from app.models import Subscription, SpendRollup
+    if conn.execute(select(SpendRollup.category_id).limit(1)).first() is not None:
+        return False
+    if conn.execute(select(Subscription.id).limit(1)).first() is None:
+        return False
+    rollup.rebuild(conn)
+    return True
+
+def populate_subscription_events(conn):
+    """Starts the change log of existing data with one 'created' event per subscription, dated at its start_date."""
+    from datetime import datetime, time
+    from app.models import Subscription, SubscriptionEvent
+    from app.rollup import TRACKED
+    if conn.execute(select(SubscriptionEvent.id).limit(1)).first() is not None:
+        return False
+    columns = [getattr(Subscription, attr) for attr in TRACKED]
+    result = conn.execution_options(yield_per=10_000).execute(
+        select(Subscription.id, Subscription.user_id, Subscription.start_date, *columns).order_by(Subscription.id)
+    )
+    written = False
+    for rows in result.partitions():
+        conn.execute(SubscriptionEvent.__table__.insert(), [
+            {'kind': 'created', 'subscription_id': sub_id, 'user_id': user_id,
+             'occurred_at': datetime.combine(start_date, time()), **dict(zip(TRACKED, values))}
+            for sub_id, user_id, start_date, *values in rows
+        ])
+        written = True
+    return written
+
+STEPS = [
+    add_subscription_name_normalized,
+    add_user_scope,
+    add_currency,
+    store_money_in_cents,
+    create_missing_indexes,
+    populate_spend_rollup,
+    populate_subscription_events,
+]
+
+def upgrade(engine):
+    """Creates missing tables, then applies every step. Returns the names of the steps that changed something."""
+    applied = []
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+        for step in STEPS:
+            if step(conn):
+                applied.append(step.__name__)
+    return applied
@@ -1,6 +1,12 @@
 from . import db
+from .category_cache import category_cache
+from .money import from_cents, from_twelfths
+from .tenancy import DEFAULT_USER_ID
 import enum
 from datetime import date
+from flask import current_app, has_app_context
+from sqlalchemy import case, func
+from sqlalchemy.orm import validates
 
 class FrequencyType(enum.Enum):
     WEEKLY = "Weekly"
@@ -12,47 +18,248 @@ class StatusType(enum.Enum):
     PAUSED = "Paused"
     CANCELLED = "Cancelled"
 
+def normalize_name(name):
+    """Key used for case-insensitive uniqueness checks."""
+    return name.lower()
+
+def _normalized_name_default(context):
+    # Core/bulk inserts bypass @validates, so derive the column from the name parameter
+    return normalize_name(context.get_current_parameters()['name'])
+
+DEFAULT_BASE_CURRENCY = 'USD'
+
+def base_currency():
+    """FX_BASE_CURRENCY: what fx_rate rates are quoted in, and the currency of amounts given without one."""
+    return current_app.config.get('FX_BASE_CURRENCY', DEFAULT_BASE_CURRENCY) if has_app_context() else DEFAULT_BASE_CURRENCY
+
+# twelfths of a cent per month for each cent of price (app.money): x 4 weekly, / 12 yearly
+MONTHLY_TWELFTHS = {FrequencyType.WEEKLY: 48, FrequencyType.MONTHLY: 12, FrequencyType.YEARLY: 1}
+
+def monthly_cost_of(price_cents, frequency):
+    """Monthly cost in twelfths of a cent: an exact integer."""
+    return price_cents * MONTHLY_TWELFTHS[frequency]
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, default=DEFAULT_USER_ID)
+    name = db.Column(db.String(50), nullable=False)
     subscriptions = db.relationship('Subscription', backref='category_obj', lazy=True)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', name='uq_category_user_name'),
+    )
+
     def to_json(self):
         return {"id": self.id, "name": self.name}
 
+class DataVersion(db.Model):
+    """Change counter per (user, data set), bumped inside the writing transaction so other workers can detect stale caches."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def current(cls, name, user_id):
+        stmt = db.select(cls.version).where(cls.user_id == user_id, cls.name == name)
+        return db.session.execute(stmt).scalar() or 0
+
+    @classmethod
+    def snapshot_query(cls, names, user_id):
+        """(name, version) rows for snapshot(); also run by the async views."""
+        return db.select(cls.name, cls.version).where(cls.user_id == user_id, cls.name.in_(names))
+
+    @classmethod
+    def snapshot(cls, names, user_id):
+        """Current versions of several data sets, in the order given (one query)."""
+        found = dict(db.session.execute(cls.snapshot_query(names, user_id)).all())
+        return tuple(found.get(name, 0) for name in names)
+
+    @classmethod
+    def bump(cls, name, user_id):
+        stmt = db.update(cls).where(cls.user_id == user_id, cls.name == name).values(version=cls.version + 1)
+        if db.session.execute(stmt).rowcount == 0:
+            db.session.add(cls(user_id=user_id, name=name, version=1))
+            db.session.flush()
+
 class Budget(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    monthly_limit = db.Column(db.Float, nullable=False, default=0.0)
+    user_id = db.Column(db.Integer, nullable=False, unique=True, default=DEFAULT_USER_ID)
+    monthly_limit_cents = db.Column(db.Integer, nullable=False, default=0)
+    currency = db.Column(db.String(3), nullable=False, default=base_currency)
 
     def to_json(self):
-        return {"id": self.id, "monthly_limit": self.monthly_limit}
+        return {"id": self.id, "monthly_limit": from_cents(self.monthly_limit_cents), "currency": self.currency}
+
+class BudgetStatus(db.Model):
+    """Last evaluated budget health per user, maintained by the app.alerts worker."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    monthly_limit_cents = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(3), nullable=False)  # the budget's; current_spend_cents is converted into it
+    current_spend_cents = db.Column(db.Integer, nullable=False)
+    health_label = db.Column(db.String(20), nullable=False)
+    evaluated_at = db.Column(db.DateTime, nullable=False)  # UTC
+
+class BudgetJob(db.Model):
+    """Queue of users whose budget health needs re-evaluating; one row per user coalesces bursts of writes."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    requested_at = db.Column(db.DateTime, nullable=False)  # UTC, latest write
+
+class ImportJob(db.Model):
+    """Progress of one file import (app.importer), committed with every chunk so an interrupted import can resume."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(255), nullable=False)
+    rows_read = db.Column(db.Integer, nullable=False, default=0)  # data rows consumed, valid or not
+    created = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    finished = db.Column(db.Boolean, nullable=False, default=False)
+
+    def to_json(self):
+        return {
+            "id": self.id, "source": self.source, "rows_read": self.rows_read,
+            "created": self.created, "failed": self.failed, "finished": self.finished
+        }
 
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, default=DEFAULT_USER_ID)
+    name = db.Column(db.String(80), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default=base_currency)  # ISO 4217 code of the price
     frequency = db.Column(db.Enum(FrequencyType), nullable=False)
     start_date = db.Column(db.Date, nullable=False, default=date.today)
     status = db.Column(db.Enum(StatusType), nullable=False, default=StatusType.ACTIVE)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    name_normalized = db.Column(db.String(80), nullable=False, default=_normalized_name_default)
+    # Stored SQL twin of monthly_cost_of(), computed by the database on every write, so
+    # aggregates and ?sort=monthly_cost run in SQL (the latter on an index)
+    monthly_cost_twelfths = db.Column(db.Integer, db.Computed(case(
+        (frequency == FrequencyType.WEEKLY, price_cents * MONTHLY_TWELFTHS[FrequencyType.WEEKLY]),
+        (frequency == FrequencyType.YEARLY, price_cents * MONTHLY_TWELFTHS[FrequencyType.YEARLY]),
+        else_=price_cents * MONTHLY_TWELFTHS[FrequencyType.MONTHLY]
+    ), persisted=True))
 
-    @property
-    def monthly_cost(self):
+    # Every query is scoped to one user, so every index leads with user_id.
+    # The listing sorts (app.queries.SORTS) each have one ending in id, the keyset tie-breaker.
+    __table_args__ = (
+        db.Index('uq_subscription_user_name_normalized', 'user_id', 'name_normalized', unique=True),
+        db.Index('ix_subscription_user_status_category', 'user_id', 'status', 'category_id'),
+        db.Index('ix_subscription_user_id', 'user_id', 'id'),
+        db.Index('ix_subscription_user_price', 'user_id', 'price_cents', 'id'),
+        db.Index('ix_subscription_user_monthly_cost', 'user_id', 'monthly_cost_twelfths', 'id'),
+        db.Index('ix_subscription_user_start_date', 'user_id', 'start_date', 'id'),
+    )
 
-        if self.frequency == FrequencyType.WEEKLY:
-            return self.price * 4
-        elif self.frequency == FrequencyType.YEARLY:
-            return self.price / 12
-        return self.price
+    @validates('name')
+    def _sync_name_normalized(self, key, value):
+        self.name_normalized = normalize_name(value)
+        return value
 
     def to_json(self):
         return {
             "id": self.id,
             "name": self.name,
-            "price": self.price,
+            "price": from_cents(self.price_cents),
+            "currency": self.currency,
             "frequency": self.frequency.value,
-            "category": self.category_obj.name if self.category_obj else None,
+            "category": category_cache.name_for(self.user_id, self.category_id),
             "start_date": self.start_date.isoformat() if self.start_date else None,
             "status": self.status.value,
-            "monthly_cost": round(self.monthly_cost, 2)
-        }
\ No newline at end of file
+            "monthly_cost": from_twelfths(monthly_cost_of(self.price_cents, self.frequency))  # the column is refreshed only on access
+        }
+
+class SpendRollup(db.Model):
+    """Monthly spend per (user, category, status, currency), kept up to date by app.rollup on every Subscription write.
+
+    Totals stay in the subscriptions' own currency, in twelfths of a cent; readers convert one sum per currency (app.fx)."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    status = db.Column(db.Enum(StatusType), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    monthly_total_twelfths = db.Column(db.Integer, nullable=False, default=0)
+    subscription_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SubscriptionEvent(db.Model):
+    """Append-only log of subscription writes that change spend (see app.history).
+
+    Holds the tracked values after the write and before it: NULL for a creation's
+    previous_* and a deletion's new values."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    subscription_id = db.Column(db.Integer, nullable=False)  # no FK: deleted subscriptions keep their events
+    kind = db.Column(db.String(10), nullable=False)  # created | updated | deleted
+    occurred_at = db.Column(db.DateTime, nullable=False)  # UTC
+    price_cents = db.Column(db.Integer)
+    currency = db.Column(db.String(3))
+    frequency = db.Column(db.Enum(FrequencyType))
+    status = db.Column(db.Enum(StatusType))
+    category_id = db.Column(db.Integer)
+    previous_price_cents = db.Column(db.Integer)
+    previous_currency = db.Column(db.String(3))
+    previous_frequency = db.Column(db.Enum(FrequencyType))
+    previous_status = db.Column(db.Enum(StatusType))
+    previous_category_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_subscription_event_user_time', 'user_id', 'occurred_at'),
+    )
+
+class SpendSnapshot(db.Model):
+    """Active monthly spend of one category in one currency at the end of a month, written by app.history.compact().
+
+    Only (category, currency) pairs that changed during the month get a row; later months carry it forward."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    category_id = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    monthly_total_twelfths = db.Column(db.Integer, nullable=False, default=0)
+    subscription_count = db.Column(db.Integer, nullable=False, default=0)
+
+class HistoryCheckpoint(db.Model):
+    """Per user: events before compacted_until are folded into spend_snapshot."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    compacted_until = db.Column(db.Date, nullable=False)  # first day of the first month not compacted
+
+class FxRate(db.Model):
+    """Value of one unit of `currency` in FX_BASE_CURRENCY from `day` on, loaded by `flask subs fx-load`."""
+    currency = db.Column(db.String(3), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    rate = db.Column(db.Float, nullable=False)
+
+# Category lookups go through lower(name); let them probe an index instead of scanning
+db.Index('ix_category_user_name_lower', Category.user_id, func.lower(Category.name))
+
+
+# --- Row-based serialization (same layout as Subscription.to_json) ---
+SUBSCRIPTION_FIELDS = ("id", "name", "price", "currency", "frequency", "category", "start_date", "status", "monthly_cost")
+
+def subscription_columns(fields=SUBSCRIPTION_FIELDS):
+    """Labelled column expressions for the requested to_json() keys. Needs a join to Category."""
+    columns = {
+        "id": Subscription.id,
+        "name": Subscription.name,
+        "price": Subscription.price_cents,
+        "currency": Subscription.currency,
+        "frequency": Subscription.frequency,
+        "category": Category.name,
+        "start_date": Subscription.start_date,
+        "status": Subscription.status,
+        "monthly_cost": Subscription.monthly_cost_twelfths,
+    }
+    return [columns[f].label(f) for f in fields]
+
+_FIELD_FORMATTERS = {
+    "price": from_cents,
+    "frequency": lambda v: v.value,
+    "status": lambda v: v.value,
+    "start_date": lambda v: v.isoformat() if v else None,
+    "monthly_cost": from_twelfths,
+}
+
+def subscription_row_to_json(row, fields=SUBSCRIPTION_FIELDS):
+    """Serializes a Row selected with subscription_columns() like Subscription.to_json()."""
+    mapping = row._mapping
+    return {
+        f: _FIELD_FORMATTERS[f](mapping[f]) if f in _FIELD_FORMATTERS else mapping[f]
+        for f in fields
+    }
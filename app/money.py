@@ -0,0 +1,49 @@
+"""Money as integers.
+
+Amounts are stored in cents: hundredths of the currency unit, whatever the
+currency's own minor unit. A subscription's monthly cost is its price x 4 (weekly),
+x 1 (monthly) or / 12 (yearly), so monthly amounts are stored in twelfths of a cent.
+Every conversion and every SUM over them is then exact integer arithmetic, in SQL
+or in Python. Rounding happens once, when an amount is shown. FX-converted totals
+pass through one float multiply per currency and are rounded the same way, so a
+total computed twice from the same rows comes out the same.
+
+The JSON API keeps amounts in currency units (9.99), converted at the edges."""
+import math
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from fractions import Fraction
+
+CENTS = 100  # per currency unit
+TWELFTHS = 12  # per cent
+MAX_CENTS = 10 ** 13  # keeps sums of many monthly costs (in twelfths) inside a 64-bit integer
+
+def to_cents(value):
+    """Cents of an amount in currency units (a number or numeric string), rounded half to even.
+
+    ValueError when it is not a finite number of at most MAX_CENTS."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        raise ValueError(f"not an amount: {value!r}")
+    try:
+        amount = Decimal(str(value).strip())  # via str, so 9.99 is 9.99 and not the nearest double
+    except InvalidOperation:
+        raise ValueError(f"not an amount: {value!r}")
+    if not amount.is_finite() or abs(amount) * CENTS > MAX_CENTS:
+        raise ValueError(f"not an amount: {value!r}")
+    return int(amount.scaleb(2).to_integral_value(ROUND_HALF_EVEN))
+
+def from_cents(cents):
+    """Currency units for JSON. Floats (FX-converted cents) are rounded to the nearest cent first."""
+    return (cents if isinstance(cents, int) else round(cents)) / CENTS
+
+def twelfths_to_cents(twelfths):
+    """Nearest cent, half to even, of an amount in twelfths of a cent (an int, or a float after FX conversion)."""
+    if isinstance(twelfths, int):
+        cents, rest = divmod(twelfths, TWELFTHS)
+        return cents + (rest * 2 > TWELFTHS or (rest * 2 == TWELFTHS and cents % 2))
+    if not math.isfinite(twelfths):
+        raise ValueError(f"not an amount: {twelfths!r}")
+    return round(Fraction(twelfths) / TWELFTHS)  # exact: no double rounding
+
+def from_twelfths(twelfths):
+    """Currency units for JSON of an amount in twelfths of a cent."""
+    return twelfths_to_cents(twelfths) / CENTS
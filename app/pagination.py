@@ -0,0 +1,17 @@
+from flask import request, abort
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def page_args(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE, args=None):
+    """Reads ?limit= and ?after= (keyset cursor on id) from the query string (or `args`)."""
+    args = request.args if args is None else args
+    try:
+        limit = int(args['limit']) if 'limit' in args else default_limit
+        after = int(args['after']) if 'after' in args else None
+    except ValueError:
+        abort(400, description="limit and after must be integers")
+
+    if limit is not None and not 1 <= limit <= max_limit:
+        abort(400, description=f"limit must be between 1 and {max_limit}")
+    return limit, after
@@ -0,0 +1,116 @@
+"""Reusable SQL statements shared by the route handlers. Every statement is scoped to one user."""
+from sqlalchemy import select, func, false, tuple_
+from app.models import Subscription, Category, SpendRollup, StatusType, subscription_columns, normalize_name
+
+def active_spend_by_category(user_id):
+    """Monthly spend (twelfths of a cent) and subscription count per category and currency (ACTIVE only), read from the rollup."""
+    return (
+        select(Category.name, SpendRollup.currency, SpendRollup.monthly_total_twelfths, SpendRollup.subscription_count)
+        .join(Category, SpendRollup.category_id == Category.id)
+        .where(
+            SpendRollup.user_id == user_id,
+            SpendRollup.status == StatusType.ACTIVE,
+            SpendRollup.subscription_count > 0,
+        )
+        .order_by(Category.id, SpendRollup.currency)
+    )
+
+def active_monthly_spend(user_id):
+    """(currency, total monthly spend in twelfths of a cent) of ACTIVE subscriptions, read from the rollup: an integer SUM."""
+    return (
+        select(SpendRollup.currency, func.sum(SpendRollup.monthly_total_twelfths))
+        .where(
+            SpendRollup.user_id == user_id,
+            SpendRollup.status == StatusType.ACTIVE,
+            SpendRollup.subscription_count > 0,
+        )
+        .group_by(SpendRollup.currency)
+        .order_by(SpendRollup.currency)
+    )
+
+def active_subscription_breakdown(user_id, limit, after=None):
+    """Per-subscription monthly cost, keyset-paginated on id."""
+    stmt = (
+        select(
+            Subscription.id, Subscription.name, Subscription.currency,
+            Subscription.monthly_cost_twelfths, Category.name.label('category')
+        )
+        .join(Category, Subscription.category_id == Category.id)
+        .where(Subscription.user_id == user_id, Subscription.status == StatusType.ACTIVE)
+        .order_by(Subscription.id)
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(Subscription.id > after)
+    return stmt
+
+def filter_subscriptions(stmt, category_name=None, status_name=None):
+    """Applies the ?category= / ?status= filters (case-insensitive). stmt must already join Category."""
+    if category_name:
+        stmt = stmt.where(func.lower(Category.name) == category_name.lower())
+    if status_name:
+        # equality on the enum (not lower(status)) so the (status, category_id) index applies
+        status = next((s for s in StatusType if s.name.lower() == status_name.lower()), None)
+        stmt = stmt.where(Subscription.status == status if status else false())
+    return stmt
+
+# ?sort= keys. Each has an index on (user_id, column, id) (name: the unique (user_id,
+# name_normalized) one), so a sorted page is an index range scan, never a sort step.
+SORTS = {
+    'id': Subscription.id,
+    'name': Subscription.name_normalized,
+    'price': Subscription.price_cents,
+    'monthly_cost': Subscription.monthly_cost_twelfths,
+    'start_date': Subscription.start_date,
+}
+UNIQUE_SORTS = {'id', 'name'}  # no id tie-breaker needed
+
+def prefix_range(prefix):
+    """(low, high) bounds of the strings starting with `prefix`: an index range, unlike LIKE 'p%'."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def subscription_listing(user_id, fields, category_name=None, status_name=None, search=None,
+                         price_min=None, price_max=None, start_from=None, start_to=None,
+                         sort='id', descending=False, limit=None, after=None):
+    """Projected subscription rows joined to their category name, filtered and keyset-paginated in `sort` order.
+
+    search is a name prefix (case-insensitive); the bounds are inclusive (prices in cents). `after` is
+    the id of the last row of the previous page; the page resumes after that row's
+    position in the sort order."""
+    columns = subscription_columns(fields)
+    if 'id' not in fields:
+        columns.append(Subscription.id.label('id'))  # always needed for the cursor
+
+    stmt = (
+        select(*columns)
+        .join(Category, Subscription.category_id == Category.id)
+        .where(Subscription.user_id == user_id)
+    )
+    stmt = filter_subscriptions(stmt, category_name, status_name)
+    if search:
+        low, high = prefix_range(normalize_name(search))
+        stmt = stmt.where(Subscription.name_normalized >= low, Subscription.name_normalized < high)
+    if price_min is not None:
+        stmt = stmt.where(Subscription.price_cents >= price_min)
+    if price_max is not None:
+        stmt = stmt.where(Subscription.price_cents <= price_max)
+    if start_from is not None:
+        stmt = stmt.where(Subscription.start_date >= start_from)
+    if start_to is not None:
+        stmt = stmt.where(Subscription.start_date <= start_to)
+
+    column = SORTS[sort]
+    keys = (column,) if sort in UNIQUE_SORTS else (column, Subscription.id)
+    if after is not None:
+        if sort == 'id':
+            position = (after,)
+        else:
+            # the cursor row's sort value; a deleted cursor row ends the listing
+            value = select(column).where(Subscription.id == after, Subscription.user_id == user_id).scalar_subquery()
+            position = (value,) if sort in UNIQUE_SORTS else (value, after)
+        keys_value, position_value = (keys[0], position[0]) if len(keys) == 1 else (tuple_(*keys), tuple_(*position))
+        stmt = stmt.where(keys_value < position_value if descending else keys_value > position_value)
+    stmt = stmt.order_by(*(key.desc() if descending else key for key in keys))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
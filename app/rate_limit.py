@@ -0,0 +1,160 @@
+"""Per-client token buckets for expensive read endpoints (/analytics, /budgets).
+
+Every (client, endpoint) pair has a bucket of RATE_LIMIT_BURST tokens that refills
+at RATE_LIMIT_PER_SECOND. A request takes one token. Without one it gets a 429
+with a Retry-After header (seconds until the next token) before any query runs.
+The client is the remote address, since X-User-Id is chosen by the caller; with
+RATE_LIMIT_KEY='user' it is the acting user instead, for deployments where that is
+authenticated (a trusted proxy or USER_ID_PROVIDER, see app.tenancy). Two backends:
+
+* memory - per process, LRU-bounded (default)
+* sqlite - a shared file, so the limit holds across gunicorn workers
+
+Config: RATE_LIMIT_BACKEND ('memory' | 'sqlite' | 'none'), RATE_LIMIT_KEY ('address' |
+'user'), RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RATE_LIMIT_MAX_BUCKETS (memory),
+RATE_LIMIT_PATH (sqlite file)."""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, has_app_context
+from werkzeug.exceptions import TooManyRequests
+from app.tenancy import current_user_id
+
+KEYS = ('address', 'user')
+PRUNE_SECONDS = 60  # sqlite: how often full (idle) buckets are deleted
+CHARGED_ENVIRON_KEY = 'subs.rate_limit_charged'  # set by asgi.py on requests whose token it already took
+
+def _take(state, now, rate, burst):
+    """One token from a bucket in `state` ((tokens, updated_at), or None: full).
+
+    Returns (new state, seconds until a token is available: 0 when one was taken)."""
+    tokens = burst if state is None else min(burst, state[0] + max(now - state[1], 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+class MemoryBackend:
+    def __init__(self, max_buckets):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Takes a token for `key`; returns the seconds to wait, 0 when the request may go ahead.
+
+        Beyond max_buckets the least recently used buckets are dropped, but only once they have
+        refilled (dropping one is then the same as keeping it): a client still being limited
+        keeps its bucket, so max_buckets may be exceeded while many clients are."""
+        now = time.monotonic()
+        with self._lock:
+            state, wait = _take(self._buckets.pop(key, None), now, rate, burst)
+            self._buckets[key] = state
+            while len(self._buckets) > self.max_buckets:
+                tokens, updated_at = next(iter(self._buckets.values()))
+                if tokens + (now - updated_at) * rate < burst:
+                    break  # the oldest is still refilling, and so is every newer one
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pruned_at = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_updated_at ON rate_limit (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        conn = self._connect()
+        now = time.time()  # shared by processes, unlike time.monotonic()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # read and write the bucket under the write lock
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limit WHERE key = ?", (key,)).fetchone()
+            state, wait = _take(row, now, rate, burst)
+            conn.execute("INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?)", (key, *state))
+            if now - self._pruned_at > PRUNE_SECONDS:
+                # a bucket untouched for burst / rate seconds is full again: same as no row
+                conn.execute("DELETE FROM rate_limit WHERE updated_at < ?", (now - burst / rate,))
+                self._pruned_at = now
+        return wait
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM rate_limit")
+
+class RateLimiter:
+    def __init__(self, backend, rate, burst):
+        if not rate > 0 or burst < 1:
+            raise ValueError("RATE_LIMIT_PER_SECOND must be positive and RATE_LIMIT_BURST at least 1")
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+
+    def take(self, key):
+        """Seconds the caller must wait (0: go ahead, a token was taken)."""
+        return self.backend.take(key, self.rate, self.burst)
+
+def init_app(app):
+    kind = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+    if app.config.get('RATE_LIMIT_KEY', 'address') not in KEYS:
+        raise ValueError(f"Unknown RATE_LIMIT_KEY: {app.config['RATE_LIMIT_KEY']}")
+    if kind == 'none':
+        backend = None
+    elif kind == 'memory':
+        backend = MemoryBackend(app.config.get('RATE_LIMIT_MAX_BUCKETS', 100000))
+    elif kind == 'sqlite':
+        path = app.config.get('RATE_LIMIT_PATH') or os.path.join(app.instance_path, 'rate_limit.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        backend = SQLiteBackend(path)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {kind}")
+    app.extensions['rate_limiter'] = RateLimiter(
+        backend, app.config.get('RATE_LIMIT_PER_SECOND', 2), app.config.get('RATE_LIMIT_BURST', 20)
+    ) if backend else None
+
+def get_limiter():
+    return current_app.extensions.get('rate_limiter') if has_app_context() else None
+
+def bucket_key(config, user_id, remote_addr, endpoint):
+    """One bucket per client and endpoint (the client as RATE_LIMIT_KEY says); also used by the async views."""
+    if config.get('RATE_LIMIT_KEY', 'address') == 'user':
+        return f"user:{user_id}:{endpoint}"
+    return f"{remote_addr}:{endpoint}"
+
+def rate_limited(view):
+    """Decorator for expensive GET views: 429 with Retry-After once the client's bucket for this endpoint is empty.
+
+    Put it above @conditional, so a limited request runs no query at all."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        limiter = get_limiter()
+        if limiter is not None and not request.environ.get(CHARGED_ENVIRON_KEY):
+            wait = limiter.take(bucket_key(current_app.config, current_user_id(), request.remote_addr, request.endpoint))
+            if wait:
+                raise TooManyRequests(
+                    f"Rate limit of {limiter.rate:g}/s (bursts of {limiter.burst}) exceeded for this endpoint",
+                    retry_after=math.ceil(wait)
+                )
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,36 @@
+"""Sends the reads of read-only requests to a separate read engine.
+
+GET and HEAD requests to READ_BLUEPRINTS (analytics, budgets) read through the
+read engine (app.engine.create_read_engine): READ_DATABASE_URL when set (a
+replica), otherwise, for a file SQLite database, a second pool of query_only
+connections on the same file. Those connections BEGIN explicitly, so each request
+reads one WAL snapshot. Long dashboard reads then neither wait for writers nor
+hold up their commits, and never take pool slots from them.
+
+Everything else stays on the primary: other requests, background workers and the
+CLI, and any statement that writes. A request's first write (a flush or a DML
+statement) pins its session to the primary for the rest of the request, so it
+reads its own writes. A replica's lag between requests is not hidden."""
+from flask import g, has_app_context, request
+
+READ_METHODS = ('GET', 'HEAD')
+
+def reads_from_replica(session, clause=None):
+    """Whether `session` should run `clause` (None: open a connection) on the read engine."""
+    if session.info.get('wrote') or not (has_app_context() and g.get('read_from_replica')):
+        return False
+    if session._flushing or getattr(clause, 'is_dml', False):
+        session.info['wrote'] = True  # read-your-writes from here on
+        return False
+    return True
+
+def init_app(app, read_engine):
+    """Routes the read-only requests of `app` to `read_engine` (None: no routing)."""
+    app.extensions['read_engine'] = read_engine
+    if read_engine is None:
+        return
+    blueprints = {name.strip() for name in app.config['READ_BLUEPRINTS'].split(',') if name.strip()}
+
+    @app.before_request
+    def route_reads():
+        g.read_from_replica = request.method in READ_METHODS and request.blueprint in blueprints
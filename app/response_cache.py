@@ -0,0 +1,297 @@
+"""Response cache for expensive read endpoints (/analytics, /budgets).
+
+Entries are keyed by endpoint + URL + data versions (the same inputs as the ETag),
+tagged with the (table, user) pairs they depend on, and dropped when a commit
+touches one of them. Two backends:
+
+* memory - per-process LRU with TTL (default)
+* sqlite - a shared file, so several gunicorn workers reuse each other's entries
+
+Misses are single-flight within a process: while one request computes a key,
+concurrent requests for the same key wait for it and send its bytes (X-Cache:
+COALESCED) instead of running the same queries again. That holds with any backend,
+also 'none', and for the async views in asgi.py (SingleFlight.do_async).
+
+Config: RESPONSE_CACHE_BACKEND ('memory' | 'sqlite' | 'none'), RESPONSE_CACHE_TTL
+(seconds), RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_PATH (sqlite file),
+COALESCE_REQUESTS, COALESCE_TIMEOUT_SECONDS (how long a request waits for another's result)."""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, has_app_context
+from sqlalchemy import event
+from app import db
+from app.tenancy import current_user_id
+
+# Backends store values as (body, status, mimetype) tuples.
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (value, evicted_count); value is None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 0
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None, 1
+            self._entries.move_to_end(key)
+            return entry[2], 0
+
+    def set(self, key, value, tags, ttl):
+        """Stores an entry, returns how many old entries were evicted to make room."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, frozenset(tags), value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def invalidate(self, tags):
+        with self._lock:
+            stale = [k for k, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteBackend:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, body BLOB NOT NULL, status INTEGER NOT NULL, mimetype TEXT, "
+                "tags TEXT NOT NULL, expires_at REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_stored_at ON response_cache (stored_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT body, status, mimetype, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, 0
+        if row[3] < time.time():
+            with conn:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            return None, 1
+        return row[:3], 0
+
+    def set(self, key, value, tags, ttl):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, *value, ',' + ','.join(sorted(tags)) + ',', now + ttl, now)
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache ORDER BY stored_at LIMIT ?)",
+                    (overflow,)
+                )
+        return max(overflow, 0)
+
+    def invalidate(self, tags):
+        conn = self._connect()
+        with conn:
+            clause = ' OR '.join('instr(tags, ?) > 0' for _ in tags)
+            cursor = conn.execute(f"DELETE FROM response_cache WHERE {clause}", [f',{t},' for t in tags])
+        return cursor.rowcount
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM response_cache")
+
+class ResponseCache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _count(self, name, amount=1):
+        if amount:
+            with self._lock:
+                self.stats[name] += amount
+
+    def get(self, key):
+        value, evicted = self.backend.get(key)
+        self._count('evictions', evicted)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value, tags, ttl=None):
+        self._count('evictions', self.backend.set(key, value, tags, ttl or self.ttl))
+
+    def invalidate(self, tags):
+        if tags:
+            self._count('invalidations', self.backend.invalidate(frozenset(tags)))
+
+    def clear(self):
+        self.backend.clear()
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.callers = 1
+        self.value = None
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers of the same key share its result."""
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._flights = {}  # key -> _Flight
+        self._async_flights = {}  # key -> asyncio.Future of the shareable value
+        self._lock = threading.Lock()
+        self.stats = {'coalesced': 0}
+
+    def do(self, key, fn):
+        """fn() -> (result, shareable value or None). Returns (result, None) to the caller that ran fn,
+        (None, value) to those that waited for it. Waiters whose leader fails, shares nothing or
+        takes longer than `timeout` run fn themselves."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                flight.callers += 1
+                leader = False
+        if not leader:
+            if flight.done.wait(self.timeout) and flight.value is not None:
+                with self._lock:
+                    self.stats['coalesced'] += 1
+                return None, flight.value
+            return fn()[0], None
+        try:
+            result, flight.value = fn()
+            return result, None
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, fn):
+        """do() for the coroutines of one event loop (asgi.py); fn is a coroutine function."""
+        future = self._async_flights.get(key)
+        if future is not None:
+            try:
+                value = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.stats['coalesced'] += 1
+                return None, value
+            return (await fn())[0], None
+        future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        value = None
+        try:
+            result, value = await fn()
+            return result, None
+        finally:
+            del self._async_flights[key]
+            future.set_result(value)
+
+def init_app(app):
+    app.extensions['single_flight'] = (
+        SingleFlight(app.config.get('COALESCE_TIMEOUT_SECONDS', 30)) if app.config.get('COALESCE_REQUESTS', True) else None
+    )
+    kind = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+    if kind == 'none':
+        backend = None
+    elif kind == 'memory':
+        backend = MemoryBackend(max_entries)
+    elif kind == 'sqlite':
+        path = app.config.get('RESPONSE_CACHE_PATH') or os.path.join(app.instance_path, 'response_cache.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        backend = SQLiteBackend(path, max_entries)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {kind}")
+    app.extensions['response_cache'] = ResponseCache(backend, app.config.get('RESPONSE_CACHE_TTL', 30)) if backend else None
+
+def cache_tag(table, user_id):
+    return f'{table}:{user_id}'
+
+def get_cache():
+    return current_app.extensions.get('response_cache') if has_app_context() else None
+
+def get_single_flight():
+    return current_app.extensions.get('single_flight') if has_app_context() else None
+
+def cached(*tables, ttl=None):
+    """Decorator for GET views: serve a stored copy of the 200 response while `tables` are unchanged,
+    and compute a missing one once for all concurrent requests (SingleFlight).
+
+    Put it below @conditional so the ETag it computed doubles as the cache key."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache, flight = get_cache(), get_single_flight()
+            if cache is None and flight is None:
+                return view(*args, **kwargs)
+
+            from app.http_cache import compute_etag
+            key = f"{request.endpoint}:{g.get('data_etag') or compute_etag(tables)}"
+            stored = cache.get(key) if cache is not None else None
+            if stored is not None:
+                return _stored_response(stored, 'HIT')
+
+            def render():
+                response = current_app.make_response(view(*args, **kwargs))
+                value = None
+                if response.status_code == 200 and not response.is_streamed:
+                    value = (response.get_data(), response.status_code, response.mimetype)
+                    if cache is not None:
+                        cache.set(key, value, {cache_tag(table, current_user_id()) for table in tables}, ttl)
+                return response, value
+
+            response, shared = flight.do(key, render) if flight is not None else (render()[0], None)
+            if shared is not None:
+                return _stored_response(shared, 'COALESCED')
+            if cache is not None:
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+def _stored_response(value, source):
+    body, status, mimetype = value
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.headers['X-Cache'] = source
+    return response
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed_tables(session):
+    touched = session.info.pop('committed_tables', None)
+    cache = get_cache()
+    if touched and cache is not None:
+        cache.invalidate({cache_tag(table, user_id) for table, user_id in touched})
@@ -0,0 +1,116 @@
+"""Incremental maintenance of the spend_rollup table.
+
+Every flush that inserts, updates or deletes a Subscription turns into +/- deltas on
+the affected (user_id, category_id, status, currency) rows, written in the same transaction. Bulk Core
+statements bypass the flush, so app.bulk feeds its own deltas through apply()."""
+from collections import defaultdict
+from sqlalchemy import event, inspect, select, insert, update, delete, func
+from app import db
+from app.models import Subscription, SpendRollup, monthly_cost_of
+
+TRACKED = ('price_cents', 'currency', 'frequency', 'status', 'category_id')  # user_id never changes
+
+class SpendDeltas:
+    """Accumulates (monthly_total_twelfths, subscription_count) changes per (user_id, category_id, status, currency)."""
+    def __init__(self):
+        self._deltas = defaultdict(lambda: [0, 0])
+
+    def add(self, user_id, values, sign=1):
+        """values: {attr: value} for the TRACKED attributes."""
+        delta = self._deltas[(user_id, values['category_id'], values['status'], values['currency'])]
+        delta[0] += sign * monthly_cost_of(values['price_cents'], values['frequency'])
+        delta[1] += sign
+
+    def remove(self, user_id, values):
+        self.add(user_id, values, sign=-1)
+
+    def items(self):
+        return [(key, delta) for key, delta in self._deltas.items() if delta[1] or delta[0]]
+
+def apply(conn, deltas):
+    """Writes accumulated deltas: UPDATE the existing row, INSERT it when missing."""
+    table = SpendRollup.__table__
+    for (user_id, category_id, status, currency), (total, count) in deltas.items():
+        where = (
+            (table.c.user_id == user_id) & (table.c.category_id == category_id)
+            & (table.c.status == status) & (table.c.currency == currency)
+        )
+        result = conn.execute(update(table).where(where).values(
+            monthly_total_twelfths=table.c.monthly_total_twelfths + total,
+            subscription_count=table.c.subscription_count + count
+        ))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(
+                user_id=user_id, category_id=category_id, status=status, currency=currency,
+                monthly_total_twelfths=total, subscription_count=count
+            ))
+
+def current_values(sub):
+    """{attr: value} of a Subscription's TRACKED attributes."""
+    return {attr: getattr(sub, attr) for attr in TRACKED}
+
+def previous_values(sub):
+    """{attr: value} of a flushed Subscription's TRACKED attributes as they were before this flush."""
+    state = inspect(sub)
+    values = {}
+    for attr in TRACKED:
+        history = state.attrs[attr].history
+        values[attr] = history.deleted[0] if history.deleted else getattr(sub, attr)
+    return values
+
+@event.listens_for(db.session, 'after_flush')
+def _track_subscription_writes(session, flush_context):
+    # after_flush: ids and column defaults are populated, attribute history is not reset yet
+    deltas = SpendDeltas()
+    for sub in session.new:
+        if isinstance(sub, Subscription):
+            deltas.add(sub.user_id, current_values(sub))
+    for sub in session.dirty:
+        if isinstance(sub, Subscription) and session.is_modified(sub):
+            deltas.remove(sub.user_id, previous_values(sub))
+            deltas.add(sub.user_id, current_values(sub))
+    for sub in session.deleted:
+        if isinstance(sub, Subscription):
+            deltas.remove(sub.user_id, previous_values(sub))
+    if deltas.items():
+        apply(session.connection(), deltas)
+
+# --- Maintenance ---
+def live_totals():
+    """The rollup recomputed from the subscription table."""
+    return (
+        select(
+            Subscription.user_id, Subscription.category_id, Subscription.status, Subscription.currency,
+            func.sum(Subscription.monthly_cost_twelfths).label('monthly_total_twelfths'),
+            func.count(Subscription.id).label('subscription_count')
+        )
+        .group_by(Subscription.user_id, Subscription.category_id, Subscription.status, Subscription.currency)
+    )
+
+def rebuild(conn):
+    """Replaces the rollup with totals recomputed from scratch. Returns the number of rows written."""
+    table = SpendRollup.__table__
+    conn.execute(delete(table))
+    result = conn.execute(insert(table).from_select(
+        ['user_id', 'category_id', 'status', 'currency', 'monthly_total_twelfths', 'subscription_count'], live_totals()
+    ))
+    return result.rowcount
+
+def check(conn):
+    """Compares the rollup with live totals, exactly. Returns a list of mismatch descriptions (empty when consistent)."""
+    stored = {(r.user_id, r.category_id, r.status, r.currency): (r.monthly_total_twelfths, r.subscription_count)
+              for r in conn.execute(select(SpendRollup.__table__))}
+    live = {(r.user_id, r.category_id, r.status, r.currency): (r.monthly_total_twelfths, r.subscription_count)
+            for r in conn.execute(live_totals())}
+
+    mismatches = []
+    for key in stored.keys() | live.keys():
+        total, count = stored.get(key, (0, 0))
+        expected_total, expected_count = live.get(key, (0, 0))
+        if (total, count) != (expected_total, expected_count):
+            user_id, category_id, status, currency = key
+            mismatches.append(
+                f"user {user_id} / category {category_id} / {status.value} / {currency}: "
+                f"stored {total}/12 cents ({count} subs), expected {expected_total}/12 cents ({expected_count} subs)"
+            )
+    return mismatches
@@ -1,49 +1,114 @@
-from flask import Blueprint, jsonify, abort
-from app.models import Subscription, StatusType
+import math
+from collections import defaultdict
+from datetime import date
+from flask import Blueprint, jsonify, abort, request
+from app import db
+from app.category_cache import category_cache
+from app.forecast import forecast_window, forecast_payload, renewal_groups
+from app.fx import fx_table, fx_vary, reporting_currency
+from app.history import history_window, history_payload
+from app.http_cache import conditional
+from app.money import from_twelfths
+from app.pagination import page_args
+from app.rate_limit import rate_limited
+from app.response_cache import cached
+from app.queries import active_spend_by_category, active_subscription_breakdown
+from app.tenancy import current_user_id
 
 bp = Blueprint('analytics', __name__, url_prefix='/analytics')
 
+def wants_breakdown(args):
+    return args.get('breakdown', '').lower() in ('1', 'true', 'yes')
+
+def dashboard_payload(rows, factors, currency, page=None, limit=None):
+    """Dashboard JSON in `currency` from active_spend_by_category() rows (+ an active_subscription_breakdown() page).
+
+    factors: {currency: multiplier into `currency`} (FxTable.factors), applied once per category and currency.
+    Totals are in twelfths of a cent (app.money) until they are rounded for the JSON."""
+    by_category = defaultdict(list)
+    for row in rows:
+        by_category[row.name].append(row.monthly_total_twelfths * factors[row.currency])
+    category_totals = {name: math.fsum(amounts) for name, amounts in by_category.items()}
+    total_monthly_spend = math.fsum(category_totals.values())
+    active_count = sum(row.subscription_count for row in rows)
+
+    # Find Top Category
+    top_cat_name = max(category_totals, key=category_totals.get) if category_totals else None
+
+    result = {
+        "financial_summary": {
+            "currency": currency,
+            "total_monthly_cost": from_twelfths(total_monthly_spend),
+            "total_yearly_projection": from_twelfths(total_monthly_spend * 12),
+            "active_subscription_count": active_count
+        },
+        "category_insights": {
+            "top_spending_category": top_cat_name,
+            "top_category_monthly_total": from_twelfths(category_totals[top_cat_name]) if top_cat_name else 0,
+            "all_category_totals": {k: from_twelfths(v) for k, v in category_totals.items()}
+        }
+    }
+
+    if page is not None:
+        result["subscriptions"] = [
+            {"name": r.name, "monthly_cost": from_twelfths(r.monthly_cost_twelfths * factors[r.currency]), "category": r.category}
+            for r in page
+        ]
+        result["next_after"] = page[-1].id if len(page) == limit else None
+    return result
+
 @bp.route('', methods=['GET'])
+@rate_limited
+@conditional('subscription', 'category', vary=fx_vary)
+@cached('subscription', 'category')
 def get_analytics_dashboard():
+    """Financial dashboard in ?currency= (default REPORTING_CURRENCY). Add ?breakdown=true (with ?limit=&after=) for the per-subscription list."""
+    include_breakdown = wants_breakdown(request.args)
+    if include_breakdown:
+        limit, after = page_args()
+    currency = reporting_currency(request.args)
+
+    user_id = current_user_id()
     try:
-        subs = Subscription.query.filter_by(status=StatusType.ACTIVE).all()
-
-        total_monthly_spend = 0
-        category_totals = {}
-        subscriptions_breakdown = []
-
-        for sub in subs:
-
-            cost = sub.monthly_cost
-            
-            total_monthly_spend += cost
-
-            # Category aggregation
-            cat_name = sub.category_obj.name
-            category_totals[cat_name] = category_totals.get(cat_name, 0) + cost
-
-            subscriptions_breakdown.append({
-                "name": sub.name,
-                "monthly_cost": round(cost, 2),
-                "category": cat_name
-            })
-
-        # 3. Find Top Category
-        top_cat_name = max(category_totals, key=category_totals.get) if category_totals else None
-        
-        return jsonify({
-            "financial_summary": {
-                "total_monthly_cost": round(total_monthly_spend, 2),
-                "total_yearly_projection": round(total_monthly_spend * 12, 2),
-                "active_subscription_count": len(subs)
-            },
-            "category_insights": {
-                "top_spending_category": top_cat_name,
-                "top_category_monthly_total": round(category_totals[top_cat_name], 2) if top_cat_name else 0,
-                "all_category_totals": {k: round(v, 2) for k, v in category_totals.items()}
-            },
-            "subscriptions": subscriptions_breakdown
-        }), 200
+        factors = fx_table().factors(currency, date.today())
+        rows = db.session.execute(active_spend_by_category(user_id)).all()
+        if include_breakdown:
+            page = db.session.execute(active_subscription_breakdown(user_id, limit, after)).all()
+            return jsonify(dashboard_payload(rows, factors, currency, page, limit)), 200
+        return jsonify(dashboard_payload(rows, factors, currency)), 200
 
     except Exception as e:
-        abort(500, description=str(e))
\ No newline at end of file
+        abort(500, description=str(e))
+
+@bp.route('/forecast', methods=['GET'])
+@rate_limited
+@conditional('subscription', vary=lambda: (forecast_window(request.args), fx_vary()))
+@cached('subscription')
+def get_forecast():
+    """Upcoming charges per day and per month for ?from=&to= (default: the next 12 months), in ?currency=."""
+    start, end = forecast_window(request.args)
+    currency = reporting_currency(request.args)
+    try:
+        factors = fx_table().factors(currency, date.today())
+        groups = db.session.execute(renewal_groups(current_user_id(), end)).all()
+        return jsonify(forecast_payload(groups, start, end, factors, currency)), 200
+    except Exception as e:
+        abort(500, description=str(e))
+
+@bp.route('/history', methods=['GET'])
+@rate_limited
+@conditional('subscription', 'category', vary=lambda: (history_window(request.args), fx_vary()))
+@cached('subscription', 'category')
+def get_history():
+    """Active monthly spend per month (or ?granularity=year) from ?from= to ?to=, with period-over-period change, in ?currency=."""
+    granularity, first, last = history_window(request.args)
+    currency = reporting_currency(request.args)
+    user_id = current_user_id()
+    try:
+        payload = history_payload(
+            db.session.connection(), user_id, granularity, first, last,
+            lambda category_id: category_cache.name_for(user_id, category_id), fx_table(), currency
+        )
+        return jsonify(payload), 200
+    except Exception as e:
+        abort(500, description=str(e))
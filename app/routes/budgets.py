@@ -1,40 +1,61 @@
+from datetime import date
 from flask import Blueprint, jsonify, request, abort
 from app import db
-from app.models import Budget, Subscription, StatusType
+from app.alerts import budget_health, stored_status
+from app.fx import fx_table, fx_vary, parse_currency
+from app.http_cache import conditional
+from app.models import Budget
+from app.money import from_cents, to_cents, twelfths_to_cents
+from app.queries import active_monthly_spend
+from app.rate_limit import rate_limited
+from app.response_cache import cached
+from app.tenancy import current_user_id
 
 bp = Blueprint('budgets', __name__, url_prefix='/budgets')
 
+def budget_status_payload(budget, current_spend_cents):
+    """Budget settings and health for GET /budgets (budget may be None, a Budget or a stored BudgetStatus).
+
+    current_spend_cents is in the budget's currency."""
+    if not budget:
+        return {"message": "Budget not set", "monthly_limit": 0}
+
+    remaining, usage_percent, status_label = budget_health(budget.monthly_limit_cents, current_spend_cents)
+
+    return {
+        "config": {
+            "monthly_limit": from_cents(budget.monthly_limit_cents),
+            "currency": budget.currency
+        },
+        "status": {
+            "current_spend": from_cents(current_spend_cents),
+            "remaining": from_cents(remaining),
+            "usage_percent": round(usage_percent, 1),
+            "health_label": status_label
+        }
+    }
+
 @bp.route('', methods=['GET'])
+@rate_limited
+@conditional('budget', 'subscription', 'budget_status', vary=fx_vary)
+@cached('budget', 'subscription', 'budget_status')
 def get_budget_status():
     """Returns budget settings AND current health status."""
+    user_id = current_user_id()
     try:
-        budget = Budget.query.first()
+        # Evaluated by the alerts worker after the last write: one primary-key read
+        status = stored_status(user_id)
+        if status:
+            return jsonify(budget_status_payload(status, status.current_spend_cents)), 200
+
+        budget = Budget.query.filter_by(user_id=user_id).first()
         if not budget:
-            return jsonify({"message": "Budget not set", "monthly_limit": 0}), 200
-
-        # Calculate current spending using Model Logic
-        subs = Subscription.query.filter_by(status=StatusType.ACTIVE).all()
-        current_spend = sum(s.monthly_cost for s in subs)
-        
-        remaining = budget.monthly_limit - current_spend
-        usage_percent = (current_spend / budget.monthly_limit) * 100 if budget.monthly_limit > 0 else 0
-
-        # Determine Health Label
-        status_label = "Good"
-        if usage_percent > 100: status_label = "Over Budget"
-        elif usage_percent > 85: status_label = "Warning"
-
-        return jsonify({
-            "config": {
-                "monthly_limit": budget.monthly_limit
-            },
-            "status": {
-                "current_spend": round(current_spend, 2),
-                "remaining": round(remaining, 2),
-                "usage_percent": round(usage_percent, 1),
-                "health_label": status_label
-            }
-        }), 200
+            return jsonify(budget_status_payload(None, 0)), 200
+
+        # Current spending comes from the incrementally maintained rollup, one sum per currency
+        spend = db.session.execute(active_monthly_spend(user_id)).all()
+        current_spend = twelfths_to_cents(fx_table().convert(spend, budget.currency, date.today()))
+        return jsonify(budget_status_payload(budget, current_spend)), 200
     except Exception as e:
         abort(500, description=str(e))
 
@@ -45,17 +66,22 @@ def update_budget():
         abort(400, description="Missing required field: limit")
 
     try:
-        limit = float(data['limit'])
-        if limit <= 0: abort(400, description="Budget must be positive")
+        limit = to_cents(data['limit'])
     except ValueError:
         abort(400, description="Limit must be a number")
+    if limit <= 0: abort(400, description="Budget must be positive")
+
+    currency = parse_currency(data['currency']) if 'currency' in data else None
 
-    budget = Budget.query.first()
+    user_id = current_user_id()
+    budget = Budget.query.filter_by(user_id=user_id).first()
     if not budget:
-        budget = Budget(monthly_limit=limit)
+        budget = Budget(user_id=user_id, monthly_limit_cents=limit)
         db.session.add(budget)
     else:
-        budget.monthly_limit = limit
+        budget.monthly_limit_cents = limit
+    if currency:
+        budget.currency = currency
 
     db.session.commit()
-    return jsonify({"message": "Budget updated", "monthly_limit": budget.monthly_limit}), 200
\ No newline at end of file
+    return jsonify({"message": "Budget updated", "monthly_limit": from_cents(budget.monthly_limit_cents), "currency": budget.currency}), 200
\ No newline at end of file
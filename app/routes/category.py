@@ -1,25 +1,34 @@
 from flask import Blueprint, request, jsonify, abort
 from app import db
 from app.models import Category
+from app.category_cache import category_cache
+from app.http_cache import conditional
+from app.tenancy import current_user_id
+from app.validation import parse_text
 
 bp = Blueprint('categories', __name__, url_prefix='/categories')
 
 @bp.route('', methods=['GET'])
+@conditional('category')
 def get_categories():
-    cats = Category.query.all()
+    cats = Category.query.filter_by(user_id=current_user_id()).all()
     return jsonify([c.to_json() for c in cats]), 200
 
 @bp.route('', methods=['POST'])
 def create_category():
     data = request.get_json()
-    if not data or 'name' not in data:
+    if not isinstance(data, dict) or 'name' not in data:
         abort(400, description='Missing required field: name')
+    name = parse_text(data, 'name')
     
-    # Check if unique
-    if Category.query.filter_by(name=data['name']).first():
-         abort(409, description=f"Category '{data['name']}' already exists")
+    # Check if unique (per user)
+    user_id = current_user_id()
+    if Category.query.filter_by(user_id=user_id, name=name).first():
+         abort(409, description=f"Category '{name}' already exists")
 
-    new_cat = Category(name=data['name'])
+    new_cat = Category(user_id=user_id, name=name)
     db.session.add(new_cat)
+    db.session.flush()
+    category_cache.invalidate(user_id)
     db.session.commit()
     return jsonify({'message': 'Category created', 'category': new_cat.to_json()}), 201
\ No newline at end of file
@@ -1,56 +1,108 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, url_for, Response, stream_with_context, current_app
 from app import db
-from app.models import Subscription, Category, FrequencyType, StatusType, Budget
-from sqlalchemy import func
-from datetime import date, datetime
+from app import bulk, importer
+from app.category_cache import category_cache
+from app.http_cache import conditional
+from app.models import Subscription, Category, SUBSCRIPTION_FIELDS, normalize_name
+from app.pagination import page_args
+from app.queries import subscription_listing
+from app.serialization import subscription_rows_response, subscription_batch_encoder
+from app.tenancy import current_user_id
+from app.validation import parse_new_subscription, parse_subscription_changes, parse_listing_args
+from werkzeug.exceptions import HTTPException
 
 bp = Blueprint('subscriptions', __name__, url_prefix='/subscriptions')
 
+EXPORT_BATCH_SIZE = 1000
+MAX_BULK_ITEMS = 10000
+MAX_REPORTED_IMPORT_ERRORS = 100
+
 # --- Helper ---
-def get_or_create_category(category_name):
-    category = Category.query.filter(func.lower(Category.name) == category_name.lower()).first()
-    if not category:
-        category = Category(name=category_name.capitalize())
+def get_or_create_category_id(user_id, category_name):
+    category_id = category_cache.id_for(user_id, category_name)
+    if category_id is None:
+        category = Category(user_id=user_id, name=category_name.capitalize())
         db.session.add(category)
-        db.session.commit() 
-    return category
+        db.session.flush()  # get an id; committed together with the subscription
+        category_cache.invalidate(user_id)
+        category_id = category.id
+    return category_id
+
+def get_own_subscription(id, message):
+    """Loads a subscription of the current user; other users' rows are reported as missing."""
+    sub = db.session.get(Subscription, id)
+    if not sub or sub.user_id != current_user_id():
+        abort(404, description=message)
+    return sub
+
+def parse_fields(raw):
+    """Turns ?fields=name,price into a validated tuple of to_json() keys (all keys when absent)."""
+    if not raw:
+        return SUBSCRIPTION_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in SUBSCRIPTION_FIELDS]
+    if unknown or not fields:
+        abort(400, description=f"Invalid fields: {', '.join(unknown)}. Allowed: {', '.join(SUBSCRIPTION_FIELDS)}")
+    return fields
 
 # --- Routes ---
 
-# GET ALL (with optional ?category= and ?status= filters)
+# GET ALL (with optional filters, ?q= name prefix, ?sort=, ?fields= projection and ?limit=&after= keyset paging)
 @bp.route('', methods=['GET'])
+@conditional('subscription', 'category')
 def get_subscriptions():
-    query = Subscription.query
-
     # get param
-    category_name = request.args.get('category')
-    status_name = request.args.get('status')
-
-    # filter for category
-    if category_name:
-        query = query.join(Category).filter(
-            func.lower(Category.name) == category_name.lower()
-        )
-
-    # filter for status (chain filter from above)
-    if status_name:
-        query = query.filter(
-            func.lower(Subscription.status) == status_name.lower()
-        )
+    listing = parse_listing_args(request.args)
+    fields = parse_fields(request.args.get('fields'))
+    limit, after = page_args(default_limit=None)
 
-    subs = query.all()
-    if not subs:
-             return jsonify({
-                'message': f'No subscriptions found in category: {category_name}', 
-                'subscriptions': []
-            }), 404
+    # no match is an empty list, not an error
+    rows = db.session.execute(
+        subscription_listing(current_user_id(), fields, limit=limit, after=after, **listing)
+    ).all()
 
     # return result
-    return jsonify([sub.to_json() for sub in subs]), 200
+    response = subscription_rows_response(rows, fields)
+    if limit is not None and len(rows) == limit:
+        next_after = rows[-1].id
+        response.headers['X-Next-After'] = str(next_after)
+        next_args = {**request.args.to_dict(), 'after': next_after}
+        response.headers['Link'] = f'<{url_for(".get_subscriptions", **next_args)}>; rel="next"'
+    return response, 200
+
+# EXPORT (streams every matching row; ?format=ndjson (default) or ?format=json)
+@bp.route('/export', methods=['GET'])
+def export_subscriptions():
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'json'):
+        abort(400, description="Invalid format. Allowed: ndjson, json")
+
+    stmt = subscription_listing(
+        current_user_id(), SUBSCRIPTION_FIELDS, **parse_listing_args(request.args)
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def generate():
+        # server-side cursor: only one batch of rows is held in memory at a time
+        encode = subscription_batch_encoder()
+        batches = db.session.execute(stmt).partitions()
+        if export_format == 'ndjson':
+            for batch in batches:
+                yield ''.join([line + '\n' for line in encode(batch)])
+        else:
+            yield '['
+            separator = ''
+            for batch in batches:
+                yield separator + ','.join(encode(batch))
+                separator = ','
+            yield ']\n'
+
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 @bp.route('/<int:id>', methods=['GET'])
+@conditional('subscription', 'category')
 def get_subscription(id):
-    sub = db.session.get(Subscription, id)
-    if not sub: abort(404, description=f"Subscription {id} not found")
+    sub = get_own_subscription(id, f"Subscription {id} not found")
     return jsonify(sub.to_json()), 200
 
 @bp.route('', methods=['POST'])
@@ -58,39 +110,19 @@ def create_subscription():
     try:
         data = request.get_json()
 
-        # 1. Validate required fields
-        required = {'name', 'price', 'frequency', 'category'} 
-        if not data or not all(k in data for k in required):
-            abort(400, description=f"Missing required fields: {', '.join(required - data.keys())}")
+        # Validate and convert
+        values = parse_new_subscription(data)
 
         # Check Duplicates
-        if Subscription.query.filter(func.lower(Subscription.name) == data['name'].lower()).first():
-            abort(409, description=f"Subscription '{data['name']}' already exists.")
-
-        # Data Conversion
-        try:
-            price = float(data['price'])
-            if price < 0: raise ValueError
-            freq_enum = FrequencyType(data['frequency'])
-        except ValueError:
-            abort(400, description="Invalid price or frequency")
-
-        status_enum = StatusType.ACTIVE
-        if 'status' in data:
-            try: status_enum = StatusType(data['status'])
-            except ValueError: abort(400, description="Invalid status")
-
-        start_date = date.today()
-        if 'start_date' in data:
-            try: start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
-            except ValueError: abort(400, description="Invalid date format YYYY-MM-DD")
+        user_id = current_user_id()
+        if Subscription.query.filter(
+            Subscription.user_id == user_id, Subscription.name_normalized == normalize_name(values['name'])
+        ).first():
+            abort(409, description=f"Subscription '{values['name']}' already exists.")
 
         # Create
-        cat_obj = get_or_create_category(data['category'])
-        new_sub = Subscription(
-            name=data['name'], price=price, frequency=freq_enum,
-            category_id=cat_obj.id, status=status_enum, start_date=start_date
-        )
+        category_id = get_or_create_category_id(user_id, values.pop('category'))
+        new_sub = Subscription(user_id=user_id, category_id=category_id, **values)
         db.session.add(new_sub)
         db.session.commit()
         
@@ -100,41 +132,99 @@ def create_subscription():
         if hasattr(e, 'code'): raise e
         abort(500, description=str(e))
 
+# BULK (create/update/delete many items in one transaction)
+@bp.route('/bulk', methods=['POST'])
+def bulk_subscriptions():
+    """Body: JSON array of items, each with "op" = create (default) | update | delete.
+    Updates and deletes carry an "id". Returns one result per item, in input order."""
+    items = request.get_json()
+    if not isinstance(items, list):
+        abort(400, description="Expected a JSON array of items")
+    if len(items) > MAX_BULK_ITEMS:
+        abort(400, description=f"Too many items (max {MAX_BULK_ITEMS})")
+
+    results = [None] * len(items)
+    creates, updates, deletes = [], [], []
+    for index, item in enumerate(items):
+        try:
+            op = item.get('op', 'create') if isinstance(item, dict) else None
+            if op == 'create':
+                creates.append((index, parse_new_subscription(item)))
+            elif op in ('update', 'delete'):
+                if not isinstance(item.get('id'), int):
+                    abort(400, description="Missing or invalid id")
+                if op == 'update':
+                    updates.append((index, item['id'], parse_subscription_changes(item)))
+                else:
+                    deletes.append((index, item['id']))
+            else:
+                abort(400, description="Invalid op. Allowed: create, update, delete")
+        except HTTPException as e:
+            results[index] = {'index': index, 'status': e.code, 'error': e.description}
+
+    try:
+        for result in bulk.apply(current_user_id(), creates, updates, deletes):
+            results[result['index']] = result
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=str(e))
+
+    summary = {'succeeded': sum(1 for r in results if r['status'] < 400)}
+    summary['failed'] = len(results) - summary['succeeded']
+    return jsonify({'results': results, 'summary': summary}), 200
+
+# IMPORT (a CSV or NDJSON file of creates, streamed and committed in chunks)
+@bp.route('/import', methods=['POST'])
+def import_subscriptions():
+    """Body: the file itself (Content-Type text/csv or application/x-ndjson) or a multipart "file" field.
+    ?format=csv|ndjson overrides detection; ?resume=<import id> continues an interrupted import of the same file."""
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    if upload:
+        stream, source = upload.stream, upload.filename or 'upload'
+        fmt = importer.detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, source = request.stream, 'upload'
+        fmt = importer.detect_format(mimetype=request.mimetype)
+    fmt = request.args.get('format', fmt)
+    if fmt not in importer.FORMATS:
+        abort(400, description=f"Unknown file format. Pass ?format= with one of: {', '.join(importer.FORMATS)}")
+
+    user_id = current_user_id()
+    if 'resume' in request.args:
+        job = importer.find_job(user_id, request.args.get('resume', type=int))
+        if job is None:
+            abort(404, description=f"Import {request.args['resume']} not found")
+        if job.finished:
+            abort(409, description=f"Import {job.id} already finished")
+    else:
+        job = importer.start_job(user_id, source)
+
+    errors = []
+    def on_error(line, message):
+        if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+            errors.append({'line': line, 'error': message})
+
+    try:
+        job = importer.run_import(
+            user_id, job, importer.read_rows(stream, fmt), current_app.config['IMPORT_CHUNK_SIZE'], on_error
+        )
+    except Exception as e:
+        abort(500, description=f"Import {job.id} stopped after {job.rows_read} rows ({e}); resume with ?resume={job.id}")
+    return jsonify({'import': job.to_json(), 'errors': errors, 'errors_truncated': job.failed > len(errors)}), 200
+
 # UPDATE
 @bp.route('/<int:id>', methods=['PUT'])
 def update_subscription(id):
     try:
-        sub = db.session.get(Subscription, id)
-        if not sub:
-             abort(404, description=f"Subscription with ID {id} not found")
+        sub = get_own_subscription(id, f"Subscription with ID {id} not found")
 
-        data = request.get_json()
+        changes = parse_subscription_changes(request.get_json())
 
-        if 'name' in data: sub.name = data['name']
-        
-        if 'price' in data:
-            try:
-                val = float(data['price'])
-                if val < 0: raise ValueError
-                sub.price = val
-            except ValueError:
-                abort(400, description='Invalid price')
-
-        if 'frequency' in data:
-            try:
-                sub.frequency = FrequencyType(data['frequency'])
-            except ValueError:
-                abort(400, description=f'Invalid frequency. Allowed: {[e.value for e in FrequencyType]}')
-        
-        if 'status' in data:
-            try:
-                sub.status = StatusType(data['status'])
-            except ValueError:
-                abort(400, description=f'Invalid status. Allowed: {[e.value for e in StatusType]}')
-
-        if 'category' in data: 
-            cat_obj = get_or_create_category(data['category'])
-            sub.category_id = cat_obj.id
+        if 'category' in changes: 
+            sub.category_id = get_or_create_category_id(sub.user_id, changes.pop('category'))
+        for field, value in changes.items():
+            setattr(sub, field, value)
 
         db.session.commit()
         return jsonify({'message': 'Updated', 'subscription': sub.to_json()}), 200
@@ -145,9 +235,7 @@ def update_subscription(id):
 # DELETE
 @bp.route('/<int:id>', methods=['DELETE'])
 def delete_subscription(id):
-    sub = db.session.get(Subscription, id)
-    if not sub:
-        abort(404, description=f"Cannot delete: Subscription {id} does not exist")
+    sub = get_own_subscription(id, f"Cannot delete: Subscription {id} does not exist")
     
     deleted_data = sub.to_json()
     db.session.delete(sub)
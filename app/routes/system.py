@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify, abort
+from app.instrumentation import get_metrics
+from app.response_cache import get_cache, get_single_flight
+
+bp = Blueprint('system', __name__)
+
+@bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Response cache counters for this worker (hits, misses, evictions, invalidations, coalesced)."""
+    cache, flight = get_cache(), get_single_flight()
+    coalesced = flight.stats['coalesced'] if flight is not None else 0
+    if cache is None:
+        return jsonify({"enabled": False, "coalesced": coalesced}), 200
+    return jsonify({"enabled": True, "backend": type(cache.backend).__name__, **cache.stats, "coalesced": coalesced}), 200
+
+@bp.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """Per-route request, SQL and serialization histograms for this worker (Prometheus text format)."""
+    metrics = get_metrics()
+    if metrics is None:
+        abort(404, description="Instrumentation is disabled (set INSTRUMENTATION=true)")
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
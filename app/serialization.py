@@ -0,0 +1,142 @@
+"""Fast JSON paths that produce the same bytes as Flask's default provider.
+
+* FastJSONProvider encodes jsonify() responses with orjson when it is installed
+  (FAST_JSON=true). It falls back to the stdlib encoder whenever orjson's output
+  could differ: non-ASCII text, DEL characters, exponent-form floats, non-finite
+  floats (null for orjson, NaN / Infinity for the stdlib), and values orjson refuses.
+* rows_encoder() writes subscription rows (see models.subscription_columns) straight
+  to JSON text. It encodes one column at a time (enums through lookup tables of
+  already-encoded strings) and fills a precomputed per-row template.
+
+Both assume the default provider settings (sort_keys, ensure_ascii); anything else
+falls back to jsonify()."""
+import dataclasses
+import json
+import math
+import re
+from operator import itemgetter
+from json.encoder import encode_basestring_ascii
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from app.instrumentation import serialize_timer
+from app.models import FrequencyType, StatusType, SUBSCRIPTION_FIELDS, subscription_row_to_json
+from app.money import from_cents, from_twelfths
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# --- Provider ---
+
+# Where orjson and json.dumps disagree: orjson never uses exponents below 1e-4
+# (0.00001 vs 1e-05), writes 1e16 instead of 1e+16, and leaves DEL unescaped.
+_ORJSON_MISMATCH = re.compile(rb'\de|\.0000|\x7f')
+
+if orjson is not None:
+    # dates, dataclasses and str/int/dict subclasses go through Flask's default() like before
+    _ORJSON_OPTIONS = (
+        orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+    )
+
+def _has_non_finite(obj):
+    """Whether a NaN or an infinity hides anywhere in `obj` (orjson writes them as null)."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(map(_has_non_finite, obj.values()))
+    if isinstance(obj, (list, tuple)):
+        return any(map(_has_non_finite, obj))
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return _has_non_finite(dataclasses.asdict(obj))
+    return False
+
+class FastJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider whose compact responses are encoded by orjson when possible.
+
+    dumps() and loads() stay on the stdlib."""
+
+    def response(self, *args, **kwargs):
+        compact = not ((self.compact is None and self._app.debug) or self.compact is False)
+        if orjson is None or not compact or not self.sort_keys or not self.ensure_ascii:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            body = None
+        if (body is None or not body.isascii() or _ORJSON_MISMATCH.search(body)
+                or (b'null' in body and _has_non_finite(obj))):
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+# --- Columnar subscription rows ---
+
+_ENUM_JSON = {member: json.dumps(member.value) for enum in (FrequencyType, StatusType) for member in enum}
+_NON_FINITE = {'nan': 'NaN', 'inf': 'Infinity', '-inf': '-Infinity'}
+
+def _numbers(values):
+    if all(map(math.isfinite, values)):
+        return list(map(repr, values))
+    return [_NON_FINITE.get(text, text) for text in map(repr, values)]
+
+def _dates(values):
+    return [f'"{value.isoformat()}"' if value else 'null' for value in values]
+
+# field -> encoder of a whole column (list of values -> list of JSON texts)
+_COLUMN_ENCODERS = {
+    "id": lambda values: list(map(int.__repr__, values)),
+    "name": lambda values: list(map(encode_basestring_ascii, values)),
+    "price": lambda values: _numbers(list(map(from_cents, values))),
+    "currency": lambda values: list(map(encode_basestring_ascii, values)),
+    "frequency": lambda values: list(map(_ENUM_JSON.__getitem__, values)),
+    "category": lambda values: list(map(encode_basestring_ascii, values)),
+    "start_date": _dates,
+    "status": lambda values: list(map(_ENUM_JSON.__getitem__, values)),
+    "monthly_cost": lambda values: _numbers(list(map(from_twelfths, values))),
+}
+
+def rows_encoder(fields=SUBSCRIPTION_FIELDS, compact=True):
+    """Returns rows -> [JSON object text per row] for rows whose first columns are `fields`, in that order.
+
+    Each column is encoded in one pass, then the texts are slotted into a per-layout
+    template. Matches json.dumps(subscription_row_to_json(row, fields), sort_keys=True)
+    with compact (",", ":") or default (", ", ": ") separators."""
+    key_sep, item_sep = (':', ',') if compact else (': ', ', ')
+    order = sorted(range(len(fields)), key=fields.__getitem__)
+    template = '{' + item_sep.join(encode_basestring_ascii(fields[i]) + key_sep + '%s' for i in order) + '}'
+
+    def encode(rows):
+        if not rows:
+            return []
+        columns = [_COLUMN_ENCODERS[fields[i]](list(map(itemgetter(i), rows))) for i in order]
+        return list(map(template.__mod__, zip(*columns)))
+    return encode
+
+def _default_layout(compact):
+    """True when the app's provider would write what rows_encoder writes."""
+    provider = getattr(current_app.json, 'inner', current_app.json)
+    if type(provider) not in (DefaultJSONProvider, FastJSONProvider):
+        return False
+    if not (provider.sort_keys and provider.ensure_ascii):
+        return False
+    if compact:
+        return not ((provider.compact is None and current_app.debug) or provider.compact is False)
+    return True
+
+def subscription_rows_response(rows, fields=SUBSCRIPTION_FIELDS):
+    """jsonify([subscription_row_to_json(row, fields) for row in rows]), without the dicts."""
+    if not _default_layout(compact=True):
+        return current_app.json.response([subscription_row_to_json(row, fields) for row in rows])
+    with serialize_timer():
+        body = '[' + ','.join(rows_encoder(fields)(rows)) + ']\n'
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
+
+def subscription_batch_encoder():
+    """rows -> [current_app.json.dumps(subscription_row_to_json(row)) per row], for streamed exports."""
+    if _default_layout(compact=False):
+        return rows_encoder(SUBSCRIPTION_FIELDS, compact=False)
+    dumps = current_app.json.dumps
+    return lambda rows: [dumps(subscription_row_to_json(row)) for row in rows]
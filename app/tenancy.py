@@ -0,0 +1,64 @@
+"""Which user a request (or CLI command) acts for.
+
+Requests name their user in the X-User-Id header; without it they act for
+DEFAULT_USER_ID, which keeps single-user deployments working unchanged.
+
+The header is not authenticated: anyone who can reach the app can act for any
+user. Deploy it behind a trusted proxy that authenticates the caller, strips any
+X-User-Id the client sent and sets its own. Or set USER_ID_PROVIDER to a callable
+(or a 'module:name' import string) that takes the request headers and returns the
+user id from a credential it verifies, None for the default user."""
+import contextvars
+from contextlib import contextmanager
+from flask import g, request, abort, current_app, has_request_context, has_app_context
+from werkzeug.utils import import_string
+
+USER_HEADER = 'X-User-Id'
+DEFAULT_USER_ID = 1
+
+_acting_user = contextvars.ContextVar('acting_user', default=None)
+
+def _default_user_id():
+    return current_app.config.get('DEFAULT_USER_ID', DEFAULT_USER_ID) if has_app_context() else DEFAULT_USER_ID
+
+def current_user_id():
+    override = _acting_user.get()
+    if override is not None:
+        return override
+    if not has_request_context():
+        return _default_user_id()
+
+    if '_user_id' not in g:
+        g._user_id = user_id_for(request.headers, current_app.config)
+    return g._user_id
+
+def header_user_id(headers):
+    """The default USER_ID_PROVIDER: the X-User-Id header, as set by the trusted proxy."""
+    return headers.get(USER_HEADER)
+
+def user_id_for(headers, config):
+    """The user a request with these headers acts for (Flask's or asgi.py's); 400 when malformed."""
+    provider = config.get('USER_ID_PROVIDER') or header_user_id
+    if isinstance(provider, str):
+        provider = import_string(provider)
+    return parse_user_id(provider(headers), config.get('DEFAULT_USER_ID', DEFAULT_USER_ID))
+
+def parse_user_id(raw, default):
+    """A provided user id (the X-User-Id header value) as an int (`default` when None); 400 when malformed."""
+    if raw is None:
+        return default
+    try:
+        user_id = int(raw)
+        if user_id <= 0: raise ValueError
+    except (ValueError, TypeError):
+        abort(400, description=f"{USER_HEADER} must be a positive integer")
+    return user_id
+
+@contextmanager
+def acting_as(user_id):
+    """Runs a block (CLI command, background job) on behalf of `user_id`."""
+    token = _acting_user.set(user_id)
+    try:
+        yield
+    finally:
+        _acting_user.reset(token)
@@ -0,0 +1,108 @@
+"""Payload and query-string validation shared by the single-item routes, the bulk endpoint and the listings."""
+from flask import abort
+from datetime import date, datetime
+from app.fx import parse_currency
+from app.models import FrequencyType, StatusType, base_currency
+from app.money import to_cents
+from app.queries import SORTS
+
+REQUIRED_FIELDS = {'name', 'price', 'frequency', 'category'}
+
+def parse_text(data, field):
+    """A name-like field: a string with something other than whitespace in it, or 400."""
+    value = data[field]
+    if not isinstance(value, str) or not value.strip():
+        abort(400, description=f"{field} must be a non-empty string")
+    return value
+
+def parse_new_subscription(data):
+    """Validates a create payload. Returns column values (category as a name) or aborts with 400."""
+    if not isinstance(data, dict) or not all(k in data for k in REQUIRED_FIELDS):
+        missing = REQUIRED_FIELDS - (data.keys() if isinstance(data, dict) else set())
+        abort(400, description=f"Missing required fields: {', '.join(missing)}")
+    name, category = parse_text(data, 'name'), parse_text(data, 'category')
+
+    try:
+        price_cents = to_cents(data['price'])
+        if price_cents < 0: raise ValueError
+        freq_enum = FrequencyType(data['frequency'])
+    except (ValueError, TypeError):
+        abort(400, description="Invalid price or frequency")
+
+    status_enum = StatusType.ACTIVE
+    if 'status' in data:
+        try: status_enum = StatusType(data['status'])
+        except (ValueError, TypeError): abort(400, description="Invalid status")
+
+    currency = parse_currency(data['currency']) if data.get('currency') else base_currency()
+
+    start_date = date.today()
+    if 'start_date' in data:
+        try: start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        except (ValueError, TypeError): abort(400, description="Invalid date format YYYY-MM-DD")
+
+    return {
+        'name': name, 'price_cents': price_cents, 'currency': currency, 'frequency': freq_enum,
+        'status': status_enum, 'start_date': start_date, 'category': category
+    }
+
+def parse_subscription_changes(data):
+    """Validates an update payload. Returns only the fields present, or aborts with 400."""
+    if not isinstance(data, dict):
+        abort(400, description="Expected a JSON object")
+
+    changes = {}
+    if 'name' in data: changes['name'] = parse_text(data, 'name')
+
+    if 'price' in data:
+        try:
+            val = to_cents(data['price'])
+            if val < 0: raise ValueError
+            changes['price_cents'] = val
+        except (ValueError, TypeError):
+            abort(400, description='Invalid price')
+
+    if 'currency' in data: changes['currency'] = parse_currency(data['currency'])
+
+    if 'frequency' in data:
+        try:
+            changes['frequency'] = FrequencyType(data['frequency'])
+        except (ValueError, TypeError):
+            abort(400, description=f'Invalid frequency. Allowed: {[e.value for e in FrequencyType]}')
+
+    if 'status' in data:
+        try:
+            changes['status'] = StatusType(data['status'])
+        except (ValueError, TypeError):
+            abort(400, description=f'Invalid status. Allowed: {[e.value for e in StatusType]}')
+
+    if 'category' in data: changes['category'] = parse_text(data, 'category')
+    return changes
+
+def parse_listing_args(args):
+    """Reads the listing filters and ?sort= from the query string. Returns subscription_listing() keyword arguments or aborts with 400.
+
+    ?sort= is one of SORTS, descending with a leading '-'; ?q= is a name prefix;
+    ?price_min= / ?price_max= (currency units, compared in cents) and ?start_from= / ?start_to= (YYYY-MM-DD) are inclusive."""
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORTS:
+        abort(400, description=f"Invalid sort. Allowed: {', '.join(SORTS)} (prefix with - for descending)")
+
+    try:
+        price_min, price_max = (to_cents(args[k]) if k in args else None for k in ('price_min', 'price_max'))
+    except ValueError:
+        abort(400, description="price_min and price_max must be numbers")
+    try:
+        start_from, start_to = (
+            datetime.strptime(args[k], '%Y-%m-%d').date() if k in args else None for k in ('start_from', 'start_to')
+        )
+    except ValueError:
+        abort(400, description="start_from and start_to must be dates in YYYY-MM-DD format")
+
+    return {
+        'category_name': args.get('category'), 'status_name': args.get('status'), 'search': args.get('q'),
+        'price_min': price_min, 'price_max': price_max, 'start_from': start_from, 'start_to': start_to,
+        'sort': sort, 'descending': descending,
+    }
@@ -0,0 +1,43 @@
+"""Bumps DataVersion counters for every (table, user) a transaction wrote to.
+
+Tables touched by flushes or by ORM bulk statements are collected on the session
+and their counters incremented just before COMMIT, inside the same transaction,
+so a reader never sees new data with an old version (ETags, caches)."""
+from itertools import chain
+from sqlalchemy import event
+from app import db
+from app.models import DataVersion
+from app.tenancy import current_user_id
+
+VERSIONED_TABLES = {'subscription', 'category', 'budget', 'budget_status'}  # budget_status: the alerts worker's writes
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+@event.listens_for(db.session, 'after_flush')
+def _record_flushed_tables(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in VERSIONED_TABLES and (obj not in session.dirty or session.is_modified(obj)):
+            _touched(session).add((table, obj.user_id))
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _record_bulk_statements(orm_execute_state):
+    # bulk statements are always scoped to the acting user (see app.bulk)
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        for mapper in orm_execute_state.all_mappers:
+            if mapper.local_table.name in VERSIONED_TABLES:
+                _touched(orm_execute_state.session).add((mapper.local_table.name, current_user_id()))
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_touched_versions(session):
+    session.flush()
+    touched = session.info.pop('touched_tables', set())
+    for name, user_id in sorted(touched):
+        DataVersion.bump(name, user_id)
+    session.info['committed_tables'] = touched  # read by after_commit hooks (response cache)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_touched_tables(session):
+    session.info.pop('touched_tables', None)
+    session.info.pop('committed_tables', None)
@@ -0,0 +1,176 @@
+"""Many concurrent dashboard pollers: threaded WSGI server vs. the ASGI app.
+
+Seeds a scratch SQLite file, then runs each server in its own process on it:
+
+* sync  - the Flask app on Werkzeug's threaded server (one thread per connection)
+* async - asgi.py's AsyncApp on uvicorn (needs `pip install uvicorn aiosqlite`)
+
+For every concurrency level, that many connections (kept alive when the server allows it) poll GET /analytics,
+/budgets and /subscriptions?limit=20 for random users, as fast as they can, for a
+fixed time. Reports throughput, p50/p95/p99 latency and each server's peak RSS.
+
+    python -m benchmarks.concurrency
+    python -m benchmarks.concurrency --concurrency 10 100 500 --seconds 10 --subscriptions 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import percentile, peak_rss_mb
+
+PATHS = ('/analytics', '/budgets', '/subscriptions?limit=20')
+
+# --- Server process ---
+
+def serve(mode, port):
+    """Runs one server until SIGTERM, then prints its peak RSS as JSON."""
+    def stop(*args):
+        raise KeyboardInterrupt
+    # uvicorn shuts down gracefully on SIGTERM, then re-raises it into this handler
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        if mode == 'sync':
+            from werkzeug.serving import make_server
+            from app import create_app
+            from benchmarks.drivers import QuietHandler
+            make_server('127.0.0.1', port, create_app(), threaded=True, request_handler=QuietHandler).serve_forever()
+        else:
+            import uvicorn
+            from app.asgi import create_asgi_app
+            uvicorn.Server(uvicorn.Config(create_asgi_app(), host='127.0.0.1', port=port, log_level='warning')).run()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps({'peak_rss_mb': peak_rss_mb()}), flush=True)
+
+# --- Load generator ---
+
+async def _get(reader, writer, path, user):
+    """One request on an open connection. Returns (status, whether the server keeps the connection)."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nX-User-Id: {user}\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'connection':
+            keep_alive = value.strip().lower() != 'close'
+    await reader.readexactly(length)
+    return int(status_line.split()[1]), keep_alive
+
+async def _poller(port, users, deadline, samples, errors, rng):
+    connection = None
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if connection is None:
+                # Werkzeug's server closes after every response, so its requests include the connect
+                connection = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await _get(*connection, rng.choice(PATHS), rng.randint(1, users))
+            samples.append((time.perf_counter() - started) * 1000)
+            errors[0] += status >= 400
+            if not keep_alive:
+                connection[1].close()
+                connection = None
+    finally:
+        if connection is not None:
+            connection[1].close()
+
+async def _load(port, users, concurrency, seconds):
+    samples, errors = [], [0]
+    rng = random.Random(concurrency)
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(_poller(port, users, deadline, samples, errors, rng) for _ in range(concurrency)))
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'errors': errors[0],
+        'throughput_rps': round(len(samples) / seconds, 1),
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+    }
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+def run_mode(mode, env, users, levels, seconds):
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.concurrency', '--serve', mode, '--port', str(port)],
+        env=env, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        _wait_for(port)
+        asyncio.run(_load(port, users, 1, 1))  # warm up
+        results = {str(level): asyncio.run(_load(port, users, level, seconds)) for level in levels}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        output, _ = server.communicate(timeout=30)
+    return {'peak_rss_mb': json.loads(output.strip().splitlines()[-1])['peak_rss_mb'], 'concurrency': results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--subscriptions', type=int, default=100_000)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    # many pollers need many sockets
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4 * max(args.concurrency) + 256)), hard))
+
+    from app import create_app, db
+    from benchmarks import datasets
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+        with app.app_context():
+            db.create_all()
+            dataset = datasets.seed(args.subscriptions)
+            db.session.remove()
+            db.engine.dispose()
+
+        env = {**os.environ, 'DATABASE_URL': url, 'RESPONSE_CACHE_BACKEND': 'none', 'RATE_LIMIT_BACKEND': 'none',
+               'DB_POOL_SIZE': '20', 'DB_MAX_OVERFLOW': '20'}
+        report = {
+            'subscriptions': args.subscriptions,
+            'users': dataset.users,
+            'seconds': args.seconds,
+            'modes': {mode: run_mode(mode, env, dataset.users, args.concurrency, args.seconds) for mode in args.modes},
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Synthetic datasets for the benchmarks, written with bulk Core inserts.
+
+Subscriptions are spread over users in blocks of `subs_per_user`, so user u owns
+ids (u - 1) * subs_per_user + 1 .. u * subs_per_user. Prices are spread over the
+base currency and the FX_RATES currencies, so the reads pay for their conversions."""
+import random
+from datetime import date, timedelta
+from sqlalchemy import insert
+from app import db, rollup, history, fx
+from app.migrations import populate_subscription_events
+from app.models import Category, Subscription, Budget, FrequencyType, StatusType, base_currency
+
+CATEGORIES = ('Entertainment', 'Productivity', 'Utilities')
+FX_RATES = {'EUR': 1.08, 'GBP': 1.27, 'JPY': 0.0067}  # value in the base currency, from 2024-01-01
+CHUNK = 50_000
+
+class Dataset:
+    def __init__(self, subscriptions, subs_per_user):
+        self.subs_per_user = min(subs_per_user, subscriptions)
+        self.users = -(-subscriptions // self.subs_per_user)
+        self.subscriptions = subscriptions
+
+    def owner_of(self, sub_id):
+        return (sub_id - 1) // self.subs_per_user + 1
+
+def _chunks(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def seed(subscriptions, subs_per_user=50, seed=42):
+    """Fills an empty schema, rebuilds the spend rollup and compacts the change log. Returns the Dataset layout."""
+    dataset = Dataset(subscriptions, subs_per_user)
+    conn = db.session.connection()
+    rng = random.Random(seed)
+    frequencies, statuses = list(FrequencyType), list(StatusType)
+    users = range(1, dataset.users + 1)
+
+    fx.load_rates((currency, date(2024, 1, 1), rate) for currency, rate in FX_RATES.items())
+    currencies = [base_currency(), *(c for c in FX_RATES if c != base_currency())]
+
+    for batch in _chunks({'user_id': u, 'monthly_limit_cents': 10000} for u in users):
+        conn.execute(insert(Budget), batch)
+    categories = ({'id': (u - 1) * len(CATEGORIES) + i + 1, 'user_id': u, 'name': name}
+                  for u in users for i, name in enumerate(CATEGORIES))
+    for batch in _chunks(categories):
+        conn.execute(insert(Category), batch)
+
+    def subscription_rows():
+        for sub_id in range(1, subscriptions + 1):
+            u = dataset.owner_of(sub_id)
+            n = (sub_id - 1) % dataset.subs_per_user
+            yield {
+                'id': sub_id,
+                'user_id': u,
+                'name': f'Service {n}',
+                'name_normalized': f'service {n}',
+                'price_cents': round(rng.uniform(1, 50) * 100),
+                'currency': rng.choice(currencies),
+                'frequency': rng.choice(frequencies),
+                'status': rng.choice(statuses),
+                'start_date': date(2024, 1, 1) + timedelta(days=rng.randrange(365)),
+                'category_id': (u - 1) * len(CATEGORIES) + rng.randrange(len(CATEGORIES)) + 1,
+            }
+    for batch in _chunks(subscription_rows()):
+        conn.execute(insert(Subscription.__table__), batch)
+
+    rollup.rebuild(conn)
+    populate_subscription_events(conn)  # one 'created' event per subscription, compacted like production
+    history.compact(conn)
+    db.session.commit()
+    return dataset
@@ -0,0 +1,58 @@
+"""Ways of sending requests to the app: in-process through the Flask test client,
+or over HTTP to a local WSGI server running in a background thread."""
+import http.client
+import json
+import threading
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+class TestClientDriver:
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json=None):
+        res = self.client.open(path, method=method, headers=headers, json=json)
+        res.get_data()  # drain streamed bodies
+        res.close()
+        return res.status_code
+
+    def close(self):
+        pass
+
+class QuietHandler(WSGIRequestHandler):
+    # HTTP/1.1 for chunked streaming; Werkzeug still closes the connection after each response
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+class WSGIServerDriver:
+    name = 'wsgi_server'
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, request_handler=QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+
+    def request(self, method, path, headers=None, json=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _dumps(json)
+            headers['Content-Type'] = 'application/json'
+        self.conn.request(method, path, body=body, headers=headers)
+        res = self.conn.getresponse()
+        res.read()
+        return res.status
+
+    def close(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.thread.join()
+
+def _dumps(payload):
+    return json.dumps(payload).encode()
+
+DRIVERS = {d.name: d for d in (TestClientDriver, WSGIServerDriver)}
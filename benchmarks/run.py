@@ -0,0 +1,202 @@
+"""Benchmark every route at several dataset sizes and report the results as JSON.
+
+    python -m benchmarks.run                                  # 1k, 100k and 1M subscriptions
+    python -m benchmarks.run --sizes 1000 --output bench.json
+    python -m benchmarks.run --sizes 1000 --baseline bench.json   # exits 1 on regressions
+
+For each size a fresh process seeds a scratch SQLite file, then sends every
+scenario through each driver (Flask test client, local WSGI server). It records
+throughput, p50/p95/p99 latency, SQL queries per request, error count and the
+process's peak RSS.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, -(-len(sorted_samples) * pct // 100) - 1)
+    return sorted_samples[int(index)]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+class QueryCounter:
+    """Counts statements sent to the database, whichever thread and engine (primary or read) sends them."""
+    def __init__(self, *engines):
+        from sqlalchemy import event
+        self.count = 0
+        for engine in filter(None, engines):
+            event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        # the read engine's explicit BEGIN (app.engine) stands for pysqlite's implicit one, which is not counted
+        if statement != 'BEGIN':
+            self.count += 1
+
+def measure(driver, counter, scenario, dataset, rng, requests, warmup):
+    for _ in range(warmup):
+        method, path, body, user = scenario(dataset, rng)
+        driver.request(method, path, headers={'X-User-Id': str(user)}, json=body)
+
+    samples, errors = [], 0
+    queries_before = counter.count
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, path, body, user = scenario(dataset, rng)
+        t0 = time.perf_counter()
+        status = driver.request(method, path, headers={'X-User-Id': str(user)}, json=body)
+        samples.append((time.perf_counter() - t0) * 1000)
+        errors += status >= 400
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'queries_per_request': round((counter.count - queries_before) / requests, 2),
+    }
+
+def run_size(size, subs_per_user, drivers, requests, warmup, response_cache):
+    """Runs in its own process so peak RSS belongs to this dataset size alone."""
+    from app import create_app, db
+    from benchmarks import datasets
+    from benchmarks.drivers import DRIVERS
+    from benchmarks.scenarios import scenarios
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'RESPONSE_CACHE_BACKEND': response_cache,
+            'RATE_LIMIT_BACKEND': 'none',  # one client sends every request
+        })
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            dataset = datasets.seed(size, subs_per_user)
+            seed_seconds = time.perf_counter() - started
+            db.session.remove()
+            engine = db.engine
+
+        # requests must not run inside an outer app context: they would share its `g`
+        read_engine = app.extensions.get('read_engine')  # GET /analytics* and /budgets read from it
+        counter = QueryCounter(engine, read_engine)
+        plan = scenarios(dataset)  # shared by the drivers so deletes never repeat an id
+        rng = random.Random(size)
+        results = {}
+        for name in drivers:
+            driver = DRIVERS[name](app)
+            try:
+                results[name] = {
+                    label: measure(driver, counter, scenario, dataset, rng, requests, warmup)
+                    for label, scenario in plan
+                }
+            finally:
+                driver.close()
+        engine.dispose()
+        if read_engine is not None:
+            read_engine.dispose()
+
+    return {
+        'subscriptions': size,
+        'users': dataset.users,
+        'seed_seconds': round(seed_seconds, 1),
+        'peak_rss_mb': peak_rss_mb(),
+        'drivers': results,
+    }
+
+def compare(report, baseline, threshold):
+    """Lists the scenarios that got slower, lost throughput or issue more queries than the baseline."""
+    previous = {r['subscriptions']: r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(result['subscriptions'])
+        if not before:
+            continue
+        for driver, scenarios in result['drivers'].items():
+            for label, now in scenarios.items():
+                old = before['drivers'].get(driver, {}).get(label)
+                if not old:
+                    continue
+                where = f"{result['subscriptions']} / {driver} / {label}"
+                if now['p95_ms'] > old['p95_ms'] * (1 + threshold):
+                    regressions.append(f"{where}: p95 {old['p95_ms']} -> {now['p95_ms']} ms")
+                if now['throughput_rps'] < old['throughput_rps'] * (1 - threshold):
+                    regressions.append(f"{where}: throughput {old['throughput_rps']} -> {now['throughput_rps']} req/s")
+                if now['queries_per_request'] > old['queries_per_request']:
+                    regressions.append(
+                        f"{where}: queries/request {old['queries_per_request']} -> {now['queries_per_request']}"
+                    )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='subscriptions per dataset')
+    parser.add_argument('--subs-per-user', type=int, default=50)
+    parser.add_argument('--drivers', nargs='+', default=['test_client', 'wsgi_server'],
+                        choices=['test_client', 'wsgi_server'])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario and driver')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--response-cache', default='none', help="RESPONSE_CACHE_BACKEND to run with")
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    deletes = len(args.drivers) * (args.requests + args.warmup)
+    too_small = [size for size in args.sizes if size // 2 < deletes]
+    if too_small:
+        parser.error(f"sizes {too_small} are too small for {deletes} deletes; lower --requests")
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'args': vars(args),
+        },
+        'results': [],
+    }
+    for size in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            result = pool.submit(
+                run_size, size, args.subs_per_user, args.drivers, args.requests, args.warmup, args.response_cache
+            ).result()
+        report['results'].append(result)
+        print(f"{size} subscriptions: seeded in {result['seed_seconds']}s, peak RSS {result['peak_rss_mb']} MB",
+              file=sys.stderr)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        status = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""One scenario per route (plus the main query-string variants).
+
+A scenario is called with the Dataset and a Random and returns the request to
+send: (method, path, json body or None, user id). Reads run before writes so
+every read sees the seeded data."""
+import itertools
+
+_counter = itertools.count(1)
+
+def _user(dataset, rng):
+    return rng.randint(1, dataset.users)
+
+def _seeded_id(dataset, rng):
+    # updates stay in the first half of the ids, deletes consume the second half
+    return rng.randint(1, max(1, dataset.subscriptions // 2))
+
+def _new_subscription(rng):
+    return {
+        'name': f'Bench {next(_counter)}',
+        'price': round(rng.uniform(1, 50), 2),
+        'frequency': rng.choice(['Monthly', 'Yearly', 'Weekly']),
+        'category': rng.choice(['Entertainment', 'Productivity', 'Utilities']),
+    }
+
+def _read(path):
+    return lambda dataset, rng: ('GET', path, None, _user(dataset, rng))
+
+def get_subscription(dataset, rng):
+    sub_id = rng.randint(1, dataset.subscriptions)
+    return 'GET', f'/subscriptions/{sub_id}', None, dataset.owner_of(sub_id)
+
+def create_subscription(dataset, rng):
+    return 'POST', '/subscriptions', _new_subscription(rng), _user(dataset, rng)
+
+def update_subscription(dataset, rng):
+    sub_id = _seeded_id(dataset, rng)
+    return 'PUT', f'/subscriptions/{sub_id}', {'price': round(rng.uniform(1, 50), 2)}, dataset.owner_of(sub_id)
+
+def bulk_subscriptions(dataset, rng):
+    return 'POST', '/subscriptions/bulk', [_new_subscription(rng) for _ in range(20)], _user(dataset, rng)
+
+def create_category(dataset, rng):
+    return 'POST', '/categories', {'name': f'Bench category {next(_counter)}'}, _user(dataset, rng)
+
+def update_budget(dataset, rng):
+    return 'PUT', '/budgets', {'limit': rng.randint(50, 500)}, _user(dataset, rng)
+
+def delete_subscription_factory(dataset):
+    ids = iter(range(dataset.subscriptions, dataset.subscriptions // 2, -1))
+    def delete_subscription(dataset, rng):
+        sub_id = next(ids)
+        return 'DELETE', f'/subscriptions/{sub_id}', None, dataset.owner_of(sub_id)
+    return delete_subscription
+
+def scenarios(dataset):
+    """Ordered (name, scenario) pairs covering every route of the four blueprints."""
+    return [
+        ('GET /subscriptions', _read('/subscriptions')),
+        ('GET /subscriptions?category&status', _read('/subscriptions?category=Entertainment&status=active')),
+        ('GET /subscriptions?limit&fields', _read('/subscriptions?limit=20&fields=name,price,category')),
+        ('GET /subscriptions/export', _read('/subscriptions/export?format=ndjson')),
+        ('GET /subscriptions/<id>', get_subscription),
+        ('GET /categories', _read('/categories')),
+        ('GET /analytics', _read('/analytics')),
+        ('GET /analytics?breakdown', _read('/analytics?breakdown=true&limit=50')),
+        ('GET /analytics/forecast', _read('/analytics/forecast?from=2025-01-01&to=2026-12-31')),
+        ('GET /analytics/history', _read('/analytics/history?granularity=month')),
+        ('GET /budgets', _read('/budgets')),
+        ('POST /subscriptions', create_subscription),
+        ('PUT /subscriptions/<id>', update_subscription),
+        ('POST /subscriptions/bulk', bulk_subscriptions),
+        ('POST /categories', create_category),
+        ('PUT /budgets', update_budget),
+        ('DELETE /subscriptions/<id>', delete_subscription_factory(dataset)),
+    ]
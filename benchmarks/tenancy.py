@@ -0,0 +1,77 @@
+"""Per-user request cost at growing table sizes.
+
+Seeds USERS x SUBS_PER_USER subscriptions into a scratch SQLite file, then times
+the user-scoped read endpoints for random users. With user_id-leading indexes and
+the per-user rollup, the per-request time should stay flat as the user count grows.
+
+    python -m benchmarks.tenancy                      # 1k and 100k users x 50 subscriptions
+    python -m benchmarks.tenancy --users 1000 10000 --subs 50 --requests 500
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app import create_app, db
+from benchmarks import datasets
+
+ENDPOINTS = ('/analytics', '/budgets', '/subscriptions?limit=50', '/categories')
+
+def time_endpoints(app, users, requests):
+    client = app.test_client()
+    rng = random.Random(7)
+    results = {}
+    for path in ENDPOINTS:
+        samples = []
+        for _ in range(requests):
+            headers = {'X-User-Id': str(rng.randint(1, users))}
+            start = time.perf_counter()
+            res = client.get(path, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert res.status_code == 200, (path, res.status_code)
+        samples.sort()
+        results[path] = {
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        }
+    return results
+
+def run(users, subs_per_user, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'RESPONSE_CACHE_BACKEND': 'none',  # measure the queries, not the cache
+            'RATE_LIMIT_BACKEND': 'none',
+        })
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            datasets.seed(users * subs_per_user, subs_per_user)
+            seeded_in = time.perf_counter() - started
+            db.session.remove()
+            engine = db.engine
+        timings = time_endpoints(app, users, requests)
+        engine.dispose()
+    return {
+        'users': users,
+        'subscriptions': users * subs_per_user,
+        'seed_seconds': round(seeded_in, 1),
+        'endpoints': timings,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[1_000, 100_000])
+    parser.add_argument('--subs', type=int, default=50, help='subscriptions per user')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    args = parser.parse_args()
+
+    report = [run(users, args.subs, args.requests) for users in args.users]
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+class Config:
+    """Defaults for create_app(); every setting can be overridden from the environment."""
+    # Database
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///subscriptions.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    AUTO_CREATE_SCHEMA = _env_bool('AUTO_CREATE_SCHEMA', False)  # run db.create_all() at startup
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')  # asgi.py; default derives from DATABASE_URL
+
+    # Read routing (app.read_routing): GET requests to READ_BLUEPRINTS read from READ_DATABASE_URL (a replica)
+    # or, for a file SQLite database, from read-only snapshot connections on the same file
+    READ_ROUTING = _env_bool('READ_ROUTING', True)
+    READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL')
+    READ_BLUEPRINTS = os.environ.get('READ_BLUEPRINTS', 'analytics,budgets')
+
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))  # PostgreSQL / MySQL
+
+    # SQLite connection pragmas
+    SQLITE_WAL = _env_bool('SQLITE_WAL', True)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+    # Tenancy: requests without an X-User-Id header act for this user. The header is trusted as sent, so
+    # a proxy in front of the app must authenticate callers, strip their X-User-Id and set its own; or set
+    # USER_ID_PROVIDER ('module:name' of a callable: request headers -> user id or None) to verify a credential
+    DEFAULT_USER_ID = int(os.environ.get('DEFAULT_USER_ID', 1))
+    USER_ID_PROVIDER = os.environ.get('USER_ID_PROVIDER') or None
+
+    # Currencies: fx_rate rates are quoted in FX_BASE_CURRENCY, which is also the default currency of
+    # new subscriptions and budgets; /analytics reports in REPORTING_CURRENCY unless ?currency= says otherwise
+    FX_BASE_CURRENCY = os.environ.get('FX_BASE_CURRENCY', 'USD')
+    REPORTING_CURRENCY = os.environ.get('REPORTING_CURRENCY', 'USD')
+
+    # JSON: encode responses with orjson when it is installed
+    FAST_JSON = _env_bool('FAST_JSON', True)
+
+    # Instrumentation: Server-Timing headers and GET /metrics
+    INSTRUMENTATION = _env_bool('INSTRUMENTATION', False)
+    INSTRUMENTATION_SLOW_QUERY_MS = float(os.environ.get('INSTRUMENTATION_SLOW_QUERY_MS', 0))
+
+    # Imports (flask subs import, POST /subscriptions/import): rows per transaction
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+
+    # Budget alerts: worker ('thread' | 'none' = run `flask subs alerts-worker`) and sinks (log, file, webhook)
+    ALERTS_WORKER = os.environ.get('ALERTS_WORKER', 'thread')
+    ALERTS_COALESCE_MS = int(os.environ.get('ALERTS_COALESCE_MS', 200))
+    ALERTS_POLL_SECONDS = float(os.environ.get('ALERTS_POLL_SECONDS', 5))
+    ALERT_SINKS = os.environ.get('ALERT_SINKS', 'log')
+    ALERT_FILE_PATH = os.environ.get('ALERT_FILE_PATH', 'budget_alerts.jsonl')
+    ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL')
+
+    # HTTP / response caching
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 0))
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 30))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH')
+    COALESCE_REQUESTS = _env_bool('COALESCE_REQUESTS', True)  # concurrent identical misses share one computation
+    COALESCE_TIMEOUT_SECONDS = float(os.environ.get('COALESCE_TIMEOUT_SECONDS', 30))
+
+    # Rate limiting of /analytics and /budgets: per client and endpoint, bursts of RATE_LIMIT_BURST
+    # refilled at RATE_LIMIT_PER_SECOND ('memory' | 'sqlite' = shared by all workers | 'none')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    # the client is the remote address; 'user' keys on the acting user, only when that is authenticated
+    RATE_LIMIT_KEY = os.environ.get('RATE_LIMIT_KEY', 'address')
+    RATE_LIMIT_PER_SECOND = float(os.environ.get('RATE_LIMIT_PER_SECOND', 2))
+    RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 20))
+    RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', 100000))
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH')
@@ -1,10 +1,9 @@
 from app import create_app, db
 from app.models import Category, Subscription, Budget, FrequencyType, StatusType
+from app.money import to_cents
 from datetime import date, timedelta
 
-app = create_app()
-
-def seed_database():
+def seed_database(app):
     with app.app_context():
         print("🗑️  Cleaning database...")
         db.drop_all()  
@@ -12,7 +11,7 @@ def seed_database():
 
         # --- 1. Create Budget ---
         print("💰 Setting initial budget...")
-        initial_budget = Budget(monthly_limit=200.00)
+        initial_budget = Budget(monthly_limit_cents=to_cents('200.00'))
         db.session.add(initial_budget)
 
         # --- 2. Create Categories ---
@@ -41,7 +40,7 @@ def seed_database():
         subscriptions = [
             Subscription(
                 name="Netflix",
-                price=15.99,
+                price_cents=to_cents('15.99'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Entertainment"].id,
                 status=StatusType.ACTIVE,
@@ -49,7 +48,7 @@ def seed_database():
             ),
             Subscription(
                 name="Spotify Premium",
-                price=9.99,
+                price_cents=to_cents('9.99'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Entertainment"].id,
                 status=StatusType.ACTIVE,
@@ -57,7 +56,7 @@ def seed_database():
             ),
             Subscription(
                 name="Gym Membership",
-                price=45.00,
+                price_cents=to_cents('45.00'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Health"].id,
                 status=StatusType.ACTIVE,
@@ -65,7 +64,7 @@ def seed_database():
             ),
             Subscription(
                 name="Amazon Prime",
-                price=139.00,
+                price_cents=to_cents('139.00'),
                 frequency=FrequencyType.YEARLY,
                 category_id=categories["Shopping"].id,
                 status=StatusType.ACTIVE,
@@ -73,7 +72,7 @@ def seed_database():
             ),
             Subscription(
                 name="ChatGPT Plus",
-                price=20.00,
+                price_cents=to_cents('20.00'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Productivity"].id,
                 status=StatusType.ACTIVE,
@@ -81,7 +80,7 @@ def seed_database():
             ),
             Subscription(
                 name="Internet Bill",
-                price=89.99,
+                price_cents=to_cents('89.99'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Utilities"].id,
                 status=StatusType.ACTIVE,
@@ -89,7 +88,7 @@ def seed_database():
             ),
             Subscription(
                 name="Duolingo",
-                price=6.99,
+                price_cents=to_cents('6.99'),
                 frequency=FrequencyType.MONTHLY,
                 category_id=categories["Education"].id,
                 status=StatusType.CANCELLED, # Cancelled item
@@ -104,4 +103,4 @@ def seed_database():
         print(f"✅ Database seeded! Budget set to $200, added {len(categories)} categories and {len(subscriptions)} subscriptions.")
 
 if __name__ == "__main__":
-    seed_database()
\ No newline at end of file
+    seed_database(create_app())
\ No newline at end of file
@@ -1,30 +1,74 @@
 import unittest
+import asyncio
+import importlib.util
+import io
 import json
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.exc import OperationalError
 from app import create_app, db
-from app.models import Subscription, Category, Budget, FrequencyType, StatusType
-from datetime import date
+from app.migrations import upgrade
+from app.engine import engine_options
+from config import Config
+from app.models import Subscription, Category, Budget, DataVersion, FrequencyType, StatusType, SubscriptionEvent, SpendSnapshot, BudgetJob, BudgetStatus, SUBSCRIPTION_FIELDS
+from app.queries import SORTS, active_monthly_spend, subscription_listing
+from app.money import to_cents, from_twelfths
+from app.category_cache import category_cache
+from app import rollup, history, alerts, importer, response_cache, rate_limit, fx
+from app.forecast import add_months
+from app.response_cache import MemoryBackend, SQLiteBackend, SingleFlight
+from app.rate_limit import MemoryBackend as RateLimitMemoryBackend, SQLiteBackend as RateLimitSQLiteBackend
+from datetime import date, datetime, timedelta
+from flask.json.provider import DefaultJSONProvider
 
 class SubscriptionTrackerTestCase(unittest.TestCase):
     
-    def setUp(self):
-        """Run before every test: Setup in-memory DB."""
-        self.app = create_app()
-        self.app.config['TESTING'] = True
-        self.app.config['WTF_CSRF_ENABLED'] = False
-        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:' 
-        
-        self.client = self.app.test_client()
-        
-        with self.app.app_context():
+    @classmethod
+    def setUpClass(cls):
+        """Run once: build the app and its in-memory schema, shared by every test."""
+        cls.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        })
+        with cls.app.app_context():
             db.create_all()
+        cls.config = dict(cls.app.config)
 
-    def tearDown(self):
-        """Run after every test: Clean up and dispose DB connection."""
-        with self.app.app_context():
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
             db.session.remove()
             db.drop_all()
             db.engine.dispose()
 
+    def setUp(self):
+        """Run before every test: open an outer transaction that every session of the test joins.
+
+        Commits inside the test release savepoints; tearDown rolls the whole transaction back."""
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        # pysqlite begins transactions lazily; an explicit BEGIN keeps the first savepoint from committing
+        self.connection.exec_driver_sql('BEGIN')
+        db.session.session_factory.configure(bind=self.connection, join_transaction_mode='create_savepoint')
+        # version counters restart after every rollback, so cached entries from earlier tests would match
+        category_cache.clear()
+        fx.table_cache.clear()
+        response_cache.init_app(self.app)
+        rate_limit.init_app(self.app)
+
+    def tearDown(self):
+        """Run after every test: roll back its writes and restore the shared app's config."""
+        db.session.session_factory.configure(bind=None, join_transaction_mode='conservative_savepoint')
+        self.connection.rollback()
+        self.connection.close()
+        self.app.config.clear()
+        self.app.config.update(self.config)
+
     # =================================================================
     # 1. CATEGORY TESTS
     # =================================================================
@@ -45,6 +89,63 @@ class SubscriptionTrackerTestCase(unittest.TestCase):
         # Expecting 409 Conflict
         self.assertEqual(res.status_code, 409) 
 
+    def test_category_reused_case_insensitively(self):
+        """Verify subscriptions resolve an existing category regardless of case instead of creating a new one."""
+        self.client.post('/categories', json={"name": "Gaming"})
+        res = self.client.post('/subscriptions', json={"name": "Steam", "price": 5, "frequency": "Monthly", "category": "gaming"})
+        self.assertEqual(json.loads(res.data)['subscription']['category'], "Gaming")
+        self.assertEqual(len(json.loads(self.client.get('/categories').data)), 1)
+
+    def test_category_cache_reloads_on_version_bump(self):
+        """Verify the category cache serves stale names until the shared version counter moves on."""
+        with self.app.app_context():
+            category_cache.clear()
+            cat = Category(name="Music")
+            db.session.add(cat)
+            db.session.commit()
+            self.assertEqual(category_cache.name_for(1, cat.id), "Music")
+
+            # A raw write that skips the version bump: the cached name is still served
+            db.session.connection().execute(db.update(Category.__table__).values(name="Audio"))
+            db.session.commit()
+            self.assertEqual(category_cache.name_for(1, cat.id), "Music")
+
+            DataVersion.bump('category', 1)
+            db.session.commit()
+            self.assertEqual(category_cache.name_for(1, cat.id), "Audio")
+            self.assertEqual(category_cache.id_for(1, "AUDIO"), cat.id)
+
+    def test_conditional_get_returns_304_until_data_changes(self):
+        """Verify read endpoints send an ETag, answer a matching If-None-Match with 304, and change after a write."""
+        self.client.post('/categories', json={"name": "Gaming"})
+        res = self.client.get('/categories')
+        etag = res.headers['ETag']
+        self.assertIn('must-revalidate', res.headers['Cache-Control'])
+
+        res_cached = self.client.get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res_cached.status_code, 304)
+        self.assertEqual(res_cached.data, b'')
+
+        # Unrelated tables do not invalidate the validator
+        self.client.put('/budgets', json={"limit": 50})
+        self.assertEqual(self.client.get('/categories', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.post('/categories', json={"name": "Music"})
+        res_changed = self.client.get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res_changed.status_code, 200)
+        self.assertNotEqual(res_changed.headers['ETag'], etag)
+
+    def test_etag_depends_on_query_string_and_bulk_writes(self):
+        """Verify different query strings get different ETags and bulk writes bump the subscription version."""
+        self.client.post('/subscriptions', json={"name": "A", "price": 10, "frequency": "Monthly", "category": "Fun"})
+        etag_all = self.client.get('/subscriptions').headers['ETag']
+        self.assertNotEqual(etag_all, self.client.get('/subscriptions?fields=name').headers['ETag'])
+        self.assertNotEqual(self.client.get('/subscriptions?q=A%26sort%3Dname').headers['ETag'],
+                            self.client.get('/subscriptions?q=A&sort=name').headers['ETag'])
+
+        self.client.post('/subscriptions/bulk', json=[{"op": "update", "id": 1, "price": 11}])
+        self.assertEqual(self.client.get('/subscriptions', headers={'If-None-Match': etag_all}).status_code, 200)
+
     # =================================================================
     # 2. BUDGET TESTS
     # =================================================================
@@ -61,6 +162,80 @@ class SubscriptionTrackerTestCase(unittest.TestCase):
         self.assertEqual(data['config']['monthly_limit'], 500.00)
         self.assertEqual(data['status']['health_label'], "Good")
 
+    def test_budget_spend_follows_subscription_changes(self):
+        """Verify /budgets spend tracks creates, status changes and deletes through the rollup."""
+        self.client.put('/budgets', json={"limit": 100})
+        self.client.post('/subscriptions', json={"name": "A", "price": 60, "frequency": "Monthly", "category": "X"})
+        self.client.post('/subscriptions', json={"name": "B", "price": 10, "frequency": "Weekly", "category": "Y"})
+        status = json.loads(self.client.get('/budgets').data)['status']
+        self.assertEqual((status['current_spend'], status['health_label']), (100.0, "Warning"))
+
+        self.client.put('/subscriptions/2', json={"status": "Paused"})
+        self.assertEqual(json.loads(self.client.get('/budgets').data)['status']['current_spend'], 60.0)
+
+        self.client.delete('/subscriptions/1')
+        self.assertEqual(json.loads(self.client.get('/budgets').data)['status']['current_spend'], 0.0)
+
+    def test_budget_alerts_are_queued_coalesced_and_delivered(self):
+        """Verify writes queue one job per user, the worker stores health and sinks receive only label changes."""
+        received = []
+        self.client.put('/budgets', json={"limit": 100})
+        self.client.post('/subscriptions', json={"name": "A", "price": 60, "frequency": "Monthly", "category": "X"})
+        live = self.client.get('/budgets').data
+        with self.app.app_context():
+            self.assertEqual(db.session.query(BudgetJob).count(), 1)
+            self.assertIsNone(alerts.stored_status(1))
+            self.assertEqual(alerts.drain([received.append]), 1)
+            self.assertEqual(alerts.stored_status(1).health_label, "Good")
+        self.assertEqual(received, [])
+        self.assertEqual(self.client.get('/budgets', headers={'If-None-Match': 'x'}).data, live)
+
+        # A burst of writes is one evaluation and one transition
+        for name in ("B", "C", "D"):
+            self.client.post('/subscriptions', json={"name": name, "price": 10, "frequency": "Monthly", "category": "X"})
+        self.client.post('/subscriptions', json={"name": "E", "price": 5, "frequency": "Monthly", "category": "X"}, headers={'X-User-Id': '2'})
+        with self.app.app_context():
+            self.assertEqual(alerts.drain([received.append]), 2)  # user 2 has no budget: nothing to report
+        self.assertEqual([(t['user_id'], t['previous'], t['current'], t['usage_percent']) for t in received],
+                         [(1, "Good", "Warning", 90.0)])
+        self.assertEqual(json.loads(self.client.get('/budgets').data)['status']['health_label'], "Warning")
+
+        # A read between claim and evaluation may see the old stored health; the new one replaces it (cache and ETag)
+        self.client.post('/subscriptions', json={"name": "F", "price": 20, "frequency": "Monthly", "category": "X"})
+        with self.app.app_context():
+            users = alerts.claim()
+        stale = self.client.get('/budgets')
+        self.assertEqual(json.loads(stale.data)['status']['health_label'], "Warning")
+        with self.app.app_context():
+            alerts.evaluate(users)
+        res = self.client.get('/budgets', headers={'If-None-Match': stale.headers['ETag']})
+        self.assertEqual((res.status_code, res.headers['X-Cache']), (200, 'MISS'))
+        self.assertEqual(json.loads(res.data)['status']['health_label'], "Over Budget")
+
+        # The thread worker wakes up after commits on a file database and writes to the file sink
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'alerts.db')}", 'ALERTS_WORKER': 'thread',
+                'ALERTS_COALESCE_MS': 0, 'ALERT_SINKS': 'file', 'ALERT_FILE_PATH': os.path.join(tmp, 'alerts.jsonl'),
+            })
+            with app.app_context():
+                db.create_all()
+            client = app.test_client()
+            client.put('/budgets', json={"limit": 10})
+            client.post('/subscriptions', json={"name": "A", "price": 9, "frequency": "Monthly", "category": "X"})
+            path, line = os.path.join(tmp, 'alerts.jsonl'), ''
+            for _ in range(100):
+                if os.path.exists(path):
+                    with open(path) as f:
+                        line = f.readline()
+                if line.endswith('\n'):
+                    break
+                time.sleep(0.05)
+            self.assertEqual(json.loads(line)['current'], "Warning")
+            app.extensions['alerts_worker'].stop()
+            with app.app_context():
+                db.engine.dispose()
+
     # =================================================================
     # 3. SUBSCRIPTION TESTS - CREATION & VALIDATION
     # =================================================================
@@ -89,6 +264,12 @@ class SubscriptionTrackerTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 409) 
         self.assertIn("already exists", str(res.data))
     
+    def test_subscription_duplicate_check_is_case_insensitive(self):
+        """Verify the normalized-name uniqueness check rejects names that differ only in case."""
+        self.client.post('/subscriptions', json={"name": "Hulu", "price": 10, "frequency": "Monthly", "category": "TV"})
+        res = self.client.post('/subscriptions', json={"name": "HULU", "price": 10, "frequency": "Monthly", "category": "TV"})
+        self.assertEqual(res.status_code, 409)
+
     def test_subscription_validation_rejects_negative_price(self):
         """Verify that a negative price returns 400 Bad Request."""
         res = self.client.post('/subscriptions', json={
@@ -148,6 +329,224 @@ class SubscriptionTrackerTestCase(unittest.TestCase):
         data_both = json.loads(res_both.data)
         self.assertEqual(len(data_both), 1) # Only Netflix
 
+    def test_get_subscriptions_keyset_pagination(self):
+        """Verify ?limit= pages through results and the X-Next-After cursor resumes after the last id."""
+        for name in ("A", "B", "C"):
+            self.client.post('/subscriptions', json={"name": name, "price": 10, "frequency": "Monthly", "category": "Test"})
+
+        res = self.client.get('/subscriptions?limit=2')
+        self.assertEqual([s['name'] for s in json.loads(res.data)], ["A", "B"])
+        cursor = res.headers['X-Next-After']
+        self.assertIn('after=' + cursor, res.headers['Link'])
+
+        res_next = self.client.get(f'/subscriptions?limit=2&after={cursor}')
+        self.assertEqual(res_next.status_code, 200)
+        self.assertEqual([s['name'] for s in json.loads(res_next.data)], ["C"])
+        self.assertNotIn('X-Next-After', res_next.headers)
+
+    def test_get_subscriptions_sorted_filtered_and_searched_in_sql(self):
+        """Verify ?sort=, the range filters and ?q= prefix search, keyset paging in sort order, and index-only ordering."""
+        for name, price, frequency, start in [("Netflix", 15, "Monthly", "2024-03-01"), ("Nest", 60, "Yearly", "2024-01-15"),
+                                              ("Spotify", 3, "Weekly", "2023-06-01"), ("Hulu", 12, "Monthly", "2024-02-01")]:
+            self.client.post('/subscriptions', json={"name": name, "price": price, "frequency": frequency,
+                                                     "category": "TV", "start_date": start})
+
+        def names(query):
+            response = self.client.get('/subscriptions' + query)
+            self.assertEqual(response.status_code, 200, response.data)
+            return [s['name'] for s in json.loads(response.data)]
+
+        self.assertEqual(names('?sort=monthly_cost'), ["Nest", "Spotify", "Hulu", "Netflix"])  # ties in id order
+        self.assertEqual(names('?sort=-price'), ["Nest", "Netflix", "Hulu", "Spotify"])
+        self.assertEqual(names('?sort=name'), ["Hulu", "Nest", "Netflix", "Spotify"])
+        self.assertEqual(names('?sort=start_date&start_from=2024-01-15&start_to=2024-02-01'), ["Nest", "Hulu"])
+        self.assertEqual(names('?q=NE&price_min=15&price_max=60'), ["Netflix", "Nest"])
+        self.assertEqual(names('?q=zz'), [])
+
+        # the cursor resumes at the last row's position in the sort order, between the tied rows
+        response = self.client.get('/subscriptions?sort=-monthly_cost&limit=2')
+        self.assertEqual([s['name'] for s in json.loads(response.data)], ["Netflix", "Hulu"])
+        self.assertEqual(names(f"?sort=-monthly_cost&limit=2&after={response.headers['X-Next-After']}"), ["Spotify", "Nest"])
+
+        for query in ('?sort=secret', '?price_min=cheap', '?start_to=2024-13-01'):
+            self.assertEqual(self.client.get('/subscriptions' + query).status_code, 400)
+
+        # every sort is served by an index: no temporary b-tree in any plan
+        with self.app.app_context():
+            for sort in SORTS:
+                for descending in (False, True):
+                    stmt = subscription_listing(1, SUBSCRIPTION_FIELDS, sort=sort, descending=descending, after=1, limit=10)
+                    sql = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+                    plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+                    self.assertFalse([row for row in plan if 'TEMP B-TREE' in row[-1]], (sort, plan))
+
+    def test_get_subscriptions_field_projection(self):
+        """Verify ?fields= returns only the requested keys and rejects unknown ones."""
+        self.client.post('/subscriptions', json={"name": "Netflix", "price": 12, "frequency": "Yearly", "category": "Entertainment"})
+
+        data = json.loads(self.client.get('/subscriptions?fields=name,category,monthly_cost').data)
+        self.assertEqual(data, [{"name": "Netflix", "category": "Entertainment", "monthly_cost": 1.0}])
+
+        res = self.client.get('/subscriptions?fields=name,secret')
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_streams_ndjson_and_json_array(self):
+        """Verify /subscriptions/export streams rows in to_json layout and honours the status filter."""
+        self.client.post('/subscriptions', json={"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "Entertainment"})
+        self.client.post('/subscriptions', json={"name": "Hulu", "price": 10, "frequency": "Monthly", "category": "Entertainment", "status": "Cancelled"})
+
+        res = self.client.get('/subscriptions/export?status=Active')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([l['name'] for l in lines], ["Netflix"])
+        self.assertEqual(lines[0], json.loads(self.client.get('/subscriptions/1').data))
+
+        res_json = self.client.get('/subscriptions/export?format=json')
+        self.assertEqual(len(json.loads(res_json.data)), 2)
+
+        self.assertEqual(self.client.get('/subscriptions/export?format=xml').status_code, 400)
+
+    def test_bulk_endpoint_reports_per_item_results(self):
+        """Verify /subscriptions/bulk creates, updates and deletes in one call with a result per item."""
+        self.client.post('/subscriptions', json={"name": "Existing", "price": 10, "frequency": "Monthly", "category": "Music"})
+
+        res = self.client.post('/subscriptions/bulk', json=[
+            {"name": "New1", "price": 5, "frequency": "Monthly", "category": "music"},
+            {"name": "new1", "price": 5, "frequency": "Monthly", "category": "Music"},    # duplicate within the batch
+            {"name": "existing", "price": 5, "frequency": "Monthly", "category": "Music"}, # duplicate in the table
+            {"name": "Bad", "price": -1, "frequency": "Monthly", "category": "Music"},
+            {"op": "update", "id": 1, "price": 12, "category": "Gaming"},
+            {"op": "delete", "id": 999},
+        ])
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual([r['status'] for r in data['results']], [201, 409, 409, 400, 200, 404])
+        self.assertEqual(data['summary'], {"succeeded": 2, "failed": 4})
+
+        updated = json.loads(self.client.get('/subscriptions/1').data)
+        self.assertEqual((updated['price'], updated['category']), (12.0, "Gaming"))
+        categories = [c['name'] for c in json.loads(self.client.get('/categories').data)]
+        self.assertEqual(categories.count("Music"), 1)
+
+        # names and categories must be non-empty strings: a bad item is a 400 result, not a failed batch
+        res = self.client.post('/subscriptions/bulk', json=[
+            {"name": 5, "price": 5, "frequency": "Monthly", "category": "Music"},
+            {"name": "Seven", "price": 5, "frequency": "Monthly", "category": 7},
+            {"name": " ", "price": 5, "frequency": "Monthly", "category": "Music"},
+            {"name": "Dated", "price": 5, "frequency": "Monthly", "category": "Music", "start_date": 20240101},
+            {"name": "Fine", "price": 5, "frequency": "Monthly", "category": "Music", "status": ["Active"]},
+            {"op": "update", "id": 1, "name": ""},
+        ])
+        self.assertEqual([r['status'] for r in json.loads(res.data)['results']], [400] * 6)
+        self.assertEqual(self.client.post('/subscriptions', json={"name": "", "price": 1, "frequency": "Monthly", "category": "X"}).status_code, 400)
+        self.assertEqual(self.client.post('/categories', json={"name": 3}).status_code, 400)
+
+        res_del = self.client.post('/subscriptions/bulk', json=[{"op": "delete", "id": 1}])
+        self.assertEqual(json.loads(res_del.data)['results'][0]['status'], 200)
+        self.assertEqual(self.client.get('/subscriptions/1').status_code, 404)
+
+    def test_import_streams_chunks_and_resumes(self):
+        """Verify CSV/NDJSON imports validate like POST /subscriptions, report bad rows and resume after a crash."""
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        self.client.post('/subscriptions', json={"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"})
+        body = (
+            "Name,Price,Frequency,Category,Status,Start_Date\n"
+            "Spotify,9.99,Monthly,music,,2024-01-05\n"
+            "netflix,12,Monthly,TV,,\n"                      # duplicate of an existing name
+            "Gym,-5,Weekly,Health,,\n"                       # negative price
+            "Cloud,2,Yearly,Storage,Paused,2024-13-01\n"     # bad date
+            "Cloud,2,Yearly,Storage,Paused,\n"
+            "Times,4,Daily,News,,\n"                         # unknown frequency
+        )
+        res = self.client.post('/subscriptions/import', data=body, content_type='text/csv')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['import'], {"id": 1, "source": "upload", "rows_read": 6, "created": 2, "failed": 4, "finished": True})
+        self.assertEqual([e['line'] for e in data['errors']], [3, 4, 5, 7])
+        self.assertIn("already exists", data['errors'][0]['error'])
+        subs = {s['name']: s for s in json.loads(self.client.get('/subscriptions').data)}
+        self.assertEqual((subs['Spotify']['category'], subs['Spotify']['start_date']), ("Music", "2024-01-05"))
+        self.assertEqual(subs['Cloud']['status'], "Paused")
+
+        # A crash after the first chunk: the committed chunk stays, resuming skips it
+        ndjson = ''.join(json.dumps({"name": f"Feed{i}", "price": i, "frequency": "Monthly", "category": "News"}) + "\n"
+                         for i in range(5)) + "{oops\n"
+        ndjson += '{"name": "\\ud800", "price": 1, "frequency": "Monthly", "category": "News"}\n'  # valid, but not storable
+
+        def crashing(rows):
+            for i, row in enumerate(rows):
+                if i == 3:
+                    raise RuntimeError("disk full")
+                yield row
+        with self.app.app_context():
+            job = importer.start_job(1, 'feeds.ndjson')
+            with self.assertRaises(RuntimeError):
+                importer.run_import(1, job, crashing(importer.ndjson_rows(io.BytesIO(ndjson.encode()))), chunk_size=2)
+            self.assertEqual((job.rows_read, job.created, job.finished), (2, 2, False))
+            job_id = job.id
+
+        res = self.client.post(f'/subscriptions/import?resume={job_id}&format=ndjson', data=ndjson)
+        data = json.loads(res.data)
+        self.assertEqual((data['import']['rows_read'], data['import']['created'], data['import']['failed']), (7, 5, 2))
+        self.assertEqual([e['line'] for e in data['errors']], [6, 7])
+        self.assertEqual(data['errors'][0], {"line": 6, "error": "Invalid JSON"})
+        self.assertIn("Could not be saved", data['errors'][1]['error'])
+        self.assertEqual(self.client.post(f'/subscriptions/import?resume={job_id}&format=ndjson', data=ndjson).status_code, 409)
+        self.assertEqual(self.client.post('/subscriptions/import', data=body).status_code, 400)  # unknown format
+
+        # Multipart uploads, and the CLI command with an error report
+        upload = {'file': (io.BytesIO(b"name,price,frequency,category\nHulu,8,Monthly,TV\n"), 'hulu.csv')}
+        self.assertEqual(json.loads(self.client.post('/subscriptions/import', data=upload).data)['import']['created'], 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path, report = os.path.join(tmp, 'bank.csv'), os.path.join(tmp, 'errors.csv')
+            with open(path, 'w') as f:
+                f.write("name,price,frequency,category\nRent,900,Monthly,Home\nBad,x,Monthly,Home\n")
+            result = self.app.test_cli_runner().invoke(args=['subs', 'import', path, '--user-id', '2', '--errors', report])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn("Imported 1 subscriptions; 1 rows rejected.", result.output)
+            with open(report) as f:
+                self.assertEqual(f.read().splitlines(), ["line,error", "3,Invalid price or frequency"])
+        self.assertEqual([s['name'] for s in json.loads(self.client.get('/subscriptions', headers={'X-User-Id': '2'}).data)], ["Rent"])
+
+    def test_status_filter_is_case_insensitive(self):
+        """Verify ?status= matches enum names in any case and an unknown status matches nothing."""
+        self.client.post('/subscriptions', json={"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"})
+        self.assertEqual(len(json.loads(self.client.get('/subscriptions?status=active').data)), 1)
+        response = self.client.get('/subscriptions?status=bogus')
+        self.assertEqual((response.status_code, json.loads(response.data)), (200, []))
+
+    def test_migration_upgrades_existing_database(self):
+        """Verify `flask subs migrate` backfills name_normalized, scopes rows to the default user and adds the indexes."""
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE category (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL UNIQUE)")
+            conn.exec_driver_sql(
+                "CREATE TABLE subscription (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL UNIQUE, price FLOAT NOT NULL, "
+                "frequency VARCHAR(7) NOT NULL, start_date DATE NOT NULL, status VARCHAR(9) NOT NULL, "
+                "category_id INTEGER NOT NULL REFERENCES category (id))"
+            )
+            conn.exec_driver_sql("INSERT INTO category VALUES (1, 'TV')")
+            conn.exec_driver_sql("INSERT INTO subscription VALUES (1, 'Netflix', 10, 'MONTHLY', '2024-01-01', 'ACTIVE', 1)")
+
+        self.assertTrue({'add_subscription_name_normalized', 'add_user_scope'} <= set(upgrade(engine)))
+        with engine.connect() as conn:
+            self.assertEqual(
+                conn.exec_driver_sql("SELECT user_id, name_normalized FROM subscription").one(), (1, "netflix")
+            )
+            self.assertEqual(conn.exec_driver_sql("SELECT user_id, name FROM category").one(), (1, "TV"))
+            self.assertEqual(conn.exec_driver_sql("SELECT currency, price_cents, monthly_cost_twelfths FROM subscription").one(),
+                             ("USD", 1000, 12000))
+            self.assertEqual(conn.exec_driver_sql("SELECT user_id, monthly_total_twelfths FROM spend_rollup").one(), (1, 12000))
+            self.assertEqual(conn.exec_driver_sql("SELECT kind, date(occurred_at) FROM subscription_event").one(),
+                             ("created", "2024-01-01"))
+            indexes = {r[0] for r in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({
+            'uq_subscription_user_name_normalized', 'ix_subscription_user_status_category', 'ix_category_user_name_lower',
+            'ix_subscription_user_monthly_cost'
+        } <= indexes)
+        self.assertEqual(upgrade(engine), [])
+        engine.dispose()
+
     def test_delete_subscription_removes_data(self):
         """Verify that deleting a subscription removes it from the database."""
         # Create
@@ -181,5 +580,646 @@ class SubscriptionTrackerTestCase(unittest.TestCase):
         self.assertEqual(cats['Fun'], 10.00)
         self.assertEqual(cats['Work'], 10.00)
 
+    def test_analytics_aggregates_weekly_and_skips_inactive(self):
+        """Verify the SQL aggregation matches Subscription.monthly_cost and ignores non-active rows."""
+        self.client.post('/subscriptions', json={"name": "Gym", "price": 5, "frequency": "Weekly", "category": "Health"})
+        self.client.post('/subscriptions', json={"name": "Yoga", "price": 30, "frequency": "Yearly", "category": "Health"})
+        self.client.post('/subscriptions', json={"name": "Old", "price": 99, "frequency": "Monthly", "category": "Fun", "status": "Cancelled"})
+
+        data = json.loads(self.client.get('/analytics').data)
+        self.assertEqual(data['financial_summary']['total_monthly_cost'], 22.50)
+        self.assertEqual(data['financial_summary']['active_subscription_count'], 2)
+        self.assertEqual(data['category_insights']['top_spending_category'], "Health")
+        self.assertNotIn('Fun', data['category_insights']['all_category_totals'])
+        self.assertNotIn('subscriptions', data)
+
+    def test_spend_rollup_stays_consistent_across_writes(self):
+        """Verify the incrementally maintained rollup matches a full recomputation after mixed writes."""
+        self.client.post('/subscriptions', json={"name": "A", "price": 10, "frequency": "Monthly", "category": "Fun"})
+        self.client.post('/subscriptions', json={"name": "B", "price": 120, "frequency": "Yearly", "category": "Work"})
+        self.client.put('/subscriptions/1', json={"price": 15, "frequency": "Weekly", "category": "Work"})
+        self.client.post('/subscriptions/bulk', json=[
+            {"name": "C", "price": 7, "frequency": "Monthly", "category": "Fun", "status": "Paused"},
+            {"op": "update", "id": 2, "status": "Cancelled"},
+            {"op": "delete", "id": 1},
+        ])
+        self.client.post('/subscriptions/bulk', json=[{"op": "update", "id": 3, "status": "Active", "price": 7.5}])
+
+        with self.app.app_context():
+            conn = db.session.connection()
+            self.assertEqual(rollup.check(conn), [])
+            rollup.rebuild(conn)
+            self.assertEqual(rollup.check(conn), [])
+
+        data = json.loads(self.client.get('/analytics').data)
+        self.assertEqual(data['financial_summary']['total_monthly_cost'], 7.5)
+        self.assertEqual(data['category_insights']['all_category_totals'], {"Fun": 7.5})
+
+    def test_money_is_stored_in_integer_cents_and_summed_exactly(self):
+        """Verify prices round to cents, monthly costs are exact twelfths of a cent and totals are integer sums."""
+        self.assertEqual([to_cents(v) for v in (9.99, "2.675", 0.125, 10)], [999, 268, 12, 1000])
+        self.assertEqual([from_twelfths(v) for v in (6, 18, 11988, 6.0)], [0.0, 0.02, 9.99, 0.0])
+        for bad in ("ten", float('nan'), True, 1e300):
+            self.assertRaises(ValueError, to_cents, bad)
+
+        # 0.1 three hundred times: a float sum drifts, integer cents do not
+        self.client.post('/subscriptions/bulk', json=[
+            {"name": f"Dime {i}", "price": 0.1, "frequency": "Monthly", "category": "Fun"} for i in range(300)
+        ])
+        self.client.post('/subscriptions', json={"name": "Yearly", "price": 10, "frequency": "Yearly", "category": "Fun"})
+        self.client.put('/budgets', json={"limit": 35})
+        with self.app.app_context():
+            stored = db.session.execute(text("SELECT price_cents, monthly_cost_twelfths FROM subscription WHERE name = 'Yearly'")).one()
+            self.assertEqual(tuple(stored), (1000, 1000))
+            self.assertEqual(db.session.execute(active_monthly_spend(1)).all(), [("USD", 300 * 120 + 1000)])
+
+        data = json.loads(self.client.get('/analytics').data)['financial_summary']
+        self.assertEqual((data['total_monthly_cost'], data['total_yearly_projection']), (30.83, 370.0))
+        status = json.loads(self.client.get('/budgets').data)['status']
+        self.assertEqual((status['current_spend'], status['remaining'], status['health_label']), (30.83, 4.17, "Warning"))
+
+    def test_analytics_breakdown_is_paginated(self):
+        """Verify ?breakdown=true returns the per-subscription list one page at a time."""
+        for i in range(3):
+            self.client.post('/subscriptions', json={"name": f"Sub{i}", "price": 10, "frequency": "Monthly", "category": "Fun"})
+
+        first = json.loads(self.client.get('/analytics?breakdown=true&limit=2').data)
+        self.assertEqual([s['name'] for s in first['subscriptions']], ["Sub0", "Sub1"])
+        self.assertIsNotNone(first['next_after'])
+
+        second = json.loads(self.client.get(f"/analytics?breakdown=true&limit=2&after={first['next_after']}").data)
+        self.assertEqual([s['name'] for s in second['subscriptions']], ["Sub2"])
+        self.assertIsNone(second['next_after'])
+
+        res = self.client.get('/analytics?breakdown=true&limit=0')
+        self.assertEqual(res.status_code, 400)
+
+    def test_currencies_are_summed_per_currency_and_converted(self):
+        """Verify prices keep their currency and reports convert one sum per currency at the latest FX rate."""
+        with self.app.app_context():
+            fx.load_rates([("EUR", date(2024, 1, 1), 1.1), ("EUR", date(2024, 6, 1), 1.2), ("GBP", date(2024, 1, 1), 1.25)])
+            db.session.commit()
+            table = fx.fx_table()
+            self.assertEqual([table.rate("EUR", date(2023, 1, 1)), table.rate("EUR", date(2024, 5, 31)),
+                              table.rate("EUR", date(2024, 6, 1)), table.rate("USD", date(2024, 6, 1))], [1.1, 1.1, 1.2, 1.0])
+
+        res = self.client.post('/subscriptions', json={"name": "A", "price": 10, "currency": "eur", "frequency": "Monthly", "category": "Fun"})
+        self.assertEqual(json.loads(res.data)['subscription']['currency'], "EUR")
+        self.client.post('/subscriptions', json={"name": "B", "price": 5, "frequency": "Monthly", "category": "Fun"})
+        self.client.post('/subscriptions/bulk', json=[{"name": "C", "price": 120, "currency": "GBP", "frequency": "Yearly", "category": "Work"}])
+        self.assertEqual(self.client.post('/subscriptions', json={"name": "D", "price": 1, "currency": "XYZ", "frequency": "Monthly", "category": "Fun"}).status_code, 400)
+
+        # USD: 10 EUR * 1.2 + 5 + 10 GBP * 1.25 a month
+        res = self.client.get('/analytics')
+        data = json.loads(res.data)
+        self.assertEqual((data['financial_summary']['currency'], data['financial_summary']['total_monthly_cost']), ("USD", 29.5))
+        self.assertEqual(data['category_insights']['all_category_totals'], {"Fun": 17.0, "Work": 12.5})
+        data = json.loads(self.client.get('/analytics?currency=eur&breakdown=true').data)
+        self.assertEqual(data['financial_summary']['total_monthly_cost'], 24.58)
+        self.assertEqual([s['monthly_cost'] for s in data['subscriptions']], [10.0, 4.17, 10.42])
+        self.assertEqual(self.client.get('/analytics?currency=ABC').status_code, 400)
+
+        self.client.put('/budgets', json={"limit": 20, "currency": "EUR"})
+        data = json.loads(self.client.get('/budgets').data)
+        self.assertEqual((data['config']['currency'], data['status']['current_spend'], data['status']['health_label']),
+                         ("EUR", 24.58, "Over Budget"))
+
+        # New rates change the ETag and the totals; a currency change moves the rollup
+        etag = res.headers['ETag']
+        with self.app.app_context():
+            fx.load_rates([("EUR", date.today(), 1.5)])
+            db.session.commit()
+        res = self.client.get('/analytics')
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(json.loads(res.data)['financial_summary']['total_monthly_cost'], 32.5)
+        self.client.put('/subscriptions/2', json={"currency": "EUR"})
+        self.assertEqual(json.loads(self.client.get('/analytics').data)['financial_summary']['total_monthly_cost'], 35.0)
+        with self.app.app_context():
+            self.assertEqual(rollup.check(db.session.connection()), [])
+
+        # rates files are validated line by line; infinite rates would poison every total
+        self.assertEqual(list(fx.read_rates(["currency,date,rate", "eur,2024-01-01,1.1"])), [("EUR", date(2024, 1, 1), 1.1)])
+        for rate in ("0", "-1", "inf", "1e999", "nan", "x"):
+            with self.assertRaisesRegex(ValueError, "line 2"):
+                list(fx.read_rates(["currency,date,rate", f"EUR,2024-01-01,{rate}"]))
+
+    def test_forecast_expands_renewal_dates(self):
+        """Verify /analytics/forecast bills on exact renewal dates (month ends, leap days) and is cached."""
+        for name, price, frequency, start, status in [
+            ("MonthEnd", 10, "Monthly", "2024-01-31", "Active"),
+            ("Gym", 2, "Weekly", "2024-02-20", "Active"),
+            ("Leap", 100, "Yearly", "2020-02-29", "Active"),
+            ("Domain", 50, "Yearly", "2023-03-15", "Active"),
+            ("Later", 7, "Monthly", "2024-04-01", "Active"),
+            ("Paused", 99, "Monthly", "2024-01-01", "Paused"),
+        ]:
+            self.client.post('/subscriptions', json={
+                "name": name, "price": price, "frequency": frequency, "category": "Fun",
+                "start_date": start, "status": status
+            })
+
+        res = self.client.get('/analytics/forecast?from=2024-02-01&to=2024-03-31')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['total'], 182)
+        self.assertEqual(data['charge_count'], 10)
+        self.assertEqual(data['months'], [
+            {"month": "2024-02", "total": 114, "charge_count": 4},
+            {"month": "2024-03", "total": 68, "charge_count": 6},
+        ])
+        days = {d['date']: d['total'] for d in data['days']}
+        self.assertEqual(days['2024-02-29'], 110)
+        self.assertEqual(days['2024-03-31'], 10)
+        self.assertEqual(days['2024-03-15'], 50)
+        self.assertEqual(days['2024-03-19'], 2)
+
+        # Against a naive expansion over two years
+        data = json.loads(self.client.get('/analytics/forecast?from=2024-01-15&to=2026-01-14').data)
+        with self.app.app_context():
+            expected = {}
+            for sub in Subscription.query.filter_by(status=StatusType.ACTIVE):
+                n, charged = 0, sub.start_date
+                while charged <= date(2026, 1, 14):
+                    if charged >= date(2024, 1, 15):
+                        expected[charged.isoformat()] = expected.get(charged.isoformat(), 0) + sub.price_cents
+                    n += 1
+                    if sub.frequency == FrequencyType.WEEKLY:
+                        charged = sub.start_date + timedelta(weeks=n)
+                    else:
+                        charged = add_months(sub.start_date, n * (12 if sub.frequency == FrequencyType.YEARLY else 1))
+        self.assertEqual({d['date']: d['total'] for d in data['days']}, {day: cents / 100 for day, cents in expected.items()})
+        self.assertEqual(len(data['months']), 25)
+
+        self.assertEqual(self.client.get('/analytics/forecast?from=2024-02-01&to=2024-03-31').headers['X-Cache'], 'HIT')
+        self.client.post('/subscriptions', json={"name": "New", "price": 1, "frequency": "Monthly", "category": "Fun", "start_date": "2024-03-01"})
+        data = json.loads(self.client.get('/analytics/forecast?from=2024-02-01&to=2024-03-31').data)
+        self.assertEqual(data['total'], 183)
+
+        self.assertEqual(self.client.get('/analytics/forecast?from=2024-03-01&to=2024-02-01').status_code, 400)
+        self.assertEqual(self.client.get('/analytics/forecast?from=soon').status_code, 400)
+        self.assertEqual(self.client.get('/analytics/forecast?from=2024-01-01&to=2040-01-01').status_code, 400)
+
+    def test_history_replays_change_log_and_compacted_snapshots(self):
+        """Verify /analytics/history reports month-end spend from the change log, before and after compaction."""
+        self.client.post('/subscriptions', json={"name": "A", "price": 10, "frequency": "Monthly", "category": "Fun"})
+        self.client.post('/subscriptions', json={"name": "B", "price": 120, "frequency": "Yearly", "category": "Work"})
+        self.client.put('/subscriptions/1', json={"price": 20})
+        self.client.put('/subscriptions/1', json={"name": "A2"})  # not a spend change
+        self.client.post('/subscriptions/bulk', json=[{"op": "update", "id": 2, "status": "Cancelled"}])
+
+        with self.app.app_context():
+            events = db.session.execute(db.select(SubscriptionEvent.id, SubscriptionEvent.kind)).all()
+            self.assertEqual([kind for _, kind in events], ["created", "created", "updated", "updated"])
+            # move the log into the past: Jan (creations), Feb (price), Mar (cancellation)
+            for event_id, moment in zip([e[0] for e in events], ["2024-01-10", "2024-01-20", "2024-02-05", "2024-03-31 23:59"]):
+                db.session.execute(db.update(SubscriptionEvent).where(SubscriptionEvent.id == event_id).values(
+                    occurred_at=datetime.fromisoformat(moment)))
+            db.session.commit()
+        self.client.post('/subscriptions', json={"name": "C", "price": 5, "frequency": "Monthly", "category": "Fun"})
+
+        url = '/analytics/history?from=2024-01&to=2024-04'
+        before = json.loads(self.client.get(url).data)
+        self.assertEqual(
+            [(p['period'], p['total_monthly_cost'], p['active_subscription_count'], p['change']) for p in before['periods']],
+            [("2024-01", 20, 2, 20), ("2024-02", 30, 2, 10), ("2024-03", 20, 1, -10), ("2024-04", 20, 1, 0)]
+        )
+        self.assertEqual(before['periods'][1]['category_totals'], {"Fun": 20, "Work": 10})
+
+        with self.app.app_context():
+            conn = db.session.connection()
+            self.assertEqual(history.compact(conn, today=date(2024, 4, 15)), 1)
+            self.assertEqual(history.compact(conn, today=date(2024, 4, 15)), 0)
+            db.session.commit()
+            self.assertEqual(db.session.query(SpendSnapshot).count(), 4)  # Jan: Fun, Work; Feb: Fun; Mar: Work
+            category_cache.clear()
+        with self.app.app_context():
+            after = history.history_payload(db.session.connection(), 1, 'month', date(2024, 1, 1), date(2024, 4, 1),
+                                                {1: "Fun", 2: "Work"}.get, fx.fx_table(), 'USD')
+        self.assertEqual(after, before)
+
+        # The current month includes the events since the checkpoint
+        current = json.loads(self.client.get('/analytics/history').data)['periods']
+        self.assertEqual(len(current), 12)
+        self.assertEqual((current[-1]['total_monthly_cost'], current[-1]['change']), (25, 5))
+        self.assertEqual(json.loads(self.client.get('/analytics/history?granularity=year&from=2024&to=2024').data)['periods'],
+                         [{"period": "2024", "total_monthly_cost": 20, "active_subscription_count": 1, "change": 20,
+                           "category_totals": {"Fun": 20}}])
+
+        self.assertEqual(self.client.get('/analytics/history?granularity=day').status_code, 400)
+        self.assertEqual(self.client.get('/analytics/history?from=2024-05&to=2024-01').status_code, 400)
+        self.assertEqual(self.client.get('/analytics/history?to=2999-01').status_code, 400)
+
+    # =================================================================
+    # 6. CONFIGURATION TESTS
+    # =================================================================
+
+    def test_file_database_uses_wal_pragmas_and_skips_create_all(self):
+        """Verify a file-backed SQLite engine gets the WAL pragmas and no schema unless AUTO_CREATE_SCHEMA is set."""
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'subs.db')}", 'SQLITE_BUSY_TIMEOUT_MS': 1234})
+            with app.app_context():
+                with db.engine.connect() as conn:
+                    pragma = lambda name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                    self.assertEqual(pragma('journal_mode'), 'wal')
+                    self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+                    self.assertEqual(pragma('busy_timeout'), 1234)
+                    self.assertFalse(db.inspect(conn).has_table('subscription'))
+                db.engine.dispose()
+
+    def test_read_only_requests_use_the_snapshot_read_engine(self):
+        """Verify analytics/budgets GETs read from the read-only engine, everything else (and a request that writes) uses the primary."""
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'subs.db')}",
+                              'AUTO_CREATE_SCHEMA': True, 'ALERTS_WORKER': 'none'})
+            client, read_engine = app.test_client(), app.extensions['read_engine']
+            with app.app_context():
+                engines = {db.engine: 'primary', read_engine: 'read'}
+            used = []
+            for engine, name in engines.items():
+                event.listen(engine, 'before_cursor_execute', lambda *args, name=name: used.append(name))
+
+            def engines_used(method, path, **kwargs):
+                used.clear()
+                self.assertLess(getattr(client, method)(path, **kwargs).status_code, 300)
+                return set(used)
+
+            sub = {"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"}
+            self.assertEqual(engines_used('post', '/subscriptions', json=sub), {'primary'})
+            self.assertEqual(engines_used('put', '/budgets', json={"limit": 50}), {'primary'})
+            self.assertEqual(engines_used('get', '/subscriptions'), {'primary'})
+            self.assertEqual(engines_used('get', '/analytics'), {'read'})
+            self.assertEqual(engines_used('get', '/budgets'), {'read'})
+
+            # a write pins the rest of the request to the primary, which sees it
+            with app.test_request_context('/analytics'):
+                app.preprocess_request()
+                count = lambda: db.session.execute(select(func.count()).select_from(DataVersion)).scalar()
+                used.clear()
+                before = count()
+                self.assertEqual(set(used), {'read'})
+                used.clear()
+                DataVersion.bump('test', 1)
+                self.assertEqual((count(), set(used)), (before + 1, {'primary'}))
+                db.session.rollback()
+
+            # read-only connections, each transaction one snapshot that a commit does not block or change
+            with read_engine.connect() as conn:
+                self.assertRaises(OperationalError, conn.exec_driver_sql, "DELETE FROM subscription")
+                conn.rollback()
+                self.assertEqual(conn.exec_driver_sql("SELECT count(*) FROM subscription").scalar(), 1)
+                self.assertEqual(engines_used('post', '/subscriptions', json={**sub, "name": "Hulu"}), {'primary'})
+                self.assertEqual(conn.exec_driver_sql("SELECT count(*) FROM subscription").scalar(), 1)
+                conn.rollback()
+                self.assertEqual(conn.exec_driver_sql("SELECT count(*) FROM subscription").scalar(), 2)
+
+            with app.app_context():
+                db.engine.dispose()
+            read_engine.dispose()
+
+    def test_seed_script_populates_a_fresh_database(self):
+        """Verify seed.py builds the schema and its sample data with the current models."""
+        import seed
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'ALERTS_WORKER': 'none'})
+        seed.seed_database(app)
+        summary = json.loads(app.test_client().get('/analytics').data)['financial_summary']
+        self.assertEqual((summary['total_monthly_cost'], summary['active_subscription_count']), (192.55, 6))
+        self.assertEqual(json.loads(app.test_client().get('/budgets').data)['config']['monthly_limit'], 200.0)
+        with app.app_context():
+            db.engine.dispose()
+
+    def test_engine_options_follow_backend(self):
+        """Verify pool and statement-timeout options are derived from the URI and config."""
+        config = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+
+        pg = engine_options({**config, 'SQLALCHEMY_DATABASE_URI': 'postgresql://db/subs', 'DB_STATEMENT_TIMEOUT_MS': 2000})
+        self.assertEqual(pg['connect_args'], {'options': '-c statement_timeout=2000'})
+        self.assertEqual((pg['pool_size'], pg['pool_pre_ping']), (Config.DB_POOL_SIZE, Config.DB_POOL_PRE_PING))
+
+        memory = engine_options({**config, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.assertNotIn('pool_size', memory)
+
+        overridden = engine_options({**config, 'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 1}})
+        self.assertEqual(overridden['pool_size'], 1)
+
+    # =================================================================
+    # 7. RESPONSE CACHE TESTS
+    # =================================================================
+
+    def test_response_cache_hits_until_commit_invalidates(self):
+        """Verify /analytics is served from the cache until a subscription write invalidates it."""
+        self.client.post('/subscriptions', json={"name": "A", "price": 10, "frequency": "Monthly", "category": "Fun"})
+        self.assertEqual(self.client.get('/analytics').headers['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/analytics').headers['X-Cache'], 'HIT')
+
+        self.client.post('/subscriptions', json={"name": "B", "price": 5, "frequency": "Monthly", "category": "Fun"})
+        res = self.client.get('/analytics')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res.data)['financial_summary']['total_monthly_cost'], 15.0)
+
+        stats = json.loads(self.client.get('/cache/stats').data)
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertGreaterEqual(stats['invalidations'], 1)
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        """Verify the in-memory backend keeps at most max_entries and drops the least recently used one."""
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', (b'a', 200, 'application/json'), {'subscription'}, ttl=60)
+        backend.set('b', (b'b', 200, 'application/json'), {'budget'}, ttl=60)
+        backend.get('a')
+        self.assertEqual(backend.set('c', (b'c', 200, 'application/json'), {'budget'}, ttl=60), 1)
+        self.assertIsNone(backend.get('b')[0])
+        self.assertEqual(backend.invalidate(frozenset({'budget'})), 1)
+        self.assertEqual(backend.get('a')[0][0], b'a')
+
+    def test_sqlite_backend_shares_entries_and_invalidates_by_table(self):
+        """Verify two SQLite backends on one file see each other's entries and tag invalidation."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            writer, reader = SQLiteBackend(path, 10), SQLiteBackend(path, 10)
+            writer.set('k', (b'{}', 200, 'application/json'), {'subscription', 'category'}, ttl=60)
+            self.assertEqual(reader.get('k')[0], (b'{}', 200, 'application/json'))
+            self.assertEqual(reader.invalidate(frozenset({'category'})), 1)
+            self.assertIsNone(writer.get('k')[0])
+            writer.set('old', (b'x', 200, None), {'budget'}, ttl=-1)
+            self.assertEqual(reader.get('old'), (None, 1))
+
+    # =================================================================
+    # 8. TENANCY TESTS
+    # =================================================================
+
+    def test_users_only_see_their_own_data(self):
+        """Verify X-User-Id scopes listings, lookups, analytics and budgets to one user."""
+        alice, bob = {'X-User-Id': '1'}, {'X-User-Id': '2'}
+        payload = {"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"}
+        self.assertEqual(self.client.post('/subscriptions', json=payload, headers=alice).status_code, 201)
+        # same name and category for another user is not a duplicate
+        self.assertEqual(self.client.post('/subscriptions', json={**payload, "price": 30}, headers=bob).status_code, 201)
+        self.client.put('/budgets', json={"limit": 20}, headers=bob)
+
+        self.assertEqual(len(json.loads(self.client.get('/subscriptions', headers=alice).data)), 1)
+        self.assertEqual(len(json.loads(self.client.get('/categories', headers=bob).data)), 1)
+        self.assertEqual(self.client.get('/subscriptions/2', headers=alice).status_code, 404)
+        self.assertEqual(self.client.delete('/subscriptions/2', headers=alice).status_code, 404)
+
+        totals = json.loads(self.client.get('/analytics', headers=alice).data)['financial_summary']
+        self.assertEqual(totals['total_monthly_cost'], 10.0)
+        self.assertEqual(json.loads(self.client.get('/budgets', headers=alice).data)['message'], "Budget not set")
+        self.assertEqual(json.loads(self.client.get('/budgets', headers=bob).data)['status']['current_spend'], 30.0)
+
+        with self.app.app_context():
+            self.assertEqual(rollup.check(db.session.connection()), [])
+
+    def test_invalid_user_header_is_rejected(self):
+        """Verify a non-numeric X-User-Id is a 400, a missing one falls back to the default user and USER_ID_PROVIDER replaces it."""
+        res = self.client.get('/subscriptions', headers={'X-User-Id': 'abc'})
+        self.assertEqual(res.status_code, 400)
+        self.client.post('/categories', json={"name": "Music"})
+        self.assertEqual(len(json.loads(self.client.get('/categories', headers={'X-User-Id': '1'}).data)), 1)
+
+        # USER_ID_PROVIDER replaces the header: here a (stand-in) token, and X-User-Id is ignored
+        tokens = {'Token secret-2': 2}
+        self.app.config['USER_ID_PROVIDER'] = lambda headers: tokens.get(headers.get('Authorization'))
+        self.assertEqual(json.loads(self.client.get('/categories', headers={'X-User-Id': '1', 'Authorization': 'Token secret-2'}).data), [])
+        self.assertEqual(len(json.loads(self.client.get('/categories', headers={'X-User-Id': '2'}).data)), 1)
+        self.app.config['USER_ID_PROVIDER'] = 'app.tenancy:header_user_id'
+        self.assertEqual(self.client.get('/categories', headers={'X-User-Id': 'abc'}).status_code, 400)
+
+    # =================================================================
+    # 9. INSTRUMENTATION TESTS
+    # =================================================================
+
+    def test_instrumentation_reports_server_timing_and_metrics(self):
+        """Verify INSTRUMENTATION adds Server-Timing headers and per-route histograms on /metrics."""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertNotIn('Server-Timing', self.client.get('/categories').headers)
+
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'INSTRUMENTATION': True})
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        client.post('/subscriptions', json={"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"})
+        timing = client.get('/subscriptions/1').headers['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ statements", db-slowest;dur=[\d.]+, serialize;dur=[\d.]+')
+
+        res = client.get('/metrics')
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        body = res.get_data(as_text=True)
+        self.assertIn('subtrack_http_requests_total{method="POST",route="/subscriptions",status="201"} 1', body)
+        self.assertIn('subtrack_db_statements_per_request_count{method="GET",route="/subscriptions/<int:id>"} 1', body)
+        self.assertIn('subtrack_serialize_time_seconds_bucket{method="GET",route="/subscriptions/<int:id>",le="+Inf"} 1', body)
+        with app.app_context(), db.engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            self.assertEqual(conn.info['_query_started'], [])  # the failed statement's start is not left behind
+        with app.app_context():
+            db.engine.dispose()
+
+    def test_fast_serialization_is_byte_compatible(self):
+        """Verify the columnar/orjson paths return exactly the bytes of the stdlib JSON provider."""
+        payloads = [
+            {"name": "Café ☕", "price": 10, "frequency": "Monthly", "category": "TV"},
+            {"name": 'Quote " \\ tab\t del\x7f', "price": 0.00001, "frequency": "Weekly", "category": "Misc"},
+            {"name": "Big", "price": 99999999.99, "frequency": "Yearly", "category": "TV", "start_date": "2024-02-29"},
+            {"name": "Plain", "price": 2.675, "frequency": "Monthly", "category": "Music", "status": "Paused"},
+        ]
+        paths = ['/subscriptions', '/subscriptions?fields=status,name,monthly_cost', '/subscriptions/export',
+                 '/subscriptions/export?format=json', '/subscriptions/1', '/analytics?breakdown=true']
+
+        class PlainProvider(DefaultJSONProvider):
+            """Not recognised by app.serialization, so every route takes the dict + json.dumps path."""
+
+        bodies = {}
+        for fast in (True, False):
+            app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'FAST_JSON': fast})
+            if not fast:
+                app.json = PlainProvider(app)
+            with app.app_context():
+                db.create_all()
+            client = app.test_client()
+            for payload in payloads:
+                self.assertEqual(client.post('/subscriptions', json=payload).status_code, 201)
+            bodies[fast] = [client.get(path).data for path in paths]
+            with app.app_context():
+                db.engine.dispose()
+        self.assertEqual(bodies[True], bodies[False])
+
+    def test_fast_json_provider_keeps_non_finite_floats(self):
+        """Verify NaN and infinities (null for orjson) are encoded as the stdlib does."""
+        stdlib = DefaultJSONProvider(self.app)
+        with self.app.app_context():
+            for obj in ({"a": float('nan')}, [1.5, {"b": [float('inf')]}, None], {"c": None, "d": -float('inf')}, {"e": None}):
+                self.assertEqual(self.app.json.response(obj).data, stdlib.response(obj).data)
+
+    # =================================================================
+    # 10. ASGI TESTS
+    # =================================================================
+
+    @unittest.skipUnless(importlib.util.find_spec('aiosqlite'), "aiosqlite is not installed")
+    def test_asgi_app_matches_flask_responses(self):
+        """Verify the async views return the Flask bytes and ETags, and other requests reach Flask."""
+        from app.asgi import create_asgi_app
+
+        async def call(app, method, path, headers=(), body=b''):
+            path, _, query = path.partition('?')
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                     'headers': [(k.lower().encode(), v.encode()) for k, v in headers], 'root_path': ''}
+            messages, chunks = [], [body] if isinstance(body, bytes) else list(body)
+
+            async def receive():
+                if not chunks:
+                    return {'type': 'http.disconnect'}
+                return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': bool(chunks)}
+
+            async def send(message):
+                messages.append(message)
+            await app(scope, receive, send)
+            start = messages[0]
+            return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), \
+                b''.join(m.get('body', b'') for m in messages[1:])
+
+        async def scenario():
+            with tempfile.TemporaryDirectory() as tmp:
+                asgi = create_asgi_app({'TESTING': True, 'AUTO_CREATE_SCHEMA': True,
+                                        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'asgi.db')}"})
+                bridged, call_flask = [], asgi._call_flask
+
+                async def counting_call_flask(scope, receive, send, environ=None):
+                    bridged.append(scope['method'])
+                    await call_flask(scope, receive, send, environ)
+                asgi._call_flask = counting_call_flask
+                payload = json.dumps({"name": "Netflix", "price": 10, "frequency": "Monthly", "category": "TV"}).encode()
+                # a chunked body (no Content-Length) is streamed to Flask as it arrives
+                status, _, _ = await call(asgi, 'POST', '/subscriptions', [('Content-Type', 'application/json')],
+                                          [payload[:10], payload[10:20], payload[20:]])
+                self.assertEqual(status, 201)
+
+                client = asgi.flask_app.test_client()
+                for path in ('/subscriptions?limit=1', '/subscriptions/1', '/categories', '/budgets',
+                             '/analytics?breakdown=true'):
+                    status, headers, body = await call(asgi, 'GET', path)
+                    expected = client.get(path)
+                    self.assertEqual((status, body, headers['etag']), (200, expected.data, expected.headers['ETag']))
+                    status, _, _ = await call(asgi, 'GET', path, [('If-None-Match', headers['etag'])])
+                    self.assertEqual(status, 304)
+                self.assertEqual(headers.get('x-next-after'), None)
+                status, headers, _ = await call(asgi, 'GET', '/subscriptions?limit=1')
+                self.assertEqual(headers['link'], '</subscriptions?limit=1&after=1>; rel="next"')
+                self.assertEqual(bridged, ['POST'])
+
+                # errors and other users fall back to the Flask views
+                status, _, body = await call(asgi, 'GET', '/subscriptions/1', [('X-User-Id', '2')])
+                self.assertEqual((status, json.loads(body)['message']), (404, "Subscription 1 not found"))
+                status, _, _ = await call(asgi, 'GET', '/analytics?breakdown=true&limit=0')
+                self.assertEqual(status, 400)
+                self.assertEqual(bridged, ['POST', 'GET', 'GET'])
+
+                # /budgets serves the alerts worker's stored evaluation first, like the Flask view
+                with asgi.flask_app.app_context(), db.engine.begin() as conn:
+                    conn.execute(Budget.__table__.insert().values(user_id=3, monthly_limit_cents=5000, currency='USD'))
+                    conn.execute(BudgetStatus.__table__.insert().values(
+                        user_id=3, monthly_limit_cents=5000, currency='USD', current_spend_cents=1234,
+                        health_label='Good', evaluated_at=datetime(2026, 1, 1)))
+                status, _, body = await call(asgi, 'GET', '/budgets', [('X-User-Id', '3')])
+                self.assertEqual((status, body), (200, client.get('/budgets', headers={'X-User-Id': '3'}).data))
+                self.assertEqual(json.loads(body)['status']['current_spend'], 12.34)
+
+                # a request handed to Flask after its token was taken is not charged again
+                asgi.flask_app.extensions['rate_limiter'] = rate_limit.RateLimiter(RateLimitMemoryBackend(10), 0.001, 2)
+                statuses = [(await call(asgi, 'GET', '/analytics?breakdown=true&limit=0'))[0] for _ in range(3)]
+                self.assertEqual(statuses, [400, 400, 429])
+
+                # failures of the async views are logged and raised, not replayed
+                async def broken(*args):
+                    raise RuntimeError("bug")
+                asgi.routes = [(pattern, broken if endpoint == 'categories.get_categories' else handler, endpoint)
+                               for pattern, handler, endpoint in asgi.routes]
+                with self.assertLogs(asgi.flask_app.logger, 'ERROR'), self.assertRaises(RuntimeError):
+                    await call(asgi, 'GET', '/categories')
+
+                await asgi.engine.dispose()
+                with asgi.flask_app.app_context():
+                    db.engine.dispose()
+        asyncio.run(scenario())
+
+    # =================================================================
+    # 11. COALESCING & RATE LIMIT TESTS
+    # =================================================================
+
+    def test_single_flight_shares_one_computation_between_concurrent_callers(self):
+        """Verify concurrent callers of one key wait for the first caller's result instead of computing it again."""
+        flight, release, calls, results = SingleFlight(timeout=5), threading.Event(), [], []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'response', b'body'
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while 'k' not in flight._flights or flight._flights['k'].callers < 5:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((results.count(('response', None)), results.count((None, b'body'))), (1, 4))
+        self.assertEqual((flight.stats['coalesced'], flight._flights), (4, {}))
+
+        # nothing shareable (an error response): a later caller computes its own
+        self.assertEqual(flight.do('k', lambda: ('error', None)), ('error', None))
+
+        # the async views' coroutines coalesce the same way
+        async def scenario():
+            release, async_calls = asyncio.Event(), []
+
+            async def compute_async():
+                async_calls.append(1)
+                await release.wait()
+                return 'response', b'body'
+            tasks = [asyncio.create_task(flight.do_async('k', compute_async)) for _ in range(3)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*tasks), len(async_calls)
+        self.assertEqual(asyncio.run(scenario()), ([('response', None), (None, b'body'), (None, b'body')], 1))
+        self.assertEqual((flight.stats['coalesced'], flight._async_flights), (6, {}))
+
+    def test_rate_limit_answers_429_with_retry_after(self):
+        """Verify each client and endpoint gets RATE_LIMIT_BURST requests, then 429s until its bucket refills."""
+        self.app.config.update(RATE_LIMIT_PER_SECOND=0.5, RATE_LIMIT_BURST=2)
+        rate_limit.init_app(self.app)
+        self.assertEqual([self.client.get('/analytics').status_code for _ in range(2)], [200, 200])
+        res = self.client.get('/analytics', headers={'If-None-Match': '"anything"'})
+        self.assertEqual((res.status_code, res.headers['Retry-After']), (429, '2'))
+        self.assertEqual(json.loads(res.data)['error'], 'Too Many Requests')
+
+        # the client is its address: another X-User-Id does not get a fresh bucket, another address does
+        self.assertEqual(self.client.get('/analytics', headers={'X-User-Id': '2'}).status_code, 429)
+        self.assertEqual(self.client.get('/analytics', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code, 200)
+        self.app.config['RATE_LIMIT_KEY'] = 'user'  # X-User-Id set by a trusted proxy
+        self.assertEqual(self.client.get('/analytics', headers={'X-User-Id': '2'}).status_code, 200)
+        self.assertEqual(self.client.get('/analytics/forecast').status_code, 200)
+        self.assertEqual([self.client.get('/subscriptions').status_code for _ in range(3)], [200] * 3)
+
+    def test_rate_limit_backends_refill_and_share_buckets(self):
+        """Verify the memory backend's LRU bound only drops refilled buckets and that SQLite backends on one file share their buckets."""
+        memory = RateLimitMemoryBackend(max_buckets=1)
+        self.assertEqual(memory.take('a', 1, 1), 0)
+        self.assertGreater(memory.take('a', 1, 1), 0)
+        memory.take('b', 1, 1)  # 'a' is still refilling: kept, it does not come back full
+        self.assertGreater(memory.take('a', 1, 1), 0)
+        time.sleep(0.01)
+        memory.take('c', 1000, 1)  # refilled at 1 token per millisecond: the oldest are dropped
+        self.assertEqual(list(memory._buckets), ['c'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'limits.db')
+            first, second = RateLimitSQLiteBackend(path), RateLimitSQLiteBackend(path)
+            self.assertEqual((first.take('k', 1, 2), second.take('k', 1, 2)), (0, 0))
+            self.assertGreater(first.take('k', 1, 2), 0)
+            self.assertEqual(second.take('other', 1, 2), 0)
+            time.sleep(0.01)
+            self.assertEqual(first.take('k', 1000, 2), 0)  # refilled at 1 token per millisecond
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file